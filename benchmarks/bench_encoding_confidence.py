@@ -0,0 +1,94 @@
+"""
+Check that the encodings chosen by utils.encode_image (grayscale, JPEG and
+downscaled JPEG) don't lower the OCR quality of Textract. Each page is sent
+as the RGB PNG used before, and as each encoding encode_image can fall back
+to. The mean confidence of the LINE blocks and the share of the PNG lines
+read the same way are compared.
+
+This calls Amazon Textract (4 requests per page) with the TEXTRACT_AWS_*
+environment variables described in the README. Run from the repository
+root, with a folder of sample checks:
+
+    python benchmarks/bench_encoding_confidence.py path/to/checks
+"""
+
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import textract  # noqa: E402
+import utils  # noqa: E402
+
+RESOLUTION = 300
+
+
+def encodings(img):
+    """
+    :param img: The page rendered at RESOLUTION in RGB.
+    :return: Dict of {name: image_bytes}, the RGB PNG first.
+    """
+    gray = img.convert("L")
+    half = gray.resize((gray.width // 2, gray.height // 2), Image.LANCZOS)
+    return {
+        "rgb png": utils.img_to_bytes(img),
+        "gray png": utils.img_to_bytes(gray, format="PNG", compress_level=1),
+        "gray jpeg q70": utils.img_to_bytes(gray, format="JPEG", quality=70),
+        "gray jpeg 150dpi": utils.img_to_bytes(
+            half, format="JPEG", quality=80
+        ),
+    }
+
+
+def get_lines(res):
+    return [
+        (block["Text"], block["Confidence"])
+        for block in res["Blocks"]
+        if block["BlockType"] == "LINE"
+    ]
+
+
+def main(folder):
+    t = textract.setup_textract()
+    pages = utils.list_pdf_pages(
+        sorted(f for f in os.listdir(folder) if f.lower().endswith(".pdf")),
+        folder=folder,
+    )
+    totals = {}  # name -> (confidence sum, lines, same lines, png lines)
+    for pdf_filename, page in pages:
+        img = utils.pdf_to_img(pdf_filename, folder, RESOLUTION, page=page)
+        png_texts = None
+        for name, image_bytes in encodings(img).items():
+            lines = get_lines(t.detect_file_text(document_bytes=image_bytes))
+            texts = [text for text, _ in lines]
+            if png_texts is None:
+                png_texts = texts
+            same = sum(1 for text in png_texts if text in texts)
+            conf, count, same_total, png_total = totals.get(name, (0, 0, 0, 0))
+            totals[name] = (
+                conf + sum(c for _, c in lines),
+                count + len(lines),
+                same_total + same,
+                png_total + len(png_texts),
+            )
+            print(
+                f"{utils.get_page_name(pdf_filename, page)} {name}: "
+                f"{len(image_bytes) / 1000:.0f} kB, {len(lines)} lines"
+            )
+
+    print(f"{len(pages)} pages:")
+    for name, (conf, count, same, png_count) in totals.items():
+        print(
+            f"  {name}: mean line confidence "
+            f"{conf / count if count else 0:.2f}, "
+            f"{same / png_count * 100 if png_count else 0:.1f}% of the PNG "
+            "lines read the same"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    main(sys.argv[1])
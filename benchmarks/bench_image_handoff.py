@@ -0,0 +1,72 @@
+"""
+Compare the per-check cost of handing the rasterized check to Textract
+through a PNG file on disk against passing the encoded bytes in memory.
+
+Run from the repository root:
+
+    python benchmarks/bench_image_handoff.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import fitz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import handler  # noqa: E402
+import utils  # noqa: E402
+
+N = 10
+
+
+def create_sample_pdf(pdf_path):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=270)
+    page.insert_text((40, 60), "BANCO PICHINCHA", fontsize=18)
+    page.insert_text((40, 120), "PAGUESE A LA ORDEN DE JUAN PEREZ", fontsize=12)
+    page.insert_text((40, 180), "QUITO, 2024-02-20", fontsize=12)
+    doc.save(pdf_path)
+
+
+def disk_handoff(pdf_filename, folder, images_folder):
+    img = utils.pdf_to_img(pdf_filename, folder=folder)
+    img_filename = handler.save_image(img, utils.generate_id(), images_folder)
+    with open(img_filename, "rb") as file:
+        return file.read()
+
+
+def memory_handoff(pdf_filename, folder, image_writer):
+    img = utils.pdf_to_img(pdf_filename, folder=folder)
+    image_bytes = utils.img_to_bytes(img)
+    image_writer.write(image_bytes, utils.generate_id())
+    return image_bytes
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        create_sample_pdf(os.path.join(folder, "check.pdf"))
+        images_folder = os.path.join(folder, "images")
+
+        start = time.perf_counter()
+        for _ in range(N):
+            disk_handoff("check.pdf", folder, images_folder)
+        disk = (time.perf_counter() - start) / N
+
+        # only the time until the bytes are ready counts, the writer drains
+        # in the background while Textract works
+        image_writer = handler.ImageWriter(images_folder)
+        start = time.perf_counter()
+        for _ in range(N):
+            memory_handoff("check.pdf", folder, image_writer)
+        memory = (time.perf_counter() - start) / N
+        image_writer.close()
+
+    print(f"disk hand-off:   {disk * 1000:.1f} ms/check")
+    print(f"memory hand-off: {memory * 1000:.1f} ms/check")
+    print(f"saved:           {(disk - memory) * 1000:.1f} ms/check")
+
+
+if __name__ == "__main__":
+    main()
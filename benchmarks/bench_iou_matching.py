@@ -0,0 +1,69 @@
+"""
+Compare the per-box extract_detail loop with the batched extract_details on
+documents with many LINE blocks, using the BOXES of a bank.
+
+Run from the repository root:
+
+    python benchmarks/bench_iou_matching.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from constants import BOXES  # noqa: E402
+from textract import extract_detail, extract_details  # noqa: E402
+
+N_BLOCKS = (50, 200, 1000)
+N_RUNS = 50
+
+
+def create_blocks(n):
+    rng = np.random.default_rng(0)
+    return [
+        {
+            "Text": f"line {i}",
+            "Confidence": 99.0,
+            "Geometry": {
+                "BoundingBox": {
+                    "Width": w,
+                    "Height": h,
+                    "Left": l,
+                    "Top": t,
+                }
+            },
+        }
+        for i, (w, h, l, t) in enumerate(rng.random((n, 4)) / 2)
+    ]
+
+
+def main():
+    for n_blocks in N_BLOCKS:
+        blocks = create_blocks(n_blocks)
+        # all the banks have the same number of boxes
+        boxes = next(iter(BOXES.values()))
+        fields = {name: (box, 2) for name, box in boxes.items()}
+
+        start = time.perf_counter()
+        for _ in range(N_RUNS):
+            for name, (box, max_boxes) in fields.items():
+                extract_detail(box, blocks, max_boxes=max_boxes)
+        loop = (time.perf_counter() - start) / N_RUNS
+
+        start = time.perf_counter()
+        for _ in range(N_RUNS):
+            extract_details(fields, blocks)
+        batched = (time.perf_counter() - start) / N_RUNS
+
+        print(
+            f"{n_blocks:5} blocks: loop {loop * 1000:7.2f} ms, "
+            f"batched {batched * 1000:6.2f} ms ({loop / batched:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Measure the per-query overhead removed by building the RAG chains once and
+answering DATE without a vector store. The LLM and the embeddings are fakes,
+so only the LangChain and Chroma overhead is measured.
+
+Run from the repository root:
+
+    python benchmarks/bench_rag_chains.py
+"""
+
+import os
+import sys
+import time
+
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import Chroma
+from langchain_community.chat_models.fake import FakeListChatModel
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from llm import RAG  # noqa: E402
+
+N = 50
+
+
+def create_rag():
+    rag = RAG.__new__(RAG)
+    rag.llm = FakeListChatModel(responses=["2024-02-20"])
+    retriever = Chroma.from_documents(
+        documents=[Document(page_content="quito")],
+        embedding=FakeEmbeddings(size=8),
+        collection_name="territories",
+    ).as_retriever(search_kwargs={"k": 1})
+    rag.vector_db_territories_retriever = retriever
+    rag.vector_db_client_names_retriever = retriever
+    rag.vector_db_account_names_retriever = retriever
+    rag.prompts = {
+        "CITY": rag.generate_prompt([("human", "{text} {context}")]),
+        "DATE": rag.generate_prompt([("human", "{text}")]),
+        "CLIENT_NAME": rag.generate_prompt([("human", "{text} {context}")]),
+        "ACCOUNT_NAME": rag.generate_prompt([("human", "{text} {context}")]),
+    }
+    return rag
+
+
+def rebuilt_chain_query(rag, key, text):
+    # What every query used to do: build the retrievers, including a new
+    # in-memory vector store for DATE, and the whole chain
+    retrievers = {
+        "CITY": rag.vector_db_territories_retriever,
+        "DATE": Chroma.from_documents(
+            documents=[Document(page_content="")],
+            embedding=FakeEmbeddings(size=1),
+        ).as_retriever(search_kwargs={"k": 1}),
+        "CLIENT_NAME": rag.vector_db_client_names_retriever,
+        "ACCOUNT_NAME": rag.vector_db_account_names_retriever,
+    }
+    rag_chain = rag.setup_rag_chain(retrievers[key], rag.prompts[key], rag.llm)
+    return rag_chain.invoke(text)
+
+
+def prebuilt_chain_query(rag, key, text):
+    return rag.get_chain(key).invoke(text)
+
+
+def bench(query, rag, key):
+    start = time.perf_counter()
+    for _ in range(N):
+        query(rag, key, "quito, 2024/02/20")
+    return (time.perf_counter() - start) / N
+
+
+def main():
+    rag = create_rag()
+
+    start = time.perf_counter()
+    rag.chains = rag.setup_chains()
+    setup = time.perf_counter() - start
+    print(f"building all chains once: {setup * 1000:.2f} ms")
+
+    for key in ["DATE", "CITY"]:
+        before = bench(rebuilt_chain_query, rag, key)
+        after = bench(prebuilt_chain_query, rag, key)
+        print(
+            f"{key}: {before * 1000:.2f} ms/query -> {after * 1000:.2f} ms/query"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare the Chroma and NumPy vector backends on a list of fake client names:
+time to open the persisted store and latency of a top-5 retrieval. The
+embeddings are fakes (random 1536-dimension vectors, computed ahead of the
+queries), so only the vector store cost is measured.
+
+Run from the repository root:
+
+    python benchmarks/bench_vector_index.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import Chroma
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from llm import NumpyIndex  # noqa: E402
+
+N_NAMES = (500, 1000, 5000)
+N_QUERIES = 200
+K = 5
+
+
+class PrecomputedEmbeddings(Embeddings):
+    def __init__(self, size=1536, pool=64):
+        rng = np.random.default_rng(0)
+        self.size = size
+        self.pool = rng.normal(size=(pool, size)).tolist()
+
+    def embed_documents(self, texts):
+        rng = np.random.default_rng(1)
+        return rng.normal(size=(len(texts), self.size)).tolist()
+
+    def embed_query(self, text):
+        return self.pool[hash(text) % len(self.pool)]
+
+
+def measure(name, open_store):
+    start = time.perf_counter()
+    store = open_store()
+    retriever = store.as_retriever(search_kwargs={"k": K})
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(N_QUERIES):
+        retriever.invoke(f"CLIENT {i}")
+    latency = (time.perf_counter() - start) / N_QUERIES
+    print(
+        f"{name:>6}: startup {startup * 1000:8.1f} ms, "
+        f"query {latency * 1000:6.2f} ms"
+    )
+
+
+def main():
+    embeddings = PrecomputedEmbeddings()
+    for n_names in N_NAMES:
+        run(embeddings, n_names)
+
+
+def run(embeddings, n_names):
+    texts = [f"CLIENT NAME {i}" for i in range(n_names)]
+    with tempfile.TemporaryDirectory() as folder:
+        chroma_path = os.path.join(folder, "chroma")
+        numpy_path = os.path.join(folder, "numpy")
+        Chroma.from_texts(
+            texts, embedding=embeddings, persist_directory=chroma_path
+        ).persist()
+        NumpyIndex.from_texts(texts, embeddings).save(numpy_path)
+
+        print(f"{n_names} entries, {N_QUERIES} queries, k={K}")
+        measure(
+            "chroma",
+            lambda: Chroma(
+                persist_directory=chroma_path, embedding_function=embeddings
+            ),
+        )
+        measure("numpy", lambda: NumpyIndex.load(numpy_path, embeddings))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,17 @@
 LLM=""
 UPDATE=()
 MODEL_NAME=""
+OCR_WORKERS=""
+RASTER_WORKERS=""
+CACHE_FULL_RESPONSE=""
+CACHE_BUDGET_MB=""
+CACHE_MAX_AGE_DAYS=""
+LLM_CONCURRENCY=""
+VECTOR_BACKEND=""
+CHECKPOINT_ROWS=""
+WATCH=""
+FLUSH_INTERVAL=""
+WATCH_POLLING=""
 
 # Parse command line arguments
 while [[ $# -gt 0 ]]; do
@@ -24,6 +35,58 @@ while [[ $# -gt 0 ]]; do
         shift
         shift
         ;;
+        --ocr-workers)
+        OCR_WORKERS="--ocr-workers $2"
+        shift
+        shift
+        ;;
+        --raster-workers)
+        RASTER_WORKERS="--raster-workers $2"
+        shift
+        shift
+        ;;
+        --cache-full-response)
+        CACHE_FULL_RESPONSE="--cache-full-response"
+        shift
+        ;;
+        --cache-budget-mb)
+        CACHE_BUDGET_MB="--cache-budget-mb $2"
+        shift
+        shift
+        ;;
+        --cache-max-age-days)
+        CACHE_MAX_AGE_DAYS="--cache-max-age-days $2"
+        shift
+        shift
+        ;;
+        --llm-concurrency)
+        LLM_CONCURRENCY="--llm-concurrency $2"
+        shift
+        shift
+        ;;
+        --vector-backend)
+        VECTOR_BACKEND="--vector-backend $2"
+        shift
+        shift
+        ;;
+        --checkpoint-rows)
+        CHECKPOINT_ROWS="--checkpoint-rows $2"
+        shift
+        shift
+        ;;
+        --watch)
+        WATCH="--watch"
+        shift
+        ;;
+        --flush-interval)
+        FLUSH_INTERVAL="--flush-interval $2"
+        shift
+        shift
+        ;;
+        --watch-polling)
+        WATCH_POLLING="--watch-polling"
+        shift
+        ;;
         *)
         echo "Unknown option: $1"
         exit 1
@@ -50,8 +113,20 @@ sudo docker run \
     -e TEXTRACT_AWS_ACCESS_KEY_ID="$TEXTRACT_AWS_ACCESS_KEY_ID" \
     -e TEXTRACT_AWS_REGION="$TEXTRACT_AWS_REGION" \
     -e TEXTRACT_AWS_SECRET_ACCESS_KEY_ID="$TEXTRACT_AWS_SECRET_ACCESS_KEY_ID" \
+    -e TEXTRACT_TPS="$TEXTRACT_TPS" \
     -e OPENAI_API_KEY="$OPENAI_API_KEY" \
     checks-ocr \
     $LLM \
     $UPDATE_ARGS \
-    $MODEL_NAME
+    $MODEL_NAME \
+    $OCR_WORKERS \
+    $RASTER_WORKERS \
+    $CACHE_FULL_RESPONSE \
+    $CACHE_BUDGET_MB \
+    $CACHE_MAX_AGE_DAYS \
+    $LLM_CONCURRENCY \
+    $VECTOR_BACKEND \
+    $CHECKPOINT_ROWS \
+    $WATCH \
+    $FLUSH_INTERVAL \
+    $WATCH_POLLING
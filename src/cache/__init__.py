@@ -1,82 +1,593 @@
 import os
+import gzip
 import json
+import glob
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+import hashlib
 from utils import get_id
 
+# All the cache entries of a folder live in a single SQLite database
+DATABASE_FILE_NAME = "cache.db"
 
-def check_if_cached(filename, cache_folder):
+# Compact cache records keep only the LINE blocks fields used for extraction:
+# magic | zlib(n lines | n confidences | n * (W, H, L, T) | JSON list of texts)
+RECORD_MAGIC = b"CKR1"
+
+# Files written by older versions, imported into the database on first use
+LEGACY_INDEX_FILE_NAME = "index.jsonl"
+LEGACY_RECORD_EXTENSION = ".bin"
+LEGACY_FULL_RESPONSE_EXTENSION = ".full.json.gz"
+# Row of the legacy_files table set once the legacy files were imported on
+# the first open, so that the folder is not scanned again
+LEGACY_IMPORT_DONE = "*"
+
+# Open databases, one per cache folder
+CONNECTIONS = {}
+CONNECTIONS_LOCK = threading.Lock()
+
+
+class CacheDatabase:
+    """
+    SQLite store of a cache folder.
+    Entries are indexed by content key, IDs are mapped to keys in a second
+    table. The database uses WAL mode, so other processes can read it while
+    it is written, and every write is a transaction.
     """
-    Check if a file with the same name (without extension) exists in the cache folder.
-    If the cache folder doesn't exist, it will be created.
 
-    :param filename: The full filename including extension.
-    :param cache_folder: The name of the cache folder (default is '../../cache').
-    :return: True if a matching file is found, False otherwise.
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        self.lock = threading.Lock()
+        os.makedirs(cache_folder, exist_ok=True)
+        self.connection = sqlite3.connect(
+            os.path.join(cache_folder, DATABASE_FILE_NAME),
+            check_same_thread=False,
+            timeout=30,
+        )
+        self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    record BLOB NOT NULL,
+                    full BLOB,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at "
+                "ON entries (accessed_at)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ids "
+                "(id TEXT PRIMARY KEY, key TEXT NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS ids_key ON ids (key)"
+            )
+            # Legacy files imported on first use, which are kept on disk
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS legacy_files "
+                "(name TEXT PRIMARY KEY)"
+            )
+        self.total_size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def get_key(self, id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT key FROM ids WHERE id = ?", (id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_id(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id FROM ids WHERE key = ? ORDER BY rowid LIMIT 1",
+                (key,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_key(self, id, key):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO ids (id, key) VALUES (?, ?)", (id, key)
+            )
+            self.connection.execute(
+                "UPDATE ids SET key = ? WHERE id = ?", (key, id)
+            )
+
+    def is_legacy_file_imported(self, name):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM legacy_files WHERE name = ?", (name,)
+            ).fetchone()
+        return row is not None
+
+    def set_legacy_file_imported(self, name):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO legacy_files (name) VALUES (?)", (name,)
+            )
+
+    def contains(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, key, column="record"):
+        """
+        Get the record (or full response) of an entry and mark it as used.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                f"SELECT {column} FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+        return row[0] if row else None
+
+    def put(self, key, record, full=None):
+        size = len(record) + (len(full) if full else 0)
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, record, full, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, record, full, size, now, now),
+            )
+            self.total_size += size - (row[0] if row else 0)
+
+    def evict(self, max_bytes=None, max_age=None):
+        """
+        Remove the least recently used entries until the database fits in
+        max_bytes, and the entries not used in the last max_age seconds.
+
+        :return: The number of removed entries.
+        """
+        removed = []
+        with self.lock, self.connection:
+            if max_age is not None:
+                rows = self.connection.execute(
+                    "SELECT key, size FROM entries WHERE accessed_at < ?",
+                    (time.time() - max_age,),
+                ).fetchall()
+                removed.extend(rows)
+            if max_bytes is not None:
+                excess = self.total_size - sum(r[1] for r in removed)
+                excess -= max_bytes
+                if excess > 0:
+                    keys = set(r[0] for r in removed)
+                    for key, size in self.connection.execute(
+                        "SELECT key, size FROM entries ORDER BY accessed_at"
+                    ):
+                        if excess <= 0:
+                            break
+                        if key in keys:
+                            continue
+                        removed.append((key, size))
+                        excess -= size
+            for key, size in removed:
+                self.connection.execute(
+                    "DELETE FROM entries WHERE key = ?", (key,)
+                )
+                self.connection.execute(
+                    "DELETE FROM ids WHERE key = ?", (key,)
+                )
+                self.total_size -= size
+            if removed:
+                self.connection.execute("PRAGMA incremental_vacuum").fetchall()
+        return len(removed)
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(cache_folder):
+    """
+    Get the database of a cache folder, opening it on the first call.
+    Cache files written by older versions are imported the first time the
+    database is opened, and kept on disk: only migrate_cache removes them
+    (and can keep their full responses). The folder is not scanned for them
+    again afterwards.
+
+    :param cache_folder: The name of the cache folder.
+    :return: A CacheDatabase instance.
+    """
+    with CONNECTIONS_LOCK:
+        if cache_folder not in CONNECTIONS:
+            database = CacheDatabase(cache_folder)
+            CONNECTIONS[cache_folder] = database
+            if not database.is_legacy_file_imported(LEGACY_IMPORT_DONE):
+                if has_legacy_files(cache_folder):
+                    migrated, _ = import_legacy_files(database)
+                    if migrated:
+                        print(
+                            f"- Imported {migrated} legacy cache files of "
+                            f"'{cache_folder}'."
+                        )
+                database.set_legacy_file_imported(LEGACY_IMPORT_DONE)
+        return CONNECTIONS[cache_folder]
+
+
+def close_all():
+    """
+    Close the databases opened by connect.
+    """
+    with CONNECTIONS_LOCK:
+        for database in CONNECTIONS.values():
+            database.close()
+        CONNECTIONS.clear()
+
+
+def get_content_key(file_path, settings=None):
+    """
+    Compute the cache key of a document from its content.
+    The key is the SHA-256 hash of the file bytes and the settings used to
+    process it, so the same document gets the same key whatever its name is.
+
+    :param file_path: Path to the document (e.g. a PDF file).
+    :param settings: Dictionary with the processing settings (e.g. rasterization).
+    :return: The key as an hexadecimal string.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    sha256.update(json.dumps(settings or {}, sort_keys=True).encode())
+    return sha256.hexdigest()
+
+
+def get_page_key(key, page):
+    """
+    Compute the cache key of a page of a document. The first page uses the key
+    of the document, so caches of single page documents stay valid.
+
+    :param key: The content key of the document (see get_content_key).
+    :param page: The page, starting at 0.
+    :return: The key of the page.
+    """
+    return key if page == 0 else f"{key}:{page}"
+
+
+def encode_record(res):
+    """
+    Encode the LINE blocks of a Textract response as a compact cache record.
+
+    :param res: The Textract response.
+    :return: The record bytes.
+    """
+    lines = [b for b in res["Blocks"] if b.get("BlockType") == "LINE"]
+    confidences = [b.get("Confidence", 0.0) for b in lines]
+    boxes = []
+    for b in lines:
+        bounding_box = b.get("Geometry", {}).get("BoundingBox", {})
+        boxes.extend(
+            [
+                bounding_box.get("Width", 0.0),
+                bounding_box.get("Height", 0.0),
+                bounding_box.get("Left", 0.0),
+                bounding_box.get("Top", 0.0),
+            ]
+        )
+    texts = json.dumps([b.get("Text", "") for b in lines]).encode()
+    payload = (
+        struct.pack("<I", len(lines))
+        + struct.pack(f"<{len(confidences)}d", *confidences)
+        + struct.pack(f"<{len(boxes)}d", *boxes)
+        + texts
+    )
+    return RECORD_MAGIC + zlib.compress(payload)
+
+
+def decode_record(record):
+    """
+    Decode a compact cache record into a Textract-like response with LINE blocks.
+
+    :param record: The record bytes.
+    :return: A dictionary with the 'Blocks' list.
+    """
+    if record[: len(RECORD_MAGIC)] != RECORD_MAGIC:
+        raise ValueError("Not a cache record.")
+    payload = zlib.decompress(record[len(RECORD_MAGIC) :])
+    (n,) = struct.unpack_from("<I", payload, 0)
+    confidences = struct.unpack_from(f"<{n}d", payload, 4)
+    boxes = struct.unpack_from(f"<{4 * n}d", payload, 4 + 8 * n)
+    texts = json.loads(payload[4 + 40 * n :])
+    blocks = []
+    for i in range(n):
+        w, h, l, t = boxes[4 * i : 4 * i + 4]
+        blocks.append(
+            {
+                "BlockType": "LINE",
+                "Text": texts[i],
+                "Confidence": confidences[i],
+                "Geometry": {
+                    "BoundingBox": {
+                        "Width": w,
+                        "Height": h,
+                        "Left": l,
+                        "Top": t,
+                    }
+                },
+            }
+        )
+    return {"Blocks": blocks}
+
+
+def update_index(id, key, cache_folder):
+    """
+    Map an ID (filename without extension) to the content key of its document.
+
+    :param id: The ID of the document.
+    :param key: The content key of the document.
+    :param cache_folder: The name of the cache folder.
     """
     try:
-        # Extract the filename without the extension
+        connect(cache_folder).set_key(id, key)
+    except Exception as e:
+        print(f"Error: Unable to update cache index. {e}")
+
+
+def get_cached_id(key, cache_folder):
+    """
+    Get the ID of the first document cached with the given content key.
+
+    :param key: The content key of the document.
+    :param cache_folder: The name of the cache folder.
+    :return: The ID if the key is in the index, None otherwise.
+    """
+    return connect(cache_folder).get_id(key)
+
+
+def get_cache_key(filename, cache_folder, key=None):
+    """
+    Find the cache entry of a document.
+    The content key is tried first, then the key indexed for the filename and
+    finally an entry named after the filename (legacy caches).
+
+    :param filename: The full filename including extension, or None to only
+                     look up the content key (e.g. for a page of a file).
+    :param cache_folder: The name of the cache folder.
+    :param key: The content key of the document, if known.
+    :return: The key of the cache entry if it exists, None otherwise.
+    """
+    database = connect(cache_folder)
+    candidates = [key]
+    if filename is not None:
         id = get_id(filename)
+        candidates += [database.get_key(id), id]
+    for candidate in candidates:
+        if candidate is not None and database.contains(candidate):
+            return candidate
+    return None
+
 
-        # Check if the cache folder exists, create it if not
-        if not os.path.exists(cache_folder):
-            os.makedirs(cache_folder)
+def check_if_cached(filename, cache_folder, key=None):
+    """
+    Check if the Textract response of a file exists in the cache.
 
-        # Check if a matching file exists in the cache folder
-        cache_file_path = os.path.join(cache_folder, f"{id}.json")
-        return os.path.exists(cache_file_path)
+    :param filename: The full filename including extension.
+    :param cache_folder: The name of the cache folder (default is '../../cache').
+    :param key: The content key of the file (see get_content_key).
+    :return: True if a matching entry is found, False otherwise.
+    """
+    try:
+        return get_cache_key(filename, cache_folder, key) is not None
     except Exception as e:
         print(f"Error: Unable to check cache for file. {e}")
         return False
 
 
-def read_cache(filename, cache_folder):
+def read_cache(filename, cache_folder, key=None):
     """
-    Load JSON data from a cache file with the same name (without extension) as the provided filename.
+    Load the cached Textract response (LINE blocks only) of a file.
 
     :param filename: The full filename including extension.
     :param cache_folder: The name of the cache folder (default is 'cache').
-    :return: The loaded JSON data as a Python object if the file exists, None otherwise.
+    :param key: The content key of the file (see get_content_key).
+    :return: The cached response as a Python object if it exists, None otherwise.
     """
     try:
-        # Extract the filename without the extension
-        id = get_id(filename)
-
-        # Check if a matching JSON file exists in the cache folder
-        cache_file_path = os.path.join(cache_folder, f"{id}.json")
-
-        if os.path.exists(cache_file_path):
-            # Load JSON data from the file
-            with open(cache_file_path, "r") as json_file:
-                data = json.load(json_file)
-            return data
+        cache_key = get_cache_key(filename, cache_folder, key)
+        record = (
+            connect(cache_folder).get(cache_key)
+            if cache_key is not None
+            else None
+        )
+        if record is not None:
+            return decode_record(record)
         else:
-            print(f"Error: Cache file '{cache_file_path}' not found.")
+            print(f"Error: Cache entry for '{filename}' not found.")
             return None
     except Exception as e:
         print(f"Error: Unable to load data from cache. {e}")
         return None
 
 
-def write_to_cache(res, id, cache_folder):
+def read_full_response(name, cache_folder):
+    """
+    Load the full Textract response saved with a cache entry, if any.
+
+    :param name: The content key (or legacy ID) of the cache entry.
+    :param cache_folder: The name of the cache folder.
+    :return: The full response if it was saved, None otherwise.
+    """
+    full = connect(cache_folder).get(name, column="full")
+    if full is None:
+        return None
+    return json.loads(gzip.decompress(full))
+
+
+def write_to_cache(
+    res,
+    id,
+    cache_folder,
+    key=None,
+    keep_full=False,
+    max_bytes=None,
+    max_age=None,
+):
     """
-    Write JSON data to a cache file with the specified ID.
+    Write a Textract response to the cache as a compact record.
+    If a content key is given, the entry is stored under the key and the ID is
+    added to the index; otherwise it is stored under the ID. Least recently
+    used entries are evicted afterwards to respect the size budget.
 
-    :param res: The JSON data to write.
-    :param id: The ID for naming the cache file.
+    :param res: The Textract response to write.
+    :param id: The ID of the document.
     :param cache_folder: The name of the cache folder (default is 'cache').
+    :param key: The content key of the document (see get_content_key).
+    :param keep_full: Whether to save the full response too.
+    :param max_bytes: Size budget of the cache in bytes (default is no limit).
+    :param max_age: Maximum time in seconds an entry can stay unused.
     :return: True if the write is successful, False otherwise.
     """
     try:
-        # Create the cache folder if it doesn't exist
-        os.makedirs(cache_folder, exist_ok=True)
+        database = connect(cache_folder)
+        name = key if key is not None else id
+        full = (
+            gzip.compress(json.dumps(res, separators=(",", ":")).encode())
+            if keep_full
+            else None
+        )
+        database.put(name, encode_record(res), full)
 
-        # Create the cache file path
-        cache_file_path = os.path.join(cache_folder, f"{id}.json")
+        if key is not None:
+            update_index(id, key, cache_folder)
 
-        # Write JSON data to the cache file
-        with open(cache_file_path, "w") as json_file:
-            json.dump(res, json_file, indent=2)
+        if max_bytes is not None or max_age is not None:
+            database.evict(max_bytes=max_bytes, max_age=max_age)
 
         return True
     except Exception as e:
         print(f"Error: Unable to write data to cache. {e}")
         return False
+
+
+def has_legacy_files(cache_folder):
+    """
+    Check if a cache folder has files written by older versions.
+
+    :param cache_folder: The name of the cache folder.
+    :return: True if there are legacy files, False otherwise.
+    """
+    with os.scandir(cache_folder) as entries:
+        for entry in entries:
+            if entry.name.endswith((".json", LEGACY_RECORD_EXTENSION)):
+                return True
+            if entry.name == LEGACY_INDEX_FILE_NAME:
+                return True
+    return False
+
+
+def import_legacy_files(database, keep_full=False, remove=False):
+    """
+    Import the cache files written by older versions (JSON responses, compact
+    record files, full response sidecars and the ID index) into the database.
+    Files are never removed unless asked to: by default they're kept on disk
+    and each one is imported only once. migrate_cache removes them.
+
+    :param database: The CacheDatabase of the folder.
+    :param keep_full: Whether to keep the full responses of JSON files.
+    :param remove: Whether to remove each file once it is imported, in which
+                   case files already imported are imported again (e.g. to
+                   keep their full responses).
+    :return: Tuple (migrated, failed) with the number of files.
+    """
+    cache_folder = database.cache_folder
+    migrated, failed = 0, 0
+
+    index_file_path = os.path.join(cache_folder, LEGACY_INDEX_FILE_NAME)
+    if os.path.exists(index_file_path) and (
+        remove or not database.is_legacy_file_imported(LEGACY_INDEX_FILE_NAME)
+    ):
+        with open(index_file_path, "r") as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partially written line
+                database.set_key(entry["id"], entry["key"])
+        if remove:
+            os.remove(index_file_path)
+        else:
+            database.set_legacy_file_imported(LEGACY_INDEX_FILE_NAME)
+
+    file_paths = sorted(
+        glob.glob(os.path.join(cache_folder, "*.json"))
+        + glob.glob(os.path.join(cache_folder, f"*{LEGACY_RECORD_EXTENSION}"))
+    )
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path)
+        if not remove and database.is_legacy_file_imported(file_name):
+            continue
+        name, extension = os.path.splitext(file_name)
+        full_file_path = os.path.join(
+            cache_folder, f"{name}{LEGACY_FULL_RESPONSE_EXTENSION}"
+        )
+        try:
+            full = None
+            if extension == ".json":
+                with open(file_path, "r") as json_file:
+                    res = json.load(json_file)
+                record = encode_record(res)
+                if keep_full:
+                    full = gzip.compress(
+                        json.dumps(res, separators=(",", ":")).encode()
+                    )
+            else:
+                with open(file_path, "rb") as record_file:
+                    record = record_file.read()
+                decode_record(record)  # validate
+                if os.path.exists(full_file_path):
+                    with open(full_file_path, "rb") as full_file:
+                        full = full_file.read()
+            database.put(name, record, full)
+            if remove:
+                os.remove(file_path)
+                if os.path.exists(full_file_path):
+                    os.remove(full_file_path)
+            else:
+                database.set_legacy_file_imported(file_name)
+            migrated += 1
+        except Exception as e:
+            print(f"Error: Unable to migrate '{file_path}'. {e}")
+            failed += 1
+    return migrated, failed
+
+
+def migrate_cache(cache_folder, keep_full=False):
+    """
+    Import the cache files written by older versions of a folder into its
+    database, and remove them.
+
+    :param cache_folder: The name of the cache folder.
+    :param keep_full: Whether to keep the full responses of JSON files.
+    :return: Tuple (migrated, failed) with the number of files.
+    """
+    with CONNECTIONS_LOCK:
+        database = CONNECTIONS.get(cache_folder)
+        if database is None:
+            database = CacheDatabase(cache_folder)
+            CONNECTIONS[cache_folder] = database
+    return import_legacy_files(database, keep_full=keep_full, remove=True)
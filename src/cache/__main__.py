@@ -0,0 +1,31 @@
+import argparse
+
+from cache import migrate_cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Import the Textract cache files of older versions into the "
+            "cache database, and remove them"
+        )
+    )
+    parser.add_argument(
+        "--cache-folder",
+        type=str,
+        default="../cache",
+        help="Specify the cache folder",
+    )
+    parser.add_argument(
+        "--keep-full",
+        action="store_true",
+        help=(
+            "Keep the full Textract responses of the JSON files in the cache "
+            "database"
+        ),
+    )
+    args = parser.parse_args()
+
+    migrated, failed = migrate_cache(
+        args.cache_folder, keep_full=args.keep_full
+    )
+    print(f"- {migrated} cache files imported, {failed} failed.")
@@ -66,6 +66,40 @@ COLUMNS_MAP = {
     "AMOUNT": "VALOR",
 }
 
+# How the text of each box is extracted:
+# - parser: name of the parser of the text (see extractor.PARSERS)
+# - columns: columns filled by the parser (default: the COLUMNS_MAP column)
+# - max_boxes: number of text lines of the box (default: 1)
+# - llm: {column: LLM query key} of the values corrected by the LLM
+# - llm_raw_text: columns corrected from the raw text instead of the value
+# - rule: confidence rule of the values (see extractor.RULES)
+FIELDS = {
+    "ACCOUNT_NAME": {
+        "parser": "name",
+        "max_boxes": 2,
+        "llm": {"NOMBRE-CUENTA": "ACCOUNT_NAME"},
+    },
+    "ACCOUNT_NUMBER": {"parser": "number"},
+    "AMOUNT": {"parser": "amount", "rule": "amount"},
+    "CHECK_NUMBER": {"parser": "number", "rule": "check_numbers"},
+    "CLIENT_NAME": {
+        "parser": "name",
+        "llm": {"BENEFICIARIO": "CLIENT_NAME"},
+    },
+    "PLACE_AND_DATE": {
+        "parser": "place_and_date",
+        "columns": ["FECHA", "CIUDAD"],
+        "llm": {"FECHA": "DATE", "CIUDAD": "CITY"},
+        "llm_raw_text": ["FECHA"],
+    },
+}
+
+# FIELDS specs that are different for a bank
+BANK_FIELDS = {
+    "austro": {"ACCOUNT_NAME": {"max_boxes": 1}},
+    "guayaquil": {"ACCOUNT_NAME": {"max_boxes": 1}},
+}
+
 BANK_NAMES = {
     "produbanco": "PRODUBANCO",
     "austro": "BANCO DEL AUSTRO",
@@ -96,3 +130,11 @@ COLUMNS = [
     "VALOR",
     "ID",
 ]
+
+# Rasterization of the checks sent to Textract
+# max_bytes is the target size of each image (Textract accepts up to 10 MB)
+RASTER_SETTINGS = {
+    "resolution": 300,
+    "max_bytes": 1000000,
+    "grayscale": True,
+}
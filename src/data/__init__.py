@@ -1,21 +1,162 @@
 import os
+import re
+import pickle
+import hashlib
+from unidecode import unidecode
+from names import NameMatcher
 
+# Marks the end of a place in the tokens trie
+END = ""
 
-def load_territories(file_path="data/data/territories.txt"):
-    words_list = []
-    with open(file_path, "r") as file:
-        for line in file:
-            word = line.strip()
-            words_list.append(word)
-    return words_list
+# Words that are never a place on their own. Older territories files had one
+# word per line, so these words show up alone there.
+PLACE_NAME_PARTICLES = frozenset(
+    ["de", "del", "el", "la", "las", "los", "san", "santa", "santo"]
+)
+
+
+def normalize_place(text):
+    """
+    Normalize a place name: accents removed, case-folded and single spaces
+    between words.
+
+    :param text: The place name.
+    :return: The normalized place name.
+    """
+    text = re.sub(r"[^a-z0-9]+", " ", unidecode(text or "").casefold())
+    return text.strip()
+
+
+class TerritoryIndex:
+    """
+    Index of the known places (cantons, provinces and cities). A place is
+    matched as a whole, so words of different places don't make a place.
+    """
+
+    def __init__(self, places):
+        """
+        :param places: Iterable of place names, of one or more words.
+        """
+        self.places = frozenset(filter(None, map(normalize_place, places)))
+        self.trie = {}
+        for place in self.places:
+            node = self.trie
+            for token in place.split():
+                node = node.setdefault(token, {})
+            node[END] = place
+
+    def __contains__(self, text):
+        return normalize_place(text) in self.places
+
+    def __len__(self):
+        return len(self.places)
+
+    def extract(self, text):
+        """
+        Find the place with the most words in a text (the first one if several
+        places have as many words).
+
+        :param text: The input text, e.g. the PLACE_AND_DATE details.
+        :return: The normalized place, or None if the text has no place.
+        """
+        tokens = normalize_place(text).split()
+        best, best_length = None, 0
+        for start in range(len(tokens)):
+            node = self.trie
+            for length, token in enumerate(tokens[start:], start=1):
+                node = node.get(token)
+                if node is None:
+                    break
+                if END in node and length > best_length:
+                    best, best_length = node[END], length
+        return best
+
+
+def has_split_places(index):
+    """
+    Detect a territories file of older versions, with one word per line
+    instead of one place per line: its multi-word places can't be matched.
+
+    :param index: The TerritoryIndex.
+    :return: True if some lines are parts of a place name.
+    """
+    return not index.places.isdisjoint(PLACE_NAME_PARTICLES)
+
+
+def hash_territories(file_path):
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def load_territories(
+    file_path="data/data/territories.txt",
+    index_path="data/data/territories.pickle",
+):
+    """
+    Load the territories index, from the prebuilt index file if it was built
+    from the current territories file, otherwise building and saving it.
+
+    :param file_path: The territories file, one place per line.
+    :param index_path: The prebuilt index file.
+    :return: A TerritoryIndex.
+    """
+    file_hash = hash_territories(file_path)
+    index = None
+    try:
+        with open(index_path, "rb") as file:
+            prebuilt = pickle.load(file)
+        if prebuilt["file_hash"] == file_hash:
+            index = prebuilt["index"]
+    except Exception:
+        # Missing, stale or incompatible index: it's rebuilt
+        index = None
+
+    if not isinstance(index, TerritoryIndex):
+        with open(file_path, "r") as file:
+            index = TerritoryIndex(file.read().splitlines())
+        try:
+            with open(f"{index_path}.tmp", "wb") as file:
+                pickle.dump({"file_hash": file_hash, "index": index}, file)
+            os.replace(f"{index_path}.tmp", index_path)
+        except OSError as e:
+            print(f"Error: Territories index could not be saved: {e}")
+
+    if has_split_places(index):
+        print(
+            f"Warning: '{file_path}' seems to have one word per line. Write "
+            "each place on its own line (e.g. 'santo domingo'), otherwise "
+            "places of several words are not recognized."
+        )
+    return index
+
+
+# Lists of known names of the LLM keys, used to correct names locally
+NAME_LISTS = {
+    "CLIENT_NAME": "data/data/client_names.txt",
+    "ACCOUNT_NAME": "data/data/account_names.txt",
+}
+
+
+def load_name_matchers(name_lists=NAME_LISTS):
+    """
+    Load the lists of known names, to correct names without the LLM.
+
+    :param name_lists: Dict of {LLM key: path of the names file}.
+    :return: Dict of {LLM key: NameMatcher}.
+    """
+    return {
+        key: NameMatcher.from_file(file_path)
+        for key, file_path in name_lists.items()
+    }
 
 
 def is_in_territories(city, TERRITORIES):
-    words = city.split()
-    words = [w.lower() for w in words]
-    if all([w in TERRITORIES for w in words]):
-        return True
-    return False
+    """
+    :param city: The city text.
+    :param TERRITORIES: The TerritoryIndex.
+    :return: True if the whole text is a known place.
+    """
+    return city in TERRITORIES
 
 
 def setup_data():
@@ -1,7 +1,24 @@
 import re
+from collections import deque
+from functools import lru_cache
 from unidecode import unidecode
 from dateutil import parser
 from textract import in_top_left_corner
+from names import edit_distance
+from typing import Callable, NamedTuple
+
+# Patterns compiled once, used by every check
+NUMBERS_PATTERN = re.compile(r"\b\d+\b")
+# Floating point numbers with both comma and dot as decimal separators
+FLOAT_NUMBERS_PATTERN = re.compile(r"[-+]?\d*[.,]?\d+|\d+")
+SPECIAL_CHARACTERS_PATTERN = re.compile(r"[^A-Z0-9\s]")
+# Dates in various formats
+DATE_PATTERN = re.compile(r"\b\d{4}[-/]\d{2}[-/]\d{2}\b")
+
+# Characters that OCR commonly confuses, folded to a single character
+OCR_CONFUSIONS = str.maketrans(
+    {"l": "i", "1": "i", "|": "i", "!": "i", "0": "o"}
+)
 
 
 def extract_numbers(text):
@@ -11,11 +28,8 @@ def extract_numbers(text):
     :param text: The details containing account numbers.
     :return: List of extracted numbers.
     """
-    # Define the regex pattern to match numbers
-    pattern = re.compile(r"\b\d+\b")
-
     # Find all matches in the text
-    matches = pattern.findall(text)
+    matches = NUMBERS_PATTERN.findall(text)
 
     # Concatenate the matches into a single string
     result = "".join(matches)
@@ -30,11 +44,8 @@ def extract_float_numbers(text):
     :param text: The text containing numbers.
     :return: List of extracted float numbers.
     """
-    # Define the regex pattern to match floating point numbers with both comma and dot as decimal separators
-    pattern = re.compile(r"[-+]?\d*[.,]?\d+|\d+")
-
     # Find all matches in the text
-    matches = pattern.findall(text)
+    matches = FLOAT_NUMBERS_PATTERN.findall(text)
 
     # Convert the matches to float numbers
     result = [float(match.replace(",", ".")) for match in matches]
@@ -58,7 +69,9 @@ def clean_and_uppercase(text):
     text_uppercase = text.upper()
 
     # Remove special characters
-    cleaned_text = re.sub(r"[^A-Z0-9\s]", "", unidecode(text_uppercase))
+    cleaned_text = SPECIAL_CHARACTERS_PATTERN.sub(
+        "", unidecode(text_uppercase)
+    )
 
     return cleaned_text
 
@@ -70,11 +83,8 @@ def get_city_and_date(text):
     :param text: The input text containing date and details.
     :return: Tuple of (formatted_date, cleaned_details).
     """
-    # Define a regex pattern to match dates in various formats
-    date_pattern = re.compile(r"\b\d{4}[-/]\d{2}[-/]\d{2}\b")
-
     # Find the first match of the date pattern
-    date_match = date_pattern.search(text)
+    date_match = DATE_PATTERN.search(text)
 
     if date_match:
         # Extract the matched date
@@ -86,7 +96,7 @@ def get_city_and_date(text):
         parsed_date = None
 
     # Remove the date part from the text
-    cleaned_text = re.sub(date_pattern, "", text).strip()
+    cleaned_text = DATE_PATTERN.sub("", text).strip()
 
     # Clean and uppercase the remaining details
     city = clean_and_uppercase(cleaned_text)
@@ -94,11 +104,264 @@ def get_city_and_date(text):
     return parsed_date, city
 
 
+def fold_ocr_text(text):
+    """
+    Lowercase a text without accents, folding the characters that OCR
+    commonly confuses (e.g. "pichlncha" and "pichincha" fold alike).
+
+    :param text: The input text.
+    :return: The folded text.
+    """
+    return unidecode(text).lower().translate(OCR_CONFUSIONS).replace("rn", "m")
+
+
+class BankMatcher:
+    """
+    Aho-Corasick automaton finding all the bank codes in a text in a single
+    pass, whatever the number of banks.
+    """
+
+    def __init__(self, bank_codes):
+        """
+        :param bank_codes: List of bank codes, by priority.
+        """
+        self.bank_codes = list(bank_codes)
+        self.patterns = [fold_ocr_text(code) for code in self.bank_codes]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """
+        :param text: The input text.
+        :return: The bank code found in the text with the highest priority, or
+                 None.
+        """
+        state = 0
+        found = set()
+        for char in fold_ocr_text(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found |= self.output[state]
+        return self.bank_codes[min(found)] if found else None
+
+    def find_fuzzy(self, text, max_distance=1):
+        """
+        Find a word of the text that is at most max_distance edits away from
+        a bank code, for OCR mistakes that folding doesn't cover.
+
+        :param text: The input text.
+        :param max_distance: Maximum number of edits.
+        :return: The bank code with the highest priority, or None.
+        """
+        words = fold_ocr_text(text).split()
+        for index, pattern in enumerate(self.patterns):
+            if len(pattern) <= 4 * max_distance:
+                continue  # too short to tell a bank from a typo
+            for word in words:
+                if edit_distance(word, pattern, max_distance) <= max_distance:
+                    return self.bank_codes[index]
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_bank_matcher(bank_codes):
+    return BankMatcher(bank_codes)
+
+
 def get_bank_code(BANK_CODES, blocks):
-    for block in blocks:
-        for bank_code in BANK_CODES:
-            if bank_code in block["Text"].lower() and in_top_left_corner(
-                block
-            ):
-                return bank_code
+    """
+    Find the bank of a check: the first block in the top left corner that
+    contains a bank code (the first code of BANK_CODES if it contains several).
+    Blocks are matched exactly first (after folding OCR confusions), then
+    allowing one edit.
+
+    :param BANK_CODES: List of bank codes, by priority.
+    :param blocks: List of LINE blocks.
+    :return: The bank code, or None.
+    """
+    matcher = get_bank_matcher(tuple(BANK_CODES))
+    texts = [block["Text"] for block in blocks if in_top_left_corner(block)]
+    for text in texts:
+        bank_code = matcher.find(text)
+        if bank_code is not None:
+            return bank_code
+    for text in texts:
+        bank_code = matcher.find_fuzzy(text)
+        if bank_code is not None:
+            return bank_code
     return None
+
+
+def parse_number(text, context):
+    return str(extract_numbers(text))
+
+
+def parse_amount(text, context):
+    return extract_float_numbers(text)
+
+
+def parse_name(text, context):
+    return clean_and_uppercase(text)
+
+
+def parse_place_and_date(text, context):
+    date, city = get_city_and_date(text)
+    place = context["territories"].extract(city)
+    if place:
+        city = place.upper()
+    return date, city
+
+
+# Parsers of the box texts: (text, context) -> value, or a tuple of values
+# when the box fills several columns
+PARSERS = {
+    "number": parse_number,
+    "amount": parse_amount,
+    "name": parse_name,
+    "place_and_date": parse_place_and_date,
+}
+
+
+def check_numbers_rule(row, confidence_row):
+    # A check number as long as the account number is probably the account
+    # number, and a short account number is probably incomplete
+    if len(row["CHEQUE"]) == len(row["NUMERO-CUENTA"]):
+        confidence_row["CHEQUE"] = -1
+        if len(row["NUMERO-CUENTA"]) in range(1, 10):
+            confidence_row["NUMERO-CUENTA"] = -1
+
+
+def amount_rule(row, confidence_row):
+    if row["VALOR"] == 0:
+        confidence_row["VALOR"] = -1
+
+
+# Confidence rules of the extracted values, applied once all the boxes of a
+# check are extracted (rules on texts corrected by the LLM are applied later)
+RULES = {
+    "check_numbers": check_numbers_rule,
+    "amount": amount_rule,
+}
+
+
+class FieldPlan(NamedTuple):
+    box_name: str
+    columns: tuple
+    parse: Callable
+    llm: tuple  # (column, LLM key, True if corrected from the raw text)
+
+
+class BankPlan(NamedTuple):
+    bank_name: str
+    boxes: dict  # {box_name: (box, max_boxes)}, as taken by extract_details
+    fields: tuple
+    rules: tuple
+
+
+def compile_plans(boxes, fields, bank_fields, columns_map, bank_names):
+    """
+    Compile the extraction plan of every bank from the declarative field
+    specs, so that adding a bank only needs its BOXES.
+
+    :param boxes: Dict of {bank_code: {box_name: (W, H, L, T)}}.
+    :param fields: Dict of {box_name: field spec}.
+    :param bank_fields: Dict of {bank_code: {box_name: spec overrides}}.
+    :param columns_map: Dict of {box_name: column}.
+    :param bank_names: Dict of {bank_code: bank name}.
+    :return: Dict of {bank_code: BankPlan}.
+    """
+    plans = {}
+    for bank_code, bank_boxes in boxes.items():
+        detail_boxes = {}
+        field_plans = []
+        rules = []
+        for box_name, box in bank_boxes.items():
+            spec = {
+                **fields[box_name],
+                **bank_fields.get(bank_code, {}).get(box_name, {}),
+            }
+            if spec["parser"] not in PARSERS:
+                raise ValueError(f"Unknown parser: {spec['parser']}")
+            columns = tuple(spec.get("columns", [columns_map.get(box_name)]))
+            detail_boxes[box_name] = (box, spec.get("max_boxes", 1))
+            field_plans.append(
+                FieldPlan(
+                    box_name=box_name,
+                    columns=columns,
+                    parse=PARSERS[spec["parser"]],
+                    llm=tuple(
+                        (column, key, column in spec.get("llm_raw_text", []))
+                        for column, key in spec.get("llm", {}).items()
+                    ),
+                )
+            )
+            if "rule" in spec:
+                if spec["rule"] not in RULES:
+                    raise ValueError(f"Unknown rule: {spec['rule']}")
+                rules.append(RULES[spec["rule"]])
+        plans[bank_code] = BankPlan(
+            bank_name=bank_names[bank_code],
+            boxes=detail_boxes,
+            fields=tuple(field_plans),
+            rules=tuple(rules),
+        )
+    return plans
+
+
+def run_plan(plan, details, row, confidence_row, context):
+    """
+    Fill the row and the confidence row of a check from its box details.
+
+    :param plan: The BankPlan of the check bank.
+    :param details: Dict of {box_name: (text, confidence, iou)}.
+    :param row: The row to fill.
+    :param confidence_row: The confidence row to fill.
+    :param context: Dict of data used by the parsers (territories) and of
+                    the NameMatcher of each LLM key with known names (names).
+    :return: List of (column, LLM key, text) to correct with the LLM. Names
+             that match a known name are corrected here instead.
+    """
+    name_matchers = context.get("names", {})
+    llm_requests = []
+    for field in plan.fields:
+        text, conf, _ = details[field.box_name]
+        values = field.parse(text, context)
+        if len(field.columns) == 1:
+            values = (values,)
+        for column, value in zip(field.columns, values):
+            row[column] = value
+            confidence_row[column] = conf
+        for column, key, raw_text in field.llm:
+            llm_text = text if raw_text else row[column]
+            if key in name_matchers:
+                name, _ = name_matchers[key].match(llm_text)
+                if name is not None:
+                    row[column] = name
+                    continue
+            llm_requests.append((column, key, llm_text))
+    for rule in plan.rules:
+        rule(row, confidence_row)
+    return llm_requests
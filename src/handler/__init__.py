@@ -1,6 +1,10 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill
 
 from constants import CONFIDENCE_COLUMNS
@@ -31,6 +35,63 @@ def save_image(img, id, images_folder):
         return None
 
 
+def save_image_bytes(image_bytes, id, images_folder, extension=".png"):
+    """
+    Save already encoded image bytes in the 'images' folder.
+
+    :param image_bytes: The encoded image.
+    :param id: The ID used to name the image file.
+    :param images_folder: The name of the folder to save images (default is 'images').
+    :param extension: The extension of the image file (default is '.png').
+    :return: The filename (including path) of the saved file.
+    """
+    try:
+        os.makedirs(images_folder, exist_ok=True)
+        filename = os.path.join(images_folder, id + extension)
+        with open(filename, "wb") as file:
+            file.write(image_bytes)
+        return filename
+    except Exception as e:
+        print(f"Error saving image: {e}")
+        return None
+
+
+class ImageWriter:
+    """
+    Saves check images in a background thread, so archiving them doesn't
+    block the OCR requests.
+    """
+
+    def __init__(self, images_folder):
+        self.images_folder = images_folder
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+
+    def write(self, image_bytes, id, extension=".png"):
+        future = self.executor.submit(
+            save_image_bytes, image_bytes, id, self.images_folder, extension
+        )
+        self.futures.append(future)
+        return future
+
+    def close(self):
+        """
+        Wait for the pending writes and stop the background thread.
+
+        :return: The filenames of the saved images.
+        """
+        self.executor.shutdown(wait=True)
+        filenames = [future.result() for future in self.futures]
+        self.futures = []
+        return filenames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def load_data(file_path="../../data.xlsx", sheet_name=0, columns=None):
     """
     Read an Excel file and load it into a pandas DataFrame.
@@ -55,6 +116,33 @@ def load_data(file_path="../../data.xlsx", sheet_name=0, columns=None):
         return None
 
 
+class RowAccumulator:
+    """
+    Rows collected column by column, turned into a DataFrame once they're all
+    collected, so that adding a row doesn't copy the rows already collected.
+    """
+
+    def __init__(self, columns):
+        """
+        :param columns: The DataFrame columns.
+        """
+        self.columns = list(columns)
+        self.values = {column: [] for column in self.columns}
+
+    def __len__(self):
+        return len(self.values[self.columns[0]]) if self.columns else 0
+
+    def append(self, row):
+        """
+        :param row: Dict of {column: value}, missing columns are left empty.
+        """
+        for column in self.columns:
+            self.values[column].append(row.get(column))
+
+    def to_frame(self):
+        return pd.DataFrame(self.values, columns=self.columns)
+
+
 def get_unprocessed_filenames(folder_path):
     """
     Get the names of all PDF files in a specified folder.
@@ -141,65 +229,94 @@ def write_confidence(df, filename, sheet_name="data"):
         return False
 
 
-def write_data(df, confidence_df, data_path, images_path):
-    # Create a new Excel workbook and add the DataFrame to it
-    with pd.ExcelWriter(data_path, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="data", index=False)
+def get_image_extensions(images_folder):
+    """
+    Map the ID of each saved check image to its file extension.
 
-        # Access the worksheet
-        wb = writer.book
-        ws = wb["data"]
+    :param images_folder: The folder where the check images are saved.
+    :return: A dictionary mapping IDs to extensions (e.g. '.png' or '.jpg').
+    """
+    try:
+        return {
+            os.path.splitext(file_name)[0]: os.path.splitext(file_name)[1]
+            for file_name in os.listdir(images_folder)
+        }
+    except FileNotFoundError:
+        return {}
 
-        # Define fill styles for conditional formatting
-        colors = ["b0ffb1", "ddffb0", "fffab0", "f0bca8", "ffffff", "e9d7fc"]
-        fill_0 = PatternFill(
-            start_color=colors[0], end_color=colors[0], fill_type="solid"
-        )
-        fill_1 = PatternFill(
-            start_color=colors[1], end_color=colors[1], fill_type="solid"
-        )
-        fill_2 = PatternFill(
-            start_color=colors[2], end_color=colors[2], fill_type="solid"
-        )
-        fill_3 = PatternFill(
-            start_color=colors[3], end_color=colors[3], fill_type="solid"
-        )
-        fill_4 = PatternFill(
-            start_color=colors[4], end_color=colors[4], fill_type="solid"
-        )
-        fill_5 = PatternFill(
-            start_color=colors[5], end_color=colors[5], fill_type="solid"
-        )
 
-        # Apply conditional formatting based on confidence_df values
-        for col in CONFIDENCE_COLUMNS:
-            col_index = df.columns.get_loc(
-                col
-            )  # Get column index (starting from 1)
-            for i, cell in enumerate(
-                ws["{}:{}".format(chr(65 + col_index), chr(65 + col_index))]
-            ):
-                if i == 0:  # Skip the header row
-                    continue
-                confidence_value = confidence_df.iloc[i - 1][col]
-                if confidence_value > 98:
-                    cell.fill = fill_0
-                elif confidence_value > 95:
-                    cell.fill = fill_1
-                elif confidence_value > 90:
-                    cell.fill = fill_2
-                elif confidence_value > 0:
-                    cell.fill = fill_3
-                elif confidence_value == 0:  # not used
-                    cell.fill = fill_4
-                else:
-                    cell.fill = fill_5
-
-        # Add hyperlinks to the 'ID' column
-        id_col_index = df.columns.get_loc("ID") + 1
-        for row in ws.iter_rows(
-            min_col=id_col_index, max_col=id_col_index, min_row=2
-        ):
-            cell = row[0]
-            image_path = f"{images_path}/{cell.value}.png"
-            cell.hyperlink = image_path
+# Fill colors of the confidence bands, in the order of CONFIDENCE_BANDS
+CONFIDENCE_COLORS = ["b0ffb1", "ddffb0", "fffab0", "f0bca8", "ffffff"]
+# Violet: inconsistent content (negative or missing confidence)
+INCONSISTENT_COLOR = "e9d7fc"
+
+
+def get_confidence_colors(confidences):
+    """
+    Get the fill color of each confidence value, all at once.
+
+    :param confidences: Series of confidence values.
+    :return: Array of colors.
+    """
+    confidences = pd.to_numeric(confidences, errors="coerce").to_numpy(
+        dtype=float
+    )
+    bands = [
+        confidences > 98,
+        confidences > 95,
+        confidences > 90,
+        confidences > 0,
+        confidences == 0,  # not used
+    ]
+    return np.select(bands, CONFIDENCE_COLORS, default=INCONSISTENT_COLOR)
+
+
+def write_data(df, confidence_df, data_path, images_path, extensions):
+    """
+    Write the data workbook, with the cells painted based on their confidence
+    and the IDs linked to the check images. The workbook is streamed row by
+    row, so memory doesn't grow with the number of rows.
+
+    :param df: The data DataFrame.
+    :param confidence_df: The confidences, in the same order as df.
+    :param data_path: Path of the Excel file.
+    :param images_path: Path of the images folder used in the hyperlinks.
+    :param extensions: Dict of {id: extension} of the check images, PNG when
+                       missing.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("data")
+
+    # One fill per color, shared by the cells of that color
+    fills = {
+        color: PatternFill(
+            start_color=color, end_color=color, fill_type="solid"
+        )
+        for color in CONFIDENCE_COLORS + [INCONSISTENT_COLOR]
+    }
+    confidence_df = confidence_df.reset_index(drop=True).reindex(
+        range(len(df))
+    )
+    colors = {
+        df.columns.get_loc(col): get_confidence_colors(confidence_df[col])
+        for col in CONFIDENCE_COLUMNS
+    }
+
+    id_col_index = df.columns.get_loc("ID")
+
+    ws.append(list(df.columns))
+    values = df.astype(object).where(df.notna(), None).to_numpy()
+    for i, row_values in enumerate(values):
+        row = list(row_values)
+        for col_index, col_colors in colors.items():
+            cell = WriteOnlyCell(ws, value=row[col_index])
+            cell.fill = fills[col_colors[i]]
+            row[col_index] = cell
+        id = row[id_col_index]
+        cell = WriteOnlyCell(ws, value=id)
+        extension = extensions.get(str(id), ".png")
+        cell.hyperlink = f"{images_path}/{id}{extension}"
+        row[id_col_index] = cell
+        ws.append(row)
+
+    wb.save(data_path)
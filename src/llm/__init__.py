@@ -1,88 +1,396 @@
 import os
 import json
-import shutil
-from langchain.text_splitter import CharacterTextSplitter
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from array import array
+from typing import Any, List
+from unidecode import unidecode
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 from langchain.docstore.document import Document
 from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import TextLoader
-from langchain_community.embeddings import FakeEmbeddings
 from langchain_openai import ChatOpenAI
 from langchain_openai import OpenAIEmbeddings
 
+MANIFEST_FILE_NAME = "manifest.json"
+SYNC_BATCH_SIZE = 1000
+# Number of entries of a context given to the LLM
+CONTEXT_TOP_K = 5
+
 
 class LLMCache:
-    def __init__(self, cache_file_path="llm/cache/cache.json"):
+    """
+    Cache of LLM results, loaded in memory once per process.
+    New results are appended to a journal next to the cache file, which is
+    folded into the cache file every compact_every writes. Both files are only
+    replaced or appended to, so a crash never loses the cached results.
+    """
+
+    def __init__(
+        self, cache_file_path="llm/cache/results.json", compact_every=500
+    ):
         self.cache_file_path = cache_file_path
+        self.journal_file_path = (
+            os.path.splitext(cache_file_path)[0] + ".journal"
+        )
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.cache_data = {}
+        self.journal_size = 0
+        self.journal_ends_with_newline = True
+        self.load()
 
-    def write(self, id, key, value):
+    def load(self):
         try:
             # Load existing data from the cache file
             with open(self.cache_file_path, "r") as file:
-                cache_data = json.load(file)
+                self.cache_data = json.load(file)
+        except FileNotFoundError:
+            self.cache_data = {}
+
+        # Replay the writes that were not compacted yet
+        try:
+            with open(self.journal_file_path, "r") as file:
+                for line in file:
+                    self.journal_ends_with_newline = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partially written line
+                    self.cache_data[entry["key"]] = entry["value"]
+                    self.journal_size += 1
         except FileNotFoundError:
-            # If the file doesn't exist, create the directory
+            pass
+
+    def write(self, key, value):
+        with self.lock:
+            self.cache_data[key] = value
+
+            # Append the write to the journal
             os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
-            # Then create an empty dictionary
-            cache_data = {}
+            line = json.dumps({"key": key, "value": value}) + "\n"
+            if not self.journal_ends_with_newline:
+                # Start after the partially written line of a crash
+                line = "\n" + line
+                self.journal_ends_with_newline = True
+            with open(self.journal_file_path, "a") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            self.journal_size += 1
 
-        # Check if the id already exists in the cache
-        if id in cache_data:
-            # If the id exists, add the inner key and its value
-            cache_data[id][key] = value
-        else:
-            # If the id doesn't exist, create the id entry and its inner object
-            cache_data[id] = {key: value}
+            if self.journal_size >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """
+        Write the whole cache to the cache file and empty the journal.
+        The cache file is replaced atomically, and replaying a journal that
+        was already compacted is harmless.
+        """
+        os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+        tmp_file_path = self.cache_file_path + ".tmp"
+        with open(tmp_file_path, "w") as file:
+            json.dump(self.cache_data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file_path, self.cache_file_path)
+        open(self.journal_file_path, "w").close()
+        self.journal_size = 0
+        self.journal_ends_with_newline = True
+
+    def read(self, key):
+        return self.cache_data.get(key)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings of documents cached on disk, keyed by the embedding model and
+    the text hash, so that rebuilding or syncing a vector database only
+    embeds texts never seen before. Missing embeddings are requested in
+    batches of batch_size texts.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        cache_file_path="llm/cache/embeddings.db",
+        batch_size=500,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(cache_file_path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(
+            cache_file_path, check_same_thread=False
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self.lock = threading.Lock()
+
+    @property
+    def model(self):
+        return self.embeddings.model
+
+    def get_key(self, text):
+        return hashlib.sha256(f"{self.model}|{text}".encode()).hexdigest()
+
+    def read(self, keys):
+        """
+        :param keys: List of cache keys.
+        :return: Dict of {key: embedding} of the cached keys.
+        """
+        vectors = {}
+        with self.lock:
+            for i in range(0, len(keys), self.batch_size):
+                batch = keys[i : i + self.batch_size]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, vector in rows:
+                    vectors[key] = array("f", vector).tolist()
+        return vectors
+
+    def write(self, vectors):
+        """
+        :param vectors: Dict of {key: embedding}.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, array("f", vector).tobytes())
+                    for key, vector in vectors.items()
+                ],
+            )
+
+    def embed_documents(self, texts):
+        keys = [self.get_key(text) for text in texts]
+        vectors = self.read(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        missing_keys = list(missing)
+        for i in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[i : i + self.batch_size]
+            embedded = self.embeddings.embed_documents(
+                [missing[key] for key in batch]
+            )
+            new_vectors = dict(zip(batch, embedded))
+            self.write(new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key] for key in keys]
 
-        # Write the updated data back to the cache file
-        with open(self.cache_file_path, "w") as file:
-            json.dump(cache_data, file)
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
 
-    def read(self, id, key):
+
+class NumpyIndex:
+    """
+    In-memory vector index: the normalized embeddings of all the entries in a
+    single float32 matrix, searched exactly with one matrix-vector product.
+    Saved indexes are memory-mapped when loaded.
+    """
+
+    VECTORS_FILE_NAME = "vectors.npy"
+    TEXTS_FILE_NAME = "texts.json"
+
+    def __init__(self, vectors, texts, embedding_function=None):
+        """
+        :param vectors: Matrix (entries × dimensions) of normalized vectors.
+        :param texts: List of the entries texts, one per row of vectors.
+        :param embedding_function: Embeddings used to embed the queries.
+        """
+        self.vectors = vectors
+        self.texts = texts
+        self.embedding_function = embedding_function
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    @classmethod
+    def from_texts(cls, texts, embedding_function):
+        if not texts:
+            return cls(
+                np.zeros((0, 0), dtype=np.float32), [], embedding_function
+            )
+        vectors = cls.normalize(embedding_function.embed_documents(texts))
+        return cls(vectors, list(texts), embedding_function)
+
+    @classmethod
+    def load(cls, folder, embedding_function=None, mmap=True):
+        """
+        :param folder: The folder of a saved index.
+        :param mmap: Memory-map the vectors instead of reading them.
+        :return: The NumpyIndex, or None if the folder has no saved index.
+        """
         try:
-            # Load existing data from the cache file
-            with open(self.cache_file_path, "r") as file:
-                cache_data = json.load(file)
-
-            # Check if the id exists in the cache
-            if id in cache_data:
-                # Check if the inner key exists for the given id
-                if key in cache_data[id]:
-                    return cache_data[id][key]
-                else:
-                    return None  # Inner key doesn't exist
-            else:
-                return None  # Id doesn't exist
-        except FileNotFoundError:
-            return None  # Cache file doesn't exist
+            with open(os.path.join(folder, cls.TEXTS_FILE_NAME)) as file:
+                texts = json.load(file)
+            vectors = np.load(
+                os.path.join(folder, cls.VECTORS_FILE_NAME),
+                mmap_mode="r" if mmap else None,
+            )
+        except (FileNotFoundError, ValueError):
+            return None
+        return cls(vectors, texts, embedding_function)
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        vectors_path = os.path.join(folder, self.VECTORS_FILE_NAME)
+        texts_path = os.path.join(folder, self.TEXTS_FILE_NAME)
+        with open(f"{vectors_path}.tmp", "wb") as file:
+            np.save(file, self.vectors)
+        with open(f"{texts_path}.tmp", "w") as file:
+            json.dump(self.texts, file)
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        os.replace(f"{texts_path}.tmp", texts_path)
+
+    def search(self, query, k=4):
+        """
+        Exact cosine similarity search.
+
+        :param query: The query text.
+        :param k: Number of entries to return.
+        :return: List of (text, score), most similar first.
+        """
+        if not self.texts:
+            return []
+        vector = self.normalize(self.embedding_function.embed_query(query))
+        scores = self.vectors @ vector
+        k = min(k, len(self.texts))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.texts[i], float(scores[i])) for i in top]
+
+    def as_retriever(self, search_kwargs=None):
+        return NumpyRetriever(index=self, **(search_kwargs or {}))
+
+
+class NumpyRetriever(BaseRetriever):
+    """
+    Retriever of a NumpyIndex, used like the retriever of a Chroma database.
+    """
+
+    index: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        return [
+            Document(page_content=text)
+            for text, _ in self.index.search(query, k=self.k)
+        ]
+
+
+def format_documents(documents):
+    """
+    Join the retrieved entries of a context, one per line.
+
+    :param documents: List of retrieved documents.
+    :return: The context text.
+    """
+    return "\n".join(document.page_content for document in documents)
+
+
+def normalize_text(text):
+    """
+    Normalize an OCR text for caching: accents removed, lowercase and single
+    spaces, so the same name written slightly differently shares its result.
+
+    :param text: The OCR text.
+    :return: The normalized text.
+    """
+    return " ".join(unidecode(text or "").lower().split())
+
+
+def hash_prompt(prompt):
+    """
+    Hash the messages of a prompt template.
+
+    :param prompt: A ChatPromptTemplate.
+    :return: The hexadecimal SHA-256 of the messages.
+    """
+    messages = [
+        (type(message).__name__, message.prompt.template)
+        for message in prompt.messages
+    ]
+    return hashlib.sha256(json.dumps(messages).encode()).hexdigest()
+
+
+def hash_file(file_path):
+    """
+    Hash the content of a file.
+
+    :param file_path: The path of the file.
+    :return: The hexadecimal SHA-256 of the file, or '' if it doesn't exist.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return ""
 
 
 class RAG:
+    DATA_PATHS = {
+        "territories": "data/data/territories.txt",
+        "client_names": "data/data/client_names.txt",
+        "account_names": "data/data/account_names.txt",
+    }
+
+    # Vector database used as context by each query key
+    CONTEXTS = {
+        "CITY": "territories",
+        "DATE": None,
+        "CLIENT_NAME": "client_names",
+        "ACCOUNT_NAME": "account_names",
+    }
+
+    VECTOR_BACKENDS = ("chroma", "numpy")
+
     def __init__(
-        self, api_key, vectordb_updates, model_name="gpt-3.5-turbo-0125"
+        self,
+        api_key,
+        vectordb_updates,
+        model_name="gpt-3.5-turbo-0125",
+        vector_backend="chroma",
     ):
         self.api_key = api_key
-        self.embedding_function = OpenAIEmbeddings(api_key=self.api_key)
-        self.clean_vector_databases(vectordb_updates)
+        self.model_name = model_name
+        self.vector_backend = vector_backend
+        self.embedding_function = CachedEmbeddings(
+            OpenAIEmbeddings(api_key=self.api_key)
+        )
         self.vector_db_territories = self.setup_vector_database(
-            name="territories"
+            name="territories", force="territories" in vectordb_updates
         )
         self.vector_db_client_names = self.setup_vector_database(
-            name="client_names"
+            name="client_names", force="client_names" in vectordb_updates
         )
         self.vector_db_account_names = self.setup_vector_database(
-            name="account_names"
+            name="account_names", force="account_names" in vectordb_updates
         )
         self.vector_db_territories_retriever = self.get_retriever(
-            self.vector_db_territories, k=1
-        )  # there's only 1 doc
+            self.vector_db_territories, k=CONTEXT_TOP_K
+        )
         self.vector_db_client_names_retriever = self.get_retriever(
-            self.vector_db_client_names, k=1
+            self.vector_db_client_names, k=CONTEXT_TOP_K
         )
         self.vector_db_account_names_retriever = self.get_retriever(
-            self.vector_db_account_names, k=1
+            self.vector_db_account_names, k=CONTEXT_TOP_K
         )
         self.prompts = {
             "CITY": self.generate_prompt(
@@ -185,53 +493,135 @@ class RAG:
             ),
         }
         self.llm = self.setup_llm(model_name=model_name)
+        self.chains = self.setup_chains()
         self.llm_cache = LLMCache()
+        self.cache_versions = {
+            key: self.get_cache_version(key) for key in self.prompts
+        }
+        self.stats = {key: {"hits": 0, "misses": 0} for key in self.prompts}
 
-    def load_documents(self, name):
-        paths = {
-            "territories": "data/data/territories.txt",
-            "client_names": "data/data/client_names.txt",
-            "account_names": "data/data/account_names.txt",
+    def load_entries(self, name):
+        """
+        Load the non-empty lines of a context file, keyed by their hash so that
+        an entry keeps its id in the vector database while it doesn't change.
+
+        :param name: The vector database name.
+        :return: Dict of {entry_id: line}.
+        """
+        try:
+            with open(self.DATA_PATHS[name], "r") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+        entries = {}
+        for line in lines:
+            line = line.strip()
+            if line:
+                entries.setdefault(
+                    hashlib.sha256(line.encode()).hexdigest(), line
+                )
+        return entries
+
+    def read_manifest(self, vector_db_path):
+        try:
+            with open(
+                os.path.join(vector_db_path, MANIFEST_FILE_NAME)
+            ) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_manifest(self, vector_db_path, manifest):
+        manifest_path = os.path.join(vector_db_path, MANIFEST_FILE_NAME)
+        with open(f"{manifest_path}.tmp", "w") as file:
+            json.dump(manifest, file)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def sync_vector_database(self, vector_db, name, reset=False):
+        """
+        Make the vector database match its context file: add the new lines and
+        delete the removed ones. Only the added lines are embedded.
+
+        :param vector_db: The Chroma vector database.
+        :param name: The vector database name.
+        :param reset: Replace all the entries, e.g. when they were embedded
+                      with another model.
+        :return: Tuple (added, deleted) with the number of entries.
+        """
+        entries = self.load_entries(name)
+        existing = set(vector_db.get(include=[])["ids"])
+        if reset:
+            deleted = list(existing)
+            added = list(entries)
+        else:
+            deleted = list(existing - entries.keys())
+            added = [id for id in entries if id not in existing]
+        if deleted:
+            vector_db.delete(ids=deleted)
+        for i in range(0, len(added), SYNC_BATCH_SIZE):
+            ids = added[i : i + SYNC_BATCH_SIZE]
+            vector_db.add_texts(texts=[entries[id] for id in ids], ids=ids)
+        return len(added), len(deleted)
+
+    def setup_numpy_index(self, name, manifest, force=False):
+        """
+        Load the saved NumpyIndex of a context file, rebuilding it when the
+        file changed since it was built (or when forced). The embeddings of
+        unchanged lines come from the embeddings cache.
+
+        :param name: The vector database name.
+        :param manifest: The manifest of the current context file.
+        :param force: Rebuild even if the context file didn't change.
+        :return: The NumpyIndex.
+        """
+        index_path = f"llm/vectordb/{name}-numpy"
+        index = None
+        if not force and self.read_manifest(index_path) == manifest:
+            index = NumpyIndex.load(index_path, self.embedding_function)
+        if index is None:
+            texts = list(self.load_entries(name).values())
+            NumpyIndex.from_texts(texts, self.embedding_function).save(
+                index_path
+            )
+            self.write_manifest(index_path, manifest)
+            index = NumpyIndex.load(index_path, self.embedding_function)
+            print(f"- '{name}' vector index built: {len(texts)} entries.")
+        return index
+
+    def setup_vector_database(self, name, force=False):
+        """
+        Open a persisted vector database, syncing it with its context file when
+        the file changed since the last sync (or when forced).
+
+        :param name: The vector database name.
+        :param force: Sync even if the context file didn't change.
+        :return: The Chroma vector database, or a NumpyIndex if the vector
+                 backend is numpy.
+        """
+        manifest = {
+            "file_hash": hash_file(self.DATA_PATHS[name]),
+            "embedding_model": self.embedding_function.model,
         }
-        loader = TextLoader(paths[name])
-        documents = loader.load()
-        return documents
-
-    def chunk_documents(self, documents):
-        text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunked_documents = text_splitter.split_documents(documents)
-        if len(chunked_documents) == 0:
-            chunked_documents = [Document(page_content="")]
-        return chunked_documents
-
-    def clean_vector_databases(self, vectordb_updates):
-        # remove folder instead of calling reset() because at this point vectorstores may not be initialized
-        if "territories" in vectordb_updates:
-            if os.path.exists("llm/vectordb/territories"):
-                shutil.rmtree("llm/vectordb/territories")
-        if "client_names" in vectordb_updates:
-            if os.path.exists("llm/vectordb/client_names"):
-                shutil.rmtree("llm/vectordb/client_names")
-        if "account_names" in vectordb_updates:
-            if os.path.exists("llm/vectordb/account_names"):
-                shutil.rmtree("llm/vectordb/account_names")
-
-    def setup_vector_database(self, name):
+        if self.vector_backend == "numpy":
+            return self.setup_numpy_index(name, manifest, force=force)
         vector_db_path = f"llm/vectordb/{name}"
-        vector_db = None
-        if not os.path.exists(vector_db_path):
-            documents = self.load_documents(name)
-            chunked_documents = self.chunk_documents(documents)
-            vector_db = Chroma.from_documents(
-                documents=chunked_documents,
-                embedding=self.embedding_function,
-                persist_directory=vector_db_path,
+        vector_db = Chroma(
+            persist_directory=vector_db_path,
+            embedding_function=self.embedding_function,
+        )
+        previous_manifest = self.read_manifest(vector_db_path)
+        if force or previous_manifest != manifest:
+            # Vectors of another model can't be mixed with the new ones
+            reset = (previous_manifest or {}).get(
+                "embedding_model"
+            ) != manifest["embedding_model"]
+            added, deleted = self.sync_vector_database(
+                vector_db, name, reset=reset
             )
             vector_db.persist()
-        else:
-            vector_db = Chroma(
-                persist_directory=vector_db_path,
-                embedding_function=self.embedding_function,
+            self.write_manifest(vector_db_path, manifest)
+            print(
+                f"- '{name}' vector database synced: {added} added, {deleted} deleted."
             )
         return vector_db
 
@@ -252,49 +642,170 @@ class RAG:
 
     def setup_rag_chain(self, retriever, prompt, llm):
         rag_chain = (
-            {"context": retriever, "text": RunnablePassthrough()}
+            {
+                "context": retriever | format_documents,
+                "text": RunnablePassthrough(),
+            }
             | prompt
             | llm
             | StrOutputParser()
         )
         return rag_chain
 
-    # DATE doesn't use context
-    # Useful for testing
-    def create_empty_vectorstore_retriever(self):
-        return Chroma.from_documents(
-            documents=[Document(page_content="")],
-            embedding=FakeEmbeddings(size=1),
-        ).as_retriever(search_kwargs={"k": 1})
+    # DATE doesn't use context, its prompt is filled with the text only
+    def setup_prompt_chain(self, prompt, llm):
+        prompt_chain = (
+            {"text": RunnablePassthrough()} | prompt | llm | StrOutputParser()
+        )
+        return prompt_chain
 
-    def get_result(self, key, text):
-        prompt = self.prompts[key]
+    def setup_chains(self):
+        """
+        Build the chain of every query key once, they are reused by all the
+        queries.
+        """
         retrievers = {
             "CITY": self.vector_db_territories_retriever,
-            "DATE": self.create_empty_vectorstore_retriever(),
             "CLIENT_NAME": self.vector_db_client_names_retriever,
             "ACCOUNT_NAME": self.vector_db_account_names_retriever,
         }
-        rag_chain = self.setup_rag_chain(retrievers[key], prompt, self.llm)
+        chains = {}
+        for key, prompt in self.prompts.items():
+            if key in retrievers:
+                chains[key] = self.setup_rag_chain(
+                    retrievers[key], prompt, self.llm
+                )
+            else:
+                chains[key] = self.setup_prompt_chain(prompt, self.llm)
+        return chains
+
+    def get_chain(self, key):
+        return self.chains[key]
+
+    def get_result(self, key, text):
+        rag_chain = self.get_chain(key)
         result = rag_chain.invoke(text.lower())
         return "" if result == "None" else result.upper()
 
+    async def aget_result(self, key, text):
+        rag_chain = self.get_chain(key)
+        result = await rag_chain.ainvoke(text.lower())
+        return "" if result == "None" else result.upper()
+
+    def get_cache_version(self, key):
+        """
+        Everything, besides the text, that changes the result of a query key:
+        the model, the prompt and its context (content of the file, vector
+        backend and number of entries retrieved).
+        """
+        context = self.CONTEXTS[key]
+        context_version = ""
+        if context:
+            context_version = ":".join(
+                [
+                    hash_file(self.DATA_PATHS[context]),
+                    self.vector_backend,
+                    str(CONTEXT_TOP_K),
+                ]
+            )
+        return "|".join(
+            [self.model_name, hash_prompt(self.prompts[key]), context_version]
+        )
+
+    def get_cache_key(self, key, text):
+        cache_key = "|".join(
+            [key, normalize_text(text), self.cache_versions[key]]
+        )
+        return hashlib.sha256(cache_key.encode()).hexdigest()
+
     def query(self, key, id, text) -> str:
-        res = self.llm_cache.read(id, key)
+        cache_key = self.get_cache_key(key, text)
+        res = self.llm_cache.read(cache_key)
         if res is None:
+            self.stats[key]["misses"] += 1
             res = self.get_result(
                 key=key,
                 text=text,
             )
-            self.llm_cache.write(id, key, res)
+            self.llm_cache.write(cache_key, res)
+        else:
+            self.stats[key]["hits"] += 1
         return res
 
+    async def aquery_many(self, requests, max_concurrency=8):
+        """
+        Run several queries concurrently.
+        At most max_concurrency LLM calls are in flight, and identical queries
+        (same cache key) share a single call.
+
+        :param requests: List of (key, id, text) tuples.
+        :param max_concurrency: Maximum number of concurrent LLM calls.
+        :return: The list of results, in the same order as the requests.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        in_flight = {}
+
+        async def fetch(key, text, cache_key):
+            async with semaphore:
+                res = await self.aget_result(key=key, text=text)
+            self.llm_cache.write(cache_key, res)
+            return res
+
+        async def query(key, id, text):
+            cache_key = self.get_cache_key(key, text)
+            res = self.llm_cache.read(cache_key)
+            if res is not None:
+                self.stats[key]["hits"] += 1
+                return res
+            if cache_key in in_flight:
+                # The same query was already sent for another field or check
+                self.stats[key]["hits"] += 1
+                return await in_flight[cache_key]
+            self.stats[key]["misses"] += 1
+            in_flight[cache_key] = asyncio.ensure_future(
+                fetch(key, text, cache_key)
+            )
+            return await in_flight[cache_key]
+
+        return await asyncio.gather(*[query(*request) for request in requests])
+
+    def query_many(self, requests, max_concurrency=8):
+        """
+        Synchronous wrapper of aquery_many.
+        """
+        return asyncio.run(
+            self.aquery_many(requests, max_concurrency=max_concurrency)
+        )
+
+    def print_stats(self, local=None):
+        """
+        Print the hit rate of the LLM cache for each query key, and the number
+        of names corrected locally, without the LLM.
+
+        :param local: Dict of {key: number of names corrected locally}.
+        """
+        print("- LLM cache hit rate:")
+        for key, stats in self.stats.items():
+            total = stats["hits"] + stats["misses"]
+            rate = stats["hits"] / total * 100 if total else 0
+            count = (local or {}).get(key, 0)
+            local_count = f", {count} local" if count else ""
+            print(
+                f"  {key}: {stats['hits']}/{total} ({rate:.1f}%){local_count}"
+            )
+
 
 class LLMClient:
-    def __init__(self, vectordb_updates, model_name="gpt-3.5-turbo-0125"):
+    def __init__(
+        self,
+        vectordb_updates,
+        model_name="gpt-3.5-turbo-0125",
+        vector_backend="chroma",
+    ):
         self.api_key = os.environ["OPENAI_API_KEY"]
         self.rag = RAG(
             api_key=self.api_key,
             vectordb_updates=vectordb_updates,
             model_name=model_name,
+            vector_backend=vector_backend,
         )
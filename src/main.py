@@ -1,5 +1,13 @@
-import pandas as pd
-from constants import BANK_CODES, BANK_NAMES, BOXES, COLUMNS_MAP, COLUMNS
+from constants import (
+    BANK_CODES,
+    BANK_NAMES,
+    BANK_FIELDS,
+    BOXES,
+    COLUMNS_MAP,
+    COLUMNS,
+    FIELDS,
+    RASTER_SETTINGS,
+)
 import textract
 import confidence
 import data
@@ -8,38 +16,236 @@ import utils
 import extractor
 import cache
 import llm
+import store
+import watcher
 
 import argparse
+import collections
+import os
+import signal
+import sys
+import time
 
 
-def main(
-    llm_enabled=False, vectordb_updates=[], model_name="gpt-3.5-turbo-0125"
+def ocr_stage(
+    pages,
+    ocr_workers=4,
+    raster_workers=2,
+    keep_full_response=False,
+    cache_max_bytes=None,
+    cache_max_age=None,
+    journal=None,
+    save_extension=None,
 ):
-    df = handler.load_data(file_path="../../data.xlsx", columns=COLUMNS)
+    """
+    Get the Textract response of every page of the PDF files, reading it from
+    the cache when possible. Each page is a check. Cache misses are rasterized
+    page by page in a process pool and sent to Textract through a bounded pool
+    of workers, so their round-trips overlap, even for the pages of a single
+    file. Cache writes happen here, in the same order as the input pages.
 
-    data.setup_data()
+    :param pages: List of (filename, page) tuples of the PDF files in the
+                  unprocessed folder (see utils.list_pdf_pages).
+    :param ocr_workers: Maximum number of concurrent Textract requests.
+    :param raster_workers: Number of processes rasterizing PDF pages.
+    :param keep_full_response: Whether to cache the full Textract responses.
+    :param cache_max_bytes: Size budget of the cache in bytes.
+    :param cache_max_age: Maximum time in seconds a cache entry can stay unused.
+    :param journal: Optional function journal(files, stage) called with the
+                    (page name, id) tuples reaching the rasterized and ocr
+                    stages.
+    :param save_extension: Optional function save_extension(id, extension)
+                           called for each saved check image.
+    :return: A dictionary mapping each (filename, page) to a tuple
+             (id, response).
+    """
+    responses = {}
+    misses = []
+    miss_pages = {}  # page key -> (filename, page)
+    duplicates = []  # copies of a cache miss in the same batch
+    file_keys = {}
+    keys = {}
+    for pdf_filename, page in pages:
+        # The same document gets the same key whatever its filename is
+        if pdf_filename not in file_keys:
+            file_keys[pdf_filename] = cache.get_content_key(
+                os.path.join("../../unprocessed", pdf_filename),
+                RASTER_SETTINGS,
+            )
+        key = cache.get_page_key(file_keys[pdf_filename], page)
+        keys[(pdf_filename, page)] = key
 
-    llm_client = None
-    if llm_enabled:
-        llm_client = llm.LLMClient(vectordb_updates, model_name)
+        # Only the first page can be found by its filename
+        filename = pdf_filename if page == 0 else None
+        res = None
+        cached = cache.check_if_cached(
+            filename, cache_folder="../cache", key=key
+        )
+        if cached:
+            res = cache.read_cache(filename, cache_folder="../cache", key=key)
+        if res is not None:
+            # Reuse the ID the page got the first time, its image is saved
+            # under that ID
+            id = cache.get_cached_id(key, cache_folder="../cache")
+            if id is None:
+                id = (
+                    utils.get_id(pdf_filename)
+                    if page == 0
+                    else utils.generate_id()
+                )
+                cache.update_index(id, key, cache_folder="../cache")
+            responses[(pdf_filename, page)] = (id, res)
+        elif key in miss_pages:
+            duplicates.append((pdf_filename, page))
+        else:
+            misses.append((pdf_filename, page))
+            miss_pages[key] = (pdf_filename, page)
 
-    confidence_df = handler.load_data(
-        file_path="confidence/confidence.xlsx", columns=COLUMNS
-    )
-    confidence_df = confidence.filter_confidence_df(confidence_df, df)
+    if journal and responses:
+        journal(
+            [
+                (utils.get_page_name(*item), id)
+                for item, (id, _) in responses.items()
+            ],
+            "ocr",
+        )
+
+    if not misses:
+        return responses
+
+    # The encoded image goes straight to Textract, the archival copy is saved
+    # in the background
+    image_writer = handler.ImageWriter(images_folder="../images")
+
+    def rasterize():
+        for item, encoded in utils.rasterize_pdfs(
+            misses,
+            folder="../../unprocessed",
+            max_workers=raster_workers,
+            **RASTER_SETTINGS,
+        ):
+            if encoded is None:
+                # Left out of the responses: its file stays unprocessed
+                continue
+            image_bytes, extension = encoded
+            id = utils.generate_id()
+            image_writer.write(image_bytes, id, extension=extension)
+            if save_extension:
+                save_extension(id, extension)
+            if journal:
+                journal([(utils.get_page_name(*item), id)], "rasterized")
+            yield (item, id), image_bytes
+
+    with image_writer:
+        t = textract.setup_textract(max_pool_connections=ocr_workers)
+        for (item, id), res in textract.process_images(
+            t, rasterize(), max_workers=ocr_workers
+        ):
+            if res is None:
+                continue
+            cache.write_to_cache(
+                res,
+                id,
+                cache_folder="../cache",
+                key=keys[item],
+                keep_full=keep_full_response,
+                max_bytes=cache_max_bytes,
+                max_age=cache_max_age,
+            )
+            if journal:
+                journal([(utils.get_page_name(*item), id)], "ocr")
+            responses[item] = (id, res)
+
+    for item in duplicates:
+        miss = miss_pages[keys[item]]
+        if miss in responses:
+            responses[item] = responses[miss]
+
+    return responses
+
+
+def sync_results(results_store):
+    """
+    Import data.xlsx into the results store if it was edited (or on the first
+    run): the edited file is the source of truth.
 
-    unprocessed_filenames = handler.get_unprocessed_filenames(
-        folder_path="../../unprocessed"
+    :param results_store: The ResultsStore.
+    """
+    if results_store.export_changed("../../data.xlsx"):
+        df = handler.load_data(file_path="../../data.xlsx", columns=COLUMNS)
+        confidence_df = handler.load_data(
+            file_path="confidence/confidence.xlsx", columns=COLUMNS
+        )
+        confidence_df = confidence.filter_confidence_df(confidence_df, df)
+        results_store.import_workbook("../../data.xlsx", df, confidence_df)
+
+
+def export_results(results_store):
+    """
+    Write data.xlsx and confidence.xlsx with all the checks of the results
+    store.
+
+    :param results_store: The ResultsStore.
+    """
+    df, confidence_df = results_store.read()
+
+    # Images are PNG or JPEG depending on the size of the check
+    extensions = results_store.get_image_extensions()
+    missing = set(df["ID"].astype(str)) - set(extensions)
+    if missing:
+        # Images saved before the store kept their extension: the folder is
+        # only listed until they're all recorded
+        saved = handler.get_image_extensions("../images")
+        found = {id: saved.get(id, ".png") for id in missing}
+        results_store.set_image_extensions(found.items())
+        extensions.update(found)
+
+    handler.write_data(
+        df,
+        confidence_df,
+        data_path="../../data.xlsx",
+        images_path="checks-ocr/images",
+        extensions=extensions,
+    )
+    handler.write_confidence(
+        confidence_df, filename="confidence/confidence.xlsx"
     )
+    results_store.set_exported("../../data.xlsx")
 
-    TERRITORIES = data.load_territories()
 
-    for pdf_filename in unprocessed_filenames:
-        res = {}
+def process_files(
+    pdf_filenames,
+    results_store,
+    plans,
+    context,
+    llm_client=None,
+    ocr_workers=4,
+    raster_workers=2,
+    keep_full_response=False,
+    cache_max_bytes=None,
+    cache_max_age=None,
+    llm_concurrency=8,
+    checkpoint_rows=50,
+):
+    """
+    Process a batch of PDF files of the unprocessed folder and write their
+    checks (one per page) to the results store. A file is moved to the
+    processed folder once all its pages are written. The workbooks are not
+    exported.
+
+    :param pdf_filenames: List of PDF filenames in the unprocessed folder.
+    :param results_store: The ResultsStore.
+    :param plans: The extraction plans of the banks (see compile_plans).
+    :param context: The context of the parsers.
+    :param llm_client: Optional LLMClient correcting the extracted texts.
+    :param checkpoint_rows: Number of checks written to the store at a time.
+    :return: The number of new checks.
+    """
+    pending_filenames = []
+    for pdf_filename in pdf_filenames:
         id = utils.get_id(pdf_filename)
 
-        processed = handler.check_if_processed(df, pdf_filename)
-        if processed:
+        if results_store.contains(id):
             handler.move_file(
                 pdf_filename,
                 id,
@@ -48,39 +254,73 @@ def main(
             )
             continue
 
-        cached = cache.check_if_cached(pdf_filename, cache_folder="../cache")
-        if cached:
-            res = cache.read_cache(pdf_filename, cache_folder="../cache")
+        pending_filenames.append(pdf_filename)
 
-        # Processing
-        else:
-            img = utils.pdf_to_img(pdf_filename, folder="../../unprocessed")
-            id = utils.generate_id()
-            img_filename = handler.save_image(
-                img, id, images_folder="../images"
+    pages = utils.list_pdf_pages(pending_filenames, folder="../../unprocessed")
+    responses = ocr_stage(
+        pages,
+        ocr_workers=ocr_workers,
+        raster_workers=raster_workers,
+        keep_full_response=keep_full_response,
+        cache_max_bytes=cache_max_bytes,
+        cache_max_age=cache_max_age,
+        journal=results_store.set_stage,
+        save_extension=lambda id, extension: (
+            results_store.set_image_extensions([(id, extension)])
+        ),
+    )
+
+    # A file is moved once all its pages are done, under the ID of its first
+    # page. Files with a page that couldn't be processed are kept.
+    remaining_pages = collections.Counter(f for f, _ in pages)
+    first_ids = {}
+    kept_filenames = set()
+
+    def page_done(pdf_filename):
+        remaining_pages[pdf_filename] -= 1
+        if (
+            remaining_pages[pdf_filename] == 0
+            and pdf_filename not in kept_filenames
+        ):
+            handler.move_file(
+                pdf_filename,
+                first_ids[pdf_filename],
+                source_folder="../../unprocessed",
+                destination_folder="../../processed",
             )
-            t = textract.setup_textract()
-            res = textract.process_image(t, img_filename)
-            cache.write_to_cache(res, id, cache_folder="../cache")
+
+    # (page, row, confidence_row, llm_requests) of each new check, in order.
+    # llm_requests are the (column, key, text) to correct with the LLM.
+    checks = []
+    new_ids = set()
+    for pdf_filename, page in pages:
+        if (pdf_filename, page) not in responses:
+            kept_filenames.add(pdf_filename)
+            continue
+        id, res = responses[(pdf_filename, page)]
+        first_ids.setdefault(pdf_filename, id)
+
+        # A copy of an already processed check, under another filename
+        if results_store.contains(id) or id in new_ids:
+            page_done(pdf_filename)
+            continue
 
         blocks = [b for b in res["Blocks"] if b["BlockType"] == "LINE"]
         bank_code = extractor.get_bank_code(BANK_CODES, blocks)
 
         if bank_code is None:
+            page_name = utils.get_page_name(pdf_filename, page)
+            print(f"Error: No known bank found in '{page_name}'.")
+            kept_filenames.add(pdf_filename)
             continue
 
-        handler.move_file(
-            pdf_filename,
-            id,
-            source_folder="../../unprocessed",
-            destination_folder="../../processed",
-        )
+        new_ids.add(id)
 
-        boxes = BOXES[bank_code]
+        plan = plans[bank_code]
 
         row = {
             "FECHA": "",
-            "BANCO": BANK_NAMES[bank_code],
+            "BANCO": plan.bank_name,
             "NUMERO-CUENTA": "",
             "NOMBRE-CUENTA": "",
             "BENEFICIARIO": "",
@@ -91,7 +331,7 @@ def main(
         }
         confidence_row = {
             "FECHA": 0,
-            "BANCO": BANK_NAMES[bank_code],
+            "BANCO": plan.bank_name,
             "NUMERO-CUENTA": 0,
             "NOMBRE-CUENTA": 0,
             "BENEFICIARIO": 0,
@@ -101,97 +341,224 @@ def main(
             "ID": id,
         }
 
-        for box_name in boxes:
-            max_boxes = (
-                2
-                if box_name == "ACCOUNT_NAME"
-                and bank_code not in ["austro", "guayaquil"]
-                else 1
-            )
-            text, conf, _ = textract.extract_detail(
-                boxes[box_name], blocks, max_boxes=max_boxes
+        # Texts corrected by the LLM are queued and corrected all at once
+        details = textract.extract_details(plan.boxes, blocks)
+        requests = extractor.run_plan(
+            plan, details, row, confidence_row, context
+        )
+        checks.append(((pdf_filename, page), row, confidence_row, requests))
+
+    results_store.set_stage(
+        [
+            (utils.get_page_name(*item), row["ID"])
+            for item, row, _, _ in checks
+        ],
+        "extracted",
+    )
+
+    # Checks are written to the store every checkpoint_rows, and their files
+    # are moved to the processed folder only once they are written
+    for start in range(0, len(checks), checkpoint_rows):
+        chunk = checks[start : start + checkpoint_rows]
+        files = [
+            (utils.get_page_name(*item), row["ID"])
+            for item, row, _, _ in chunk
+        ]
+
+        # LLM corrections of the checks of the chunk run concurrently
+        llm_requests = [
+            (row, column, key, text)
+            for _, row, _, requests in chunk
+            for column, key, text in requests
+        ]
+        if llm_client and llm_requests:
+            results = llm_client.rag.query_many(
+                [(key, row["ID"], text) for row, _, key, text in llm_requests],
+                max_concurrency=llm_concurrency,
             )
+            for (row, column, _, _), result in zip(llm_requests, results):
+                row[column] = result
+            results_store.set_stage(files, "corrected")
 
-            # Extraction and Formatting
-            if box_name in ["ACCOUNT_NUMBER", "CHECK_NUMBER"]:
-                row[COLUMNS_MAP[box_name]] = str(
-                    extractor.extract_numbers(text)
-                )
-            if box_name == "AMOUNT":
-                row[COLUMNS_MAP[box_name]] = extractor.extract_float_numbers(
-                    text
-                )
-            if box_name in ["ACCOUNT_NAME"]:
-                account_name = extractor.clean_and_uppercase(text)
-                row[COLUMNS_MAP[box_name]] = (
-                    llm_client.rag.query("ACCOUNT_NAME", id, account_name)
-                    if llm_client
-                    else account_name
-                )
-            if box_name in ["CLIENT_NAME"]:
-                client_name = extractor.clean_and_uppercase(text)
-                row[COLUMNS_MAP[box_name]] = (
-                    llm_client.rag.query("CLIENT_NAME", id, client_name)
-                    if llm_client
-                    else client_name
-                )
-            if box_name == "PLACE_AND_DATE":
-                date, city = extractor.get_city_and_date(text)
-                row["FECHA"] = (
-                    llm_client.rag.query("DATE", id, text)
-                    if llm_client
-                    else date
-                )
-                row["CIUDAD"] = (
-                    llm_client.rag.query("CITY", id, city)
-                    if llm_client
-                    else city
-                )
+        rows = handler.RowAccumulator(COLUMNS)
+        confidence_rows = handler.RowAccumulator(COLUMNS)
+        for _, row, confidence_row, _ in chunk:
+            if utils.contains_number(row["BENEFICIARIO"]):
+                confidence_row["BENEFICIARIO"] = -1
+            if data.is_in_territories(row["CIUDAD"], context["territories"]):
+                confidence_row["CIUDAD"] = 99
+            if utils.contains_number(row["CIUDAD"]):
+                confidence_row["CIUDAD"] = -1
+
+            rows.append(row)
+            print(row)
+            confidence_rows.append(confidence_row)
 
-            # Confidences Assignment
-            if box_name != "PLACE_AND_DATE":
-                cell_value = row[COLUMNS_MAP[box_name]]
-                confidence_row[COLUMNS_MAP[box_name]] = conf
-                if box_name == "CHECK_NUMBER":  # account number already set
-                    if len(cell_value) == len(row["NUMERO-CUENTA"]):
-                        confidence_row["CHEQUE"] = -1
-                        if len(row["NUMERO-CUENTA"]) in range(1, 10):
-                            confidence_row["NUMERO-CUENTA"] = -1
-                if box_name == "CLIENT_NAME":
-                    if utils.contains_number(cell_value):
-                        confidence_row["BENEFICIARIO"] = -1
-                if box_name == "AMOUNT":
-                    if cell_value == 0:
-                        confidence_row["VALOR"] = -1
-            else:
-                confidence_row["FECHA"] = conf
-                if data.is_in_territories(row["CIUDAD"], TERRITORIES):
-                    conf = 99
-                if utils.contains_number(row["CIUDAD"]):
-                    conf = -1
-                confidence_row["CIUDAD"] = conf
-
-        df = pd.concat(
-            [df, pd.DataFrame([row], columns=df.columns)], ignore_index=True
+        results_store.append(
+            rows.to_frame(),
+            confidence_rows.to_frame(),
+            filenames=[page_name for page_name, _ in files],
         )
-        print(row)
-        confidence_df = pd.concat(
-            [
-                confidence_df,
-                pd.DataFrame([confidence_row], columns=df.columns),
-            ],
-            ignore_index=True,
+        for (pdf_filename, _), _, _, _ in chunk:
+            page_done(pdf_filename)
+
+    results_store.clear_journal()
+    return len(checks)
+
+
+def main(
+    llm_enabled=False,
+    vectordb_updates=[],
+    model_name="gpt-3.5-turbo-0125",
+    ocr_workers=4,
+    raster_workers=2,
+    keep_full_response=False,
+    cache_max_bytes=None,
+    cache_max_age=None,
+    llm_concurrency=8,
+    vector_backend="chroma",
+    checkpoint_rows=50,
+    watch=False,
+    flush_interval=30,
+    force_polling=False,
+):
+    data.setup_data()
+
+    llm_client = None
+    if llm_enabled:
+        llm_client = llm.LLMClient(
+            vectordb_updates, model_name, vector_backend=vector_backend
         )
 
-    handler.write_data(
-        df,
-        confidence_df,
-        data_path="../../data.xlsx",
-        images_path="checks-ocr/images",
+    results_store = store.ResultsStore("../../results.db", COLUMNS)
+    sync_results(results_store)
+
+    journal = results_store.get_journal()
+    if journal:
+        print(f"- Resuming an interrupted run ({len(journal)} files):")
+        for stage in store.ResultsStore.STAGES:
+            count = sum(1 for _, s in journal.values() if s == stage)
+            if count:
+                print(f"  - {count} files {stage}.")
+
+    TERRITORIES = data.load_territories()
+    context = {"territories": TERRITORIES, "names": data.load_name_matchers()}
+    PLANS = extractor.compile_plans(
+        BOXES, FIELDS, BANK_FIELDS, COLUMNS_MAP, BANK_NAMES
     )
-    handler.write_confidence(
-        confidence_df, filename="confidence/confidence.xlsx"
+
+    def process(pdf_filenames):
+        return process_files(
+            pdf_filenames,
+            results_store,
+            PLANS,
+            context,
+            llm_client=llm_client,
+            ocr_workers=ocr_workers,
+            raster_workers=raster_workers,
+            keep_full_response=keep_full_response,
+            cache_max_bytes=cache_max_bytes,
+            cache_max_age=cache_max_age,
+            llm_concurrency=llm_concurrency,
+            checkpoint_rows=checkpoint_rows,
+        )
+
+    if watch:
+        watch_folder(
+            process,
+            results_store,
+            flush_interval=flush_interval,
+            force_polling=force_polling,
+        )
+    else:
+        process(
+            handler.get_unprocessed_filenames(folder_path="../../unprocessed")
+        )
+        # The workbooks are exported only if there are new checks (or checks
+        # written by an interrupted run)
+        if results_store.has_unexported_rows():
+            export_results(results_store)
+    results_store.close()
+
+    names_matched = {
+        key: matcher.matched for key, matcher in context["names"].items()
+    }
+    if llm_client:
+        llm_client.rag.print_stats(local=names_matched)
+    elif any(names_matched.values()):
+        print("- Names corrected locally:")
+        for key, count in names_matched.items():
+            print(f"  {key}: {count}")
+
+
+def watch_folder(
+    process, results_store, flush_interval=30, force_polling=False
+):
+    """
+    Process the PDF files as they land in the unprocessed folder, until the
+    program is stopped. The clients, vector stores and plans stay loaded
+    between arrivals. New checks are written to the results store right away
+    and the workbooks are exported at most every flush_interval seconds.
+
+    :param process: Function processing a list of PDF filenames, returning the
+                    number of new checks.
+    :param results_store: The ResultsStore.
+    :param flush_interval: Minimum number of seconds between exports.
+    :param force_polling: Whether to poll the folder instead of relying on the
+                          notifications of the OS.
+    """
+    # docker stop sends SIGTERM: stop as with Ctrl+C, exporting the checks
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    folder_watcher = watcher.FolderWatcher(
+        "../../unprocessed", force_polling=force_polling
+    )
+    print(
+        f"- Watching the unprocessed folder ({folder_watcher.backend}). "
+        "Press Ctrl+C to stop."
     )
+    last_export = time.monotonic()
+    try:
+        while True:
+            timeout = None
+            if results_store.has_unexported_rows():
+                timeout = max(
+                    0, flush_interval - (time.monotonic() - last_export)
+                )
+            pdf_filenames = folder_watcher.wait(timeout=timeout)
+            if pdf_filenames:
+                # An error stops the batch, not the service: the files that
+                # were not written stay in the unprocessed folder, and are
+                # retried once they're ready again
+                try:
+                    # data.xlsx may have been edited since the last export
+                    sync_results(results_store)
+                    process(pdf_filenames)
+                except Exception as e:
+                    print(f"Error: Unable to process {pdf_filenames}. {e}")
+                    folder_watcher.forget(pdf_filenames)
+            if (
+                results_store.has_unexported_rows()
+                and time.monotonic() - last_export >= flush_interval
+            ):
+                # e.g. data.xlsx is open: it's retried at the next flush
+                try:
+                    sync_results(results_store)
+                    export_results(results_store)
+                except Exception as e:
+                    print(f"Error: Unable to export the results. {e}")
+                last_export = time.monotonic()
+    except (KeyboardInterrupt, SystemExit):
+        print("- Stopping.")
+    finally:
+        try:
+            if results_store.has_unexported_rows():
+                sync_results(results_store)
+                export_results(results_store)
+        except Exception as e:
+            print(f"Error: Unable to export the results. {e}")
+        finally:
+            folder_watcher.close()
 
 
 if __name__ == "__main__":
@@ -200,18 +567,81 @@ if __name__ == "__main__":
         "--llm", action="store_true", help="Enable the llm feature"
     )
     parser.add_argument(
-        "--update", action="append", help="Specify files to update"
+        "--update",
+        action="append",
+        help="Force a sync of a vector database with its file",
     )
     parser.add_argument(
         "--model-name", type=str, help="Specify the model name"
     )
+    parser.add_argument(
+        "--ocr-workers",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent Textract requests",
+    )
+    parser.add_argument(
+        "--raster-workers",
+        type=int,
+        default=2,
+        help="Number of processes rasterizing PDF files",
+    )
+    parser.add_argument(
+        "--cache-full-response",
+        action="store_true",
+        help="Also cache the full Textract responses",
+    )
+    parser.add_argument(
+        "--cache-budget-mb",
+        type=float,
+        help="Size budget of the Textract cache (least recently used entries are removed)",
+    )
+    parser.add_argument(
+        "--cache-max-age-days",
+        type=float,
+        help="Remove Textract cache entries not used in this number of days",
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of concurrent LLM requests",
+    )
+    parser.add_argument(
+        "--vector-backend",
+        choices=llm.RAG.VECTOR_BACKENDS,
+        default="chroma",
+        help="Vector store used to retrieve the LLM context",
+    )
+    parser.add_argument(
+        "--checkpoint-rows",
+        type=int,
+        default=50,
+        help="Number of new checks written to the results at a time",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and process the checks as they arrive",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=30,
+        help="Minimum number of seconds between exports in watch mode",
+    )
+    parser.add_argument(
+        "--watch-polling",
+        action="store_true",
+        help="Poll the unprocessed folder instead of using OS notifications",
+    )
     args = parser.parse_args()
     if args.llm:
         print("- LLM feature enabled!")
         # if not llm, these arguments will be received but not used
         if args.update:
             for vector_db in args.update:
-                print(f"- '{vector_db}' vector database will be updated.")
+                print(f"- '{vector_db}' vector database will be synced.")
         if args.model_name:
             print(f"- Using '{args.model_name}' model.")
         else:
@@ -220,7 +650,26 @@ if __name__ == "__main__":
     main(
         llm_enabled=args.llm,
         vectordb_updates=args.update if args.update else [],
-        model_name=args.model_name
-        if args.model_name
-        else "gpt-3.5-turbo-0125",
+        model_name=(
+            args.model_name if args.model_name else "gpt-3.5-turbo-0125"
+        ),
+        ocr_workers=args.ocr_workers,
+        raster_workers=args.raster_workers,
+        keep_full_response=args.cache_full_response,
+        cache_max_bytes=(
+            args.cache_budget_mb * 1024 * 1024
+            if args.cache_budget_mb
+            else None
+        ),
+        cache_max_age=(
+            args.cache_max_age_days * 24 * 3600
+            if args.cache_max_age_days
+            else None
+        ),
+        llm_concurrency=args.llm_concurrency,
+        vector_backend=args.vector_backend,
+        checkpoint_rows=args.checkpoint_rows,
+        watch=args.watch,
+        flush_interval=args.flush_interval,
+        force_polling=args.watch_polling,
     )
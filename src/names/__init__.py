@@ -0,0 +1,141 @@
+import re
+from collections import Counter
+from unidecode import unidecode
+
+
+def normalize_name(text):
+    """
+    Normalize a name the way extractor.clean_and_uppercase does: uppercase,
+    no accents nor special characters, and single spaces.
+
+    :param text: The input name.
+    :return: The normalized name.
+    """
+    text = re.sub(r"[^A-Z0-9\s]", "", unidecode((text or "").upper()))
+    return " ".join(text.split())
+
+
+def get_trigrams(text):
+    """
+    Get the character trigrams of a text, padded so that short texts and the
+    beginning and end of the text have trigrams too.
+
+    :param text: The normalized text.
+    :return: A set of trigrams.
+    """
+    padded = f"  {text} "
+    return set(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Levenshtein distance between two strings, stopping early once it is known
+    to be greater than max_distance.
+
+    :param a: The first string.
+    :param b: The second string.
+    :param max_distance: The largest distance of interest.
+    :return: The distance, or max_distance + 1 if it is greater than max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+class NameMatcher:
+    """
+    Local fuzzy matcher of names against a known list (e.g. the client names).
+    Candidates are found with a trigram index and ranked by edit distance, and
+    the name is returned as written in the list.
+    """
+
+    def __init__(self, names, min_score=0.85, max_candidates=10):
+        """
+        :param names: Iterable of known names.
+        :param min_score: Minimum score (1 - distance / length) of a match.
+        :param max_candidates: Number of candidates ranked by edit distance.
+        """
+        self.min_score = min_score
+        self.max_candidates = max_candidates
+        self.matched = 0  # number of texts matched to a known name
+        self.originals = {}  # normalized name -> name as written in the list
+        for name in names:
+            key = normalize_name(name)
+            if key and key not in self.originals:
+                self.originals[key] = name.strip()
+        self.names = sorted(self.originals)
+        self.known = set(self.names)
+        self.trigrams = {}
+        for index, name in enumerate(self.names):
+            for trigram in get_trigrams(name):
+                self.trigrams.setdefault(trigram, []).append(index)
+
+    @classmethod
+    def from_file(cls, file_path, **kwargs):
+        """
+        Build a matcher from a file with one name per line.
+
+        :param file_path: The path of the names file.
+        :return: A NameMatcher (empty if the file doesn't exist).
+        """
+        try:
+            with open(file_path, "r") as file:
+                return cls(file.read().splitlines(), **kwargs)
+        except FileNotFoundError:
+            return cls([], **kwargs)
+
+    def match(self, text):
+        """
+        Find the known name closest to a text.
+
+        :param text: The OCR text of a name.
+        :return: Tuple (name, score). The name is as written in the list, or
+                 None when there's no close enough name or when two names are
+                 equally close (ambiguous).
+        """
+        query = normalize_name(text)
+        if not query:
+            return None, 0.0
+        if query in self.known:
+            self.matched += 1
+            return self.originals[query], 1.0
+
+        counts = Counter()
+        for trigram in get_trigrams(query):
+            counts.update(self.trigrams.get(trigram, []))
+
+        max_distance = int(len(query) * (1 - self.min_score))
+        best = []  # (distance, name) of the closest names
+        for index, _ in counts.most_common(self.max_candidates):
+            name = self.names[index]
+            distance = edit_distance(query, name, max_distance)
+            if distance > max_distance:
+                continue
+            if not best or distance < best[0][0]:
+                best = [(distance, name)]
+            elif distance == best[0][0]:
+                best.append((distance, name))
+
+        if len(best) != 1:
+            return None, 0.0
+
+        distance, name = best[0]
+        score = 1 - distance / max(len(query), len(name))
+        if score < self.min_score:
+            return None, score
+        self.matched += 1
+        return self.originals[name], score
@@ -0,0 +1,307 @@
+import os
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+
+
+def to_sql_value(value):
+    """
+    Convert a DataFrame value to a value SQLite can store.
+
+    :param value: The value.
+    :return: The value as a Python int, float or str, or None if missing.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return to_sql_value(value.item())
+    if isinstance(value, (int, float, str)):
+        return value
+    if pd.isna(value):
+        return None
+    return str(value)
+
+
+def drop_invalid_ids(df, name=None):
+    """
+    Drop the rows without an ID and the later copies of a duplicated ID. The
+    results are keyed by ID.
+
+    :param df: DataFrame with an ID column.
+    :param name: Name of the source of the rows, to report the dropped rows
+                 (they are not reported if None).
+    :return: The DataFrame without those rows.
+    """
+    ids = df["ID"].astype("string").str.strip()
+    missing = (ids.isna() | (ids == "")).fillna(True).astype(bool)
+    if name is not None and missing.any():
+        print(f"Error: {missing.sum()} rows without ID in {name} skipped.")
+    duplicated = ids.duplicated() & ~missing
+    if name is not None and duplicated.any():
+        duplicates = ", ".join(sorted(set(ids[duplicated])))
+        print(
+            f"Warning: Duplicated IDs in {name}, only their first row is "
+            f"kept: {duplicates}."
+        )
+    return df[~(missing | duplicated)]
+
+
+class ResultsStore:
+    """
+    The data and confidence of the processed checks, keyed by ID, in a SQLite
+    database. New checks are appended without reading the previous ones, and
+    data.xlsx is exported from the store only when it changed.
+    The store also journals the stage reached by each file of the current run
+    (see STAGES), so that an interrupted run can be told apart and resumed.
+    """
+
+    # Stages of a file, in order. The Textract responses and the LLM results
+    # are cached, so a resumed run doesn't pay for them again.
+    STAGES = ("rasterized", "ocr", "extracted", "corrected", "written")
+
+    TABLES = ("data", "confidence")
+
+    def __init__(self, db_path, columns):
+        """
+        :param db_path: Path of the SQLite database.
+        :param columns: The data columns, ID being one of them.
+        """
+        self.columns = list(columns)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        column_definitions = ", ".join(
+            f'"{column}"' + (" TEXT UNIQUE NOT NULL" if column == "ID" else "")
+            for column in self.columns
+        )
+        with self.connection:
+            for table in self.TABLES:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    f"(position INTEGER PRIMARY KEY, {column_definitions})"
+                )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta "
+                "(key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS journal "
+                "(filename TEXT PRIMARY KEY, id TEXT, stage TEXT, "
+                "updated_at REAL)"
+            )
+            # Extension of the saved image of each check (PNG or JPEG)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS images "
+                "(ID TEXT PRIMARY KEY, extension TEXT NOT NULL)"
+            )
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM data").fetchone()[
+            0
+        ]
+
+    def contains(self, id):
+        """
+        :param id: The check ID.
+        :return: True if the check is in the store.
+        """
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM data WHERE ID = ?", (str(id),)
+            ).fetchone()
+            is not None
+        )
+
+    def insert(self, table, df):
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        placeholders = ", ".join("?" * len(self.columns))
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO {table} ({columns}) "
+            f"VALUES ({placeholders})",
+            (
+                [to_sql_value(value) for value in row]
+                for row in df.reindex(columns=self.columns).itertuples(
+                    index=False, name=None
+                )
+            ),
+        )
+
+    def append(self, df, confidence_df, filenames=()):
+        """
+        Add new checks, in a single transaction.
+
+        :param df: DataFrame of the new checks data.
+        :param confidence_df: DataFrame of the new checks confidences.
+        :param filenames: Filenames of the new checks, journaled as written in
+                          the same transaction.
+        """
+        with self.connection:
+            self.insert("data", df)
+            self.insert("confidence", confidence_df)
+            self.write_stages(zip(filenames, df["ID"]), "written")
+
+    def get_meta(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, value),
+        )
+
+    def get_last_position(self):
+        return self.connection.execute(
+            "SELECT COALESCE(MAX(position), 0) FROM data"
+        ).fetchone()[0]
+
+    def has_unexported_rows(self):
+        """
+        :return: True if checks were added after the last export, e.g. by an
+                 interrupted run.
+        """
+        exported = int(self.get_meta("exported_position") or 0)
+        return self.get_last_position() > exported
+
+    def import_workbook(self, file_path, df, confidence_df):
+        """
+        Replace the checks with the ones of an edited data.xlsx. Checks added
+        after the last export are kept, after the imported ones.
+
+        :param file_path: Path of data.xlsx.
+        :param df: DataFrame of the checks data of data.xlsx.
+        :param confidence_df: DataFrame of their confidences.
+        """
+        df = drop_invalid_ids(df, name=os.path.basename(file_path))
+        confidence_df = drop_invalid_ids(confidence_df)
+        exported = int(self.get_meta("exported_position") or 0)
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        unexported = {}
+        for table in self.TABLES:
+            unexported[table] = pd.read_sql_query(
+                f"SELECT {columns} FROM {table} WHERE ID IN "
+                "(SELECT ID FROM data WHERE position > ?) "
+                "ORDER BY position",
+                self.connection,
+                params=(exported,),
+            )
+            unexported[table] = unexported[table][
+                ~unexported[table]["ID"].isin(df["ID"])
+            ]
+        with self.connection:
+            for table in self.TABLES:
+                self.connection.execute(f"DELETE FROM {table}")
+            self.insert("data", df)
+            self.insert("confidence", confidence_df)
+            self.set_meta(
+                f"export:{file_path}", self.get_file_stamp(file_path)
+            )
+            self.set_meta("exported_position", self.get_last_position())
+            self.insert("data", unexported["data"])
+            self.insert("confidence", unexported["confidence"])
+
+    def read(self):
+        """
+        :return: Tuple (df, confidence_df) with all the checks, in the order
+                 they were added. Confidences follow the order of the data,
+                 row by row (empty for a check without confidences).
+        """
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        df = pd.read_sql_query(
+            f"SELECT {columns} FROM data ORDER BY position", self.connection
+        )
+        confidence_columns = ", ".join(
+            f'{"data" if column == "ID" else "confidence"}."{column}"'
+            for column in self.columns
+        )
+        confidence_df = pd.read_sql_query(
+            f"SELECT {confidence_columns} FROM data "
+            "LEFT JOIN confidence ON confidence.ID = data.ID "
+            "ORDER BY data.position",
+            self.connection,
+        )
+        return df, confidence_df
+
+    def get_file_stamp(self, file_path):
+        try:
+            stat = os.stat(file_path)
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+        except FileNotFoundError:
+            return None
+
+    def export_changed(self, file_path):
+        """
+        :param file_path: Path of the exported data.xlsx.
+        :return: True if the file was changed (or removed) since the store
+                 exported it, or was never imported into the store.
+        """
+        stamp = self.get_file_stamp(file_path)
+        return stamp is None or self.get_meta(f"export:{file_path}") != stamp
+
+    def set_exported(self, file_path):
+        """
+        Record that a file was exported with all the checks of the store.
+
+        :param file_path: Path of the exported data.xlsx.
+        """
+        with self.connection:
+            self.set_meta(
+                f"export:{file_path}", self.get_file_stamp(file_path)
+            )
+            self.set_meta("exported_position", self.get_last_position())
+
+    def set_image_extensions(self, extensions):
+        """
+        :param extensions: Iterable of (id, extension) tuples of saved check
+                           images.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO images (ID, extension) VALUES (?, ?)",
+                extensions,
+            )
+
+    def get_image_extensions(self):
+        """
+        :return: Dict of {id: extension} of the saved check images.
+        """
+        return dict(
+            self.connection.execute("SELECT ID, extension FROM images")
+        )
+
+    def write_stages(self, files, stage):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO journal (filename, id, stage, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            [(filename, id, stage, time.time()) for filename, id in files],
+        )
+
+    def set_stage(self, files, stage):
+        """
+        Journal the stage reached by some files.
+
+        :param files: Iterable of (filename, id) tuples.
+        :param stage: One of STAGES.
+        """
+        with self.connection:
+            self.write_stages(files, stage)
+
+    def get_journal(self):
+        """
+        :return: Dict of {filename: (id, stage)} of the files of the current
+                 (or interrupted) run.
+        """
+        rows = self.connection.execute(
+            "SELECT filename, id, stage FROM journal"
+        )
+        return {filename: (id, stage) for filename, id, stage in rows}
+
+    def clear_journal(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM journal")
+
+    def close(self):
+        self.connection.close()
@@ -1,24 +1,126 @@
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from botocore.exceptions import NoCredentialsError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging as logger
 import os
+import random
+import threading
+import time
 
-from utils import calculate_iou
+import numpy as np
+
+from utils import calculate_iou, calculate_iou_matrix
+
+THROTTLING_ERRORS = [
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "LimitExceededException",
+]
+
+RETRYABLE_ERRORS = THROTTLING_ERRORS + ["InternalServerError"]
+
+
+class RateLimiter:
+    """
+    Token bucket that limits the rate of requests sent to Textract.
+    The rate is halved when a request is throttled and slowly recovers up to
+    its initial value after successful requests (AIMD), so the limiter keeps
+    close to the account quota without retry storms.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.1):
+        """
+        :param rate: Maximum number of requests per second.
+        :param capacity: Maximum burst size (default is one second of requests).
+        :param min_rate: Lower bound for the rate after throttling.
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def acquire(self):
+        """
+        Block until a token is available and take it.
+        """
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        """
+        Multiplicative decrease of the rate after a throttling error.
+        """
+        with self.lock:
+            self.refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        """
+        Additive increase of the rate after a successful request.
+        """
+        with self.lock:
+            self.refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
 
 
 class TextractWrapper:
     """Encapsulates Textract functions."""
 
-    def __init__(self, textract_client, s3_resource, sqs_resource):
+    def __init__(
+        self,
+        textract_client,
+        s3_resource,
+        sqs_resource,
+        rate_limiter=None,
+        max_attempts=5,
+        backoff_base=0.5,
+        backoff_cap=20.0,
+    ):
         """
         :param textract_client: A Boto3 Textract client.
         :param s3_resource: A Boto3 Amazon S3 resource.
         :param sqs_resource: A Boto3 Amazon SQS resource.
+        :param rate_limiter: An optional RateLimiter shared by all requests.
+        :param max_attempts: Maximum number of attempts per request.
+        :param backoff_base: Base delay (seconds) of the exponential backoff.
+        :param backoff_cap: Maximum delay (seconds) between two attempts.
         """
         self.textract_client = textract_client
         self.s3_resource = s3_resource
         self.sqs_resource = sqs_resource
+        self.rate_limiter = rate_limiter
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    def backoff(self, attempt):
+        """
+        Sleep using exponential backoff with full jitter.
+
+        :param attempt: The number of the failed attempt (starting at 1).
+        """
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+        time.sleep(random.uniform(0, delay))
 
     def detect_file_text(
         self, *, document_file_name=None, document_bytes=None
@@ -26,6 +128,7 @@ class TextractWrapper:
         """
         Detects text elements in a local image file or from in-memory byte data.
         The image must be in PNG or JPG format.
+        Throttled requests are retried with exponential backoff.
 
         :param document_file_name: The name of a document image file.
         :param document_bytes: In-memory byte data of a document image.
@@ -35,48 +138,73 @@ class TextractWrapper:
         if document_file_name is not None:
             with open(document_file_name, "rb") as document_file:
                 document_bytes = document_file.read()
-        try:
-            response = self.textract_client.detect_document_text(
-                Document={"Bytes": document_bytes}
-            )
-            logger.info("Detected %s blocks.", len(response["Blocks"]))
-        except ClientError:
-            logger.exception("Couldn't detect text.")
-            raise
-        else:
-            return response
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.textract_client.detect_document_text(
+                    Document={"Bytes": document_bytes}
+                )
+                logger.info("Detected %s blocks.", len(response["Blocks"]))
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code in RETRYABLE_ERRORS and attempt < self.max_attempts:
+                    logger.warning(
+                        "Textract request failed with %s (attempt %s).",
+                        code,
+                        attempt,
+                    )
+                    if code in THROTTLING_ERRORS and self.rate_limiter:
+                        self.rate_limiter.throttled()
+                    self.backoff(attempt)
+                    continue
+                logger.exception("Couldn't detect text.")
+                raise
+            else:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.succeeded()
+                return response
 
 
-def initialize_textract(credentials, region):
+def initialize_textract(
+    credentials, region, max_pool_connections=10, requests_per_second=None
+):
     """
     Initialize TextractWrapper with provided AWS credentials and region.
+    All the clients share a single session and the Textract client keeps a
+    pool of HTTP connections sized for the number of concurrent requests.
 
     :param credentials: A dictionary containing 'aws_access_key_id' and 'aws_secret_access_key'.
     :param region: The AWS region.
+    :param max_pool_connections: Size of the Textract HTTP connection pool.
+    :param requests_per_second: Textract quota (TPS) of the account, if any.
     :return: An instance of TextractWrapper.
     """
     try:
-        textract_client = boto3.client(
-            "textract",
-            region_name=region,
-            aws_access_key_id=credentials["aws_access_key_id"],
-            aws_secret_access_key=credentials["aws_secret_access_key"],
-        )
-        s3_resource = boto3.resource(
-            "s3",
+        session = boto3.session.Session(
             region_name=region,
             aws_access_key_id=credentials["aws_access_key_id"],
             aws_secret_access_key=credentials["aws_secret_access_key"],
         )
-        sqs_resource = boto3.resource(
-            "sqs",
-            region_name=region,
-            aws_access_key_id=credentials["aws_access_key_id"],
-            aws_secret_access_key=credentials["aws_secret_access_key"],
+        # Retries are handled by TextractWrapper, together with the rate limiter
+        config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={"total_max_attempts": 1, "mode": "standard"},
         )
+        textract_client = session.client("textract", config=config)
+        s3_resource = session.resource("s3")
+        sqs_resource = session.resource("sqs")
 
+        rate_limiter = (
+            RateLimiter(requests_per_second) if requests_per_second else None
+        )
         textract_wrapper = TextractWrapper(
-            textract_client, s3_resource, sqs_resource
+            textract_client,
+            s3_resource,
+            sqs_resource,
+            rate_limiter=rate_limiter,
         )
         return textract_wrapper
     except NoCredentialsError:
@@ -84,37 +212,95 @@ def initialize_textract(credentials, region):
         return None
 
 
-def process_image(textract_wrapper, image_path):
+def process_image(textract_wrapper, image_path=None, image_bytes=None):
     """
     Process the image using the provided TextractWrapper instance.
 
     :param textract_wrapper: An instance of TextractWrapper.
     :param image_path: The path to the image file.
+    :param image_bytes: In-memory bytes of the image, used instead of image_path.
     :return: The result from TextractWrapper's detect_file_text method.
     """
     try:
-        result = textract_wrapper.detect_file_text(
-            document_file_name=image_path
-        )
+        if image_bytes is not None:
+            result = textract_wrapper.detect_file_text(
+                document_bytes=image_bytes
+            )
+        else:
+            result = textract_wrapper.detect_file_text(
+                document_file_name=image_path
+            )
         return result
     except NoCredentialsError:
         print("Credentials not available.")
         return None
 
 
-def setup_textract():
-    AWS_CREDENTIALS = {
-        "aws_access_key_id": os.environ.get("TEXTRACT_AWS_ACCESS_KEY_ID"),
-        "aws_secret_access_key": os.environ.get(
-            "TEXTRACT_AWS_SECRET_ACCESS_KEY_ID"
-        ),
-    }
+def process_images(textract_wrapper, images, max_workers=4):
+    """
+    Process several images with Textract using a bounded pool of worker threads.
+    At most max_workers requests are in flight at the same time and the results
+    are yielded in the same order as the input images. The images iterable is
+    consumed lazily, a few images ahead of the requests in flight.
+
+    :param textract_wrapper: An instance of TextractWrapper.
+    :param images: Iterable of (key, image_bytes) tuples.
+    :param max_workers: Maximum number of concurrent Textract requests.
+    :return: A generator of (key, result) tuples.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for key, image_bytes in images:
+            future = executor.submit(
+                process_image, textract_wrapper, image_bytes=image_bytes
+            )
+            pending.append((key, future))
+            if len(pending) >= 2 * max_workers:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+
+
+# One Textract session per process, shared by every request
+TEXTRACT = None
+TEXTRACT_LOCK = threading.Lock()
 
-    AWS_REGION = os.environ.get("TEXTRACT_AWS_REGION")
 
-    textract = initialize_textract(AWS_CREDENTIALS, AWS_REGION)
+def setup_textract(max_pool_connections=10):
+    """
+    Get the TextractWrapper of the process, creating it on the first call.
+    The Textract quota of the account (requests per second) is read from the
+    TEXTRACT_TPS environment variable (default is 5).
+
+    :param max_pool_connections: Size of the Textract HTTP connection pool.
+    :return: An instance of TextractWrapper.
+    """
+    global TEXTRACT
+    with TEXTRACT_LOCK:
+        if TEXTRACT is not None:
+            return TEXTRACT
+
+        AWS_CREDENTIALS = {
+            "aws_access_key_id": os.environ.get("TEXTRACT_AWS_ACCESS_KEY_ID"),
+            "aws_secret_access_key": os.environ.get(
+                "TEXTRACT_AWS_SECRET_ACCESS_KEY_ID"
+            ),
+        }
 
-    return textract
+        AWS_REGION = os.environ.get("TEXTRACT_AWS_REGION")
+
+        TEXTRACT_TPS = float(os.environ.get("TEXTRACT_TPS") or 5)
+
+        TEXTRACT = initialize_textract(
+            AWS_CREDENTIALS,
+            AWS_REGION,
+            max_pool_connections=max_pool_connections,
+            requests_per_second=TEXTRACT_TPS,
+        )
+
+        return TEXTRACT
 
 
 def in_top_left_corner(block):
@@ -193,3 +379,86 @@ def extract_detail(box, blocks, max_boxes=1, sep=" "):
         )  # min to be pessimistic
     else:
         return None, 0.0, 0.0
+
+
+def get_block_boxes(blocks):
+    """
+    :param blocks: List of objects with Geometry property containing BoundingBox.
+    :return: Array (blocks, 4) of the (W, H, L, T) bounding boxes.
+    """
+    boxes = []
+    for block in blocks:
+        bounding_box = block.get("Geometry", {}).get("BoundingBox", {})
+        boxes.append(
+            (
+                bounding_box.get("Width", 0),
+                bounding_box.get("Height", 0),
+                bounding_box.get("Left", 0),
+                bounding_box.get("Top", 0),
+            )
+        )
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def select_top_blocks(iou_scores, max_boxes):
+    """
+    Select the max_boxes highest scores, in the same way as extract_detail:
+    scores are streamed in order and, when there are too many, the first of
+    the lowest ones is dropped. On ties, later blocks can replace earlier ones.
+
+    The streamed selection always holds the highest scores seen so far, so
+    it ends with every score above the k-th highest one, the threshold. A
+    block at the threshold is only added while fewer than max_boxes blocks
+    before it score at least the threshold, and the first ones added are the
+    first ones dropped: the last of the added blocks at the threshold are
+    kept.
+
+    :param iou_scores: Array of IoU scores, one per block.
+    :param max_boxes: Maximum number of blocks to select.
+    :return: Array of the selected block indices, in ascending order.
+    """
+    k = min(max_boxes, len(iou_scores))
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    threshold = np.partition(iou_scores, len(iou_scores) - k)[-k]
+    above = iou_scores > threshold
+    at_least = iou_scores >= threshold
+    added_before = np.cumsum(at_least) - at_least
+    tied = np.flatnonzero((iou_scores == threshold) & (added_before < k))
+    kept = tied[len(tied) - (k - np.count_nonzero(above)) :]
+    return np.sort(np.concatenate([np.flatnonzero(above), kept]))
+
+
+def extract_details(fields, blocks, sep=" "):
+    """
+    Extract the details of several boxes at once. Same results as calling
+    extract_detail for each box, with the IoU of all the boxes against all the
+    blocks computed in a single matrix.
+
+    :param fields: Dict of {name: (box, max_boxes)}, box being a (W, H, L, T)
+                   tuple.
+    :param blocks: List of objects with Geometry property containing BoundingBox.
+    :return: Dict of {name: (text, confidence, iou)}.
+    """
+    iou_matrix = calculate_iou_matrix(
+        [box for box, _ in fields.values()], get_block_boxes(blocks)
+    )
+    details = {}
+    for iou_scores, (name, (_, max_boxes)) in zip(iou_matrix, fields.items()):
+        top = select_top_blocks(iou_scores, max_boxes)
+        if len(top) == 0:
+            details[name] = (None, 0.0, 0.0)
+            continue
+        top_blocks = sorted(
+            (blocks[i] for i in top),
+            key=lambda block: (
+                block["Geometry"]["BoundingBox"]["Top"],
+                block["Geometry"]["BoundingBox"]["Left"],
+            ),
+        )
+        details[name] = (
+            sep.join(block.get("Text", "") for block in top_blocks),
+            min(block.get("Confidence", 0.0) for block in top_blocks),
+            float(iou_scores[top].min()),  # min to be pessimistic
+        )
+    return details
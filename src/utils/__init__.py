@@ -1,7 +1,11 @@
+import io
 import uuid
 import re
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz
+import numpy as np
 from PIL import Image
 
 
@@ -37,21 +41,92 @@ def calculate_iou(box1: tuple[float], box2: tuple[float]) -> float:
     return iou
 
 
-def pdf_to_img(file_name: str, folder: str, resolution: int = 300) -> Image:
+def calculate_iou_matrix(boxes1, boxes2):
+    """
+    Calculate the IoU of every pair of bounding boxes of two lists, computed
+    like calculate_iou.
+
+    :param boxes1: Array (m, 4) of (W, H, L, T) bounding boxes.
+    :param boxes2: Array (n, 4) of (W, H, L, T) bounding boxes.
+    :return: Array (m, n) of IoU scores.
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(1, -1, 4)
+    w1, h1, l1, t1 = np.moveaxis(boxes1, -1, 0)
+    w2, h2, l2, t2 = np.moveaxis(boxes2, -1, 0)
+
+    intersection_width = np.minimum(l1 + w1, l2 + w2) - np.maximum(l1, l2)
+    intersection_height = np.minimum(t1 + h1, t2 + h2) - np.maximum(t1, t2)
+    intersection_area = np.maximum(0, intersection_width) * np.maximum(
+        0, intersection_height
+    )
+    union_area = w1 * h1 + w2 * h2 - intersection_area
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(union_area > 0, intersection_area / union_area, 0.0)
+    return iou
+
+
+def get_page_count(file_name: str, folder: str) -> int:
+    """
+    Get the number of pages of a PDF file, without rendering them.
+
+    :param file_name: The PDF filename.
+    :param folder: The folder of the PDF file.
+    :return: The number of pages, 0 if the file can't be opened.
+    """
+    try:
+        with fitz.open(os.path.join(folder, file_name)) as file_handle:
+            return file_handle.page_count
+    except Exception as e:
+        print(f"Error: Unable to open '{file_name}'. {e}")
+        return 0
+
+
+def list_pdf_pages(file_names, folder):
+    """
+    List the pages of several PDF files. Each page is a check.
+
+    :param file_names: Iterable of PDF filenames.
+    :param folder: The folder of the PDF files.
+    :return: A list of (file_name, page) tuples, pages starting at 0.
+    """
+    return [
+        (file_name, page)
+        for file_name in file_names
+        for page in range(get_page_count(file_name, folder))
+    ]
+
+
+def get_page_name(file_name: str, page: int) -> str:
+    """
+    Name a page of a PDF file in messages, e.g. 'scan.pdf#2' for its second
+    page. The first page is named after the file.
+
+    :param file_name: The PDF filename.
+    :param page: The page, starting at 0.
+    :return: The name of the page.
+    """
+    return file_name if page == 0 else f"{file_name}#{page + 1}"
+
+
+def pdf_to_img(
+    file_name: str, folder: str, resolution: int = 300, page: int = 0
+) -> Image:
     file_path = os.path.join(folder, file_name)
-    file_handle = fitz.open(file_path)
 
-    # Get the first page
-    page = file_handle[0]
+    # Only the requested page is loaded and rendered
+    with fitz.open(file_path) as file_handle:
+        pdf_page = file_handle[page]
 
-    # Set resolution (DPI) for the image
-    zoom_factor = (
-        resolution / 72.0
-    )  # 72 DPI is the default resolution in get_pixmap
-    matrix = fitz.Matrix(zoom_factor, zoom_factor)
+        # Set resolution (DPI) for the image
+        zoom_factor = (
+            resolution / 72.0
+        )  # 72 DPI is the default resolution in get_pixmap
+        matrix = fitz.Matrix(zoom_factor, zoom_factor)
 
-    # Get the pixmap of the page with higher resolution
-    pixmap = page.get_pixmap(matrix=matrix)
+        # Get the pixmap of the page with higher resolution
+        pixmap = pdf_page.get_pixmap(matrix=matrix)
 
     # Convert the pixmap to a PIL Image
     img = Image.frombytes("RGB", [pixmap.width, pixmap.height], pixmap.samples)
@@ -59,6 +134,138 @@ def pdf_to_img(file_name: str, folder: str, resolution: int = 300) -> Image:
     return img
 
 
+def img_to_bytes(img: Image, format: str = "PNG", **kwargs) -> bytes:
+    """
+    Encode a PIL image in memory.
+
+    :param img: The PIL image object.
+    :param format: The image format (default is 'PNG').
+    :param kwargs: Extra options for the encoder (e.g. quality for JPEG).
+    :return: The encoded image bytes.
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
+
+
+def encode_image(
+    img: Image,
+    resolution: int = 300,
+    max_bytes: int = 1000000,
+    grayscale: bool = True,
+    min_resolution: int = 150,
+) -> tuple[bytes, str]:
+    """
+    Encode an image for Textract, trying to stay under a byte budget.
+    Encodings are tried from best to worst quality: PNG, JPEG with decreasing
+    quality and finally JPEG at lower resolutions (never under min_resolution,
+    which is the minimum recommended for OCR). The first one that fits the
+    budget is returned, or the smallest one if none of them fits.
+
+    :param img: The PIL image rendered at the given resolution.
+    :param resolution: The resolution (DPI) the image was rendered at.
+    :param max_bytes: The target size of the encoded image in bytes.
+    :param grayscale: Whether to convert the image to grayscale.
+    :param min_resolution: The lowest resolution (DPI) that can be used.
+    :return: Tuple (image_bytes, extension) of the encoded image.
+    """
+    if grayscale:
+        img = img.convert("L")
+
+    smallest = None  # (image_bytes, extension) of the smallest encoding
+
+    def fits(image_bytes, extension):
+        nonlocal smallest
+        if smallest is None or len(image_bytes) < len(smallest[0]):
+            smallest = (image_bytes, extension)
+        return len(image_bytes) <= max_bytes
+
+    image_bytes = img_to_bytes(img, format="PNG", compress_level=1)
+    if fits(image_bytes, ".png"):
+        return image_bytes, ".png"
+
+    for quality in (90, 80, 70):
+        image_bytes = img_to_bytes(img, format="JPEG", quality=quality)
+        if fits(image_bytes, ".jpg"):
+            return image_bytes, ".jpg"
+
+    for scale in (0.75, 0.5):
+        if resolution * scale < min_resolution:
+            break
+        size = (round(img.width * scale), round(img.height * scale))
+        resized = img.resize(size, Image.LANCZOS)
+        image_bytes = img_to_bytes(resized, format="JPEG", quality=80)
+        if fits(image_bytes, ".jpg"):
+            return image_bytes, ".jpg"
+
+    return smallest
+
+
+def rasterize_pdf(
+    file_name: str,
+    folder: str,
+    resolution: int = 300,
+    max_bytes: int = 1000000,
+    grayscale: bool = True,
+    page: int = 0,
+) -> tuple[bytes, str]:
+    """
+    Render a page of a PDF file and encode it for Textract.
+    This function is meant to run in a process pool.
+
+    :param file_name: The PDF filename.
+    :param folder: The folder of the PDF file.
+    :param page: The page to render, starting at 0.
+    :param resolution: The resolution (DPI) used to render the page.
+    :param max_bytes: The target size of the encoded image in bytes.
+    :param grayscale: Whether to convert the image to grayscale.
+    :return: Tuple (image_bytes, extension) of the encoded image.
+    """
+    img = pdf_to_img(file_name, folder, resolution, page=page)
+    return encode_image(
+        img, resolution=resolution, max_bytes=max_bytes, grayscale=grayscale
+    )
+
+
+def rasterize_pdfs(pages, folder, max_workers=2, **settings):
+    """
+    Rasterize pages of PDF files in a process pool, one task per page, so the
+    pages of a multi-page file are rasterized in parallel too.
+    Only a few pages are rasterized ahead of the consumer, so encoded images
+    don't pile up in memory when OCR is slower than rasterization. A page that
+    can't be rasterized (e.g. a corrupt file) is reported and skipped by the
+    consumer, the other pages go on.
+
+    :param pages: Iterable of (file_name, page) tuples (see list_pdf_pages).
+    :param folder: The folder of the PDF files.
+    :param max_workers: Number of worker processes.
+    :param settings: Keyword arguments for rasterize_pdf.
+    :return: A generator of ((file_name, page), (image_bytes, extension))
+             tuples, in the same order as pages. The encoded image is None
+             for a page that couldn't be rasterized.
+    """
+
+    def result(item, future):
+        try:
+            return item, future.result()
+        except Exception as e:
+            page_name = get_page_name(*item)
+            print(f"Error: Unable to rasterize '{page_name}'. {e}")
+            return item, None
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for file_name, page in pages:
+            future = executor.submit(
+                rasterize_pdf, file_name, folder, page=page, **settings
+            )
+            pending.append(((file_name, page), future))
+            if len(pending) >= 2 * max_workers:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+
+
 def generate_id() -> str:
     id = str(uuid.uuid4())
     return id
@@ -0,0 +1,134 @@
+import os
+import time
+
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+
+class FolderWatcher:
+    """
+    Wait for PDF files to land in a folder. Changes are notified by the OS
+    (e.g. inotify) through watchfiles when it's installed, and the folder is
+    polled otherwise. The folder is also scanned every poll_interval seconds
+    with watchfiles, in case a notification is lost (e.g. on network shares).
+
+    Scanners write files progressively, so a file is ready once its size and
+    modification time stay the same for settle_time seconds. Each version of a
+    file is returned once: a file left in the folder (e.g. of an unknown bank)
+    is returned again only if it's replaced.
+    """
+
+    def __init__(
+        self,
+        folder_path,
+        settle_time=1.0,
+        poll_interval=2.0,
+        force_polling=False,
+    ):
+        """
+        :param folder_path: Path of the watched folder.
+        :param settle_time: Seconds a file must stay unchanged to be ready.
+        :param poll_interval: Seconds between two scans of the folder.
+        :param force_polling: Whether to poll even if watchfiles is installed.
+        """
+        self.folder_path = os.path.abspath(folder_path)
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.settling = {}  # filename -> (stamp, time it was first seen)
+        self.returned = {}  # filename -> stamp
+        self.changes = None
+        if watchfiles is not None and not force_polling:
+            self.changes = watchfiles.watch(
+                self.folder_path,
+                debounce=int(settle_time * 1000),
+                rust_timeout=int(poll_interval * 1000),
+                yield_on_timeout=True,
+            )
+
+    @property
+    def backend(self):
+        return "notifications" if self.changes is not None else "polling"
+
+    def scan(self):
+        """
+        :return: Sorted list of the filenames of the PDF files that became
+                 ready since the last scan.
+        """
+        now = time.monotonic()
+        ready = []
+        stamps = {}
+        try:
+            entries = list(os.scandir(self.folder_path))
+        except FileNotFoundError:
+            print(f"Error: Folder '{self.folder_path}' not found.")
+            entries = []
+        for entry in entries:
+            if not entry.name.lower().endswith(".pdf"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            stamps[entry.name] = stamp
+            if self.returned.get(entry.name) == stamp:
+                continue
+            settling = self.settling.get(entry.name)
+            if settling is None or settling[0] != stamp:
+                self.settling[entry.name] = (stamp, now)
+            elif now - settling[1] >= self.settle_time:
+                ready.append(entry.name)
+                self.returned[entry.name] = stamp
+                del self.settling[entry.name]
+
+        # Forget the files that were moved or removed
+        self.settling = {f: s for f, s in self.settling.items() if f in stamps}
+        self.returned = {f: s for f, s in self.returned.items() if f in stamps}
+        return sorted(ready)
+
+    def forget(self, filenames):
+        """
+        Return files again once they're ready, even if they're unchanged
+        (e.g. files of a batch that failed, to retry them).
+
+        :param filenames: List of filenames returned by scan or wait.
+        """
+        for filename in filenames:
+            self.returned.pop(filename, None)
+
+    def wait(self, timeout=None):
+        """
+        Wait for PDF files to be ready.
+
+        :param timeout: Maximum number of seconds to wait, or None to wait
+                        until a file is ready.
+        :return: Sorted list of the filenames of the ready PDF files, empty if
+                 the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ready = self.scan()
+            if ready:
+                return ready
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+            if self.changes is not None and not self.settling:
+                # Idle: sleep until the OS notifies a change (or a poll)
+                next(self.changes)
+            else:
+                delay = (
+                    self.settle_time if self.settling else self.poll_interval
+                )
+                time.sleep(
+                    min(delay, remaining) if remaining is not None else delay
+                )
+
+    def close(self):
+        if self.changes is not None:
+            self.changes.close()
+            self.changes = None
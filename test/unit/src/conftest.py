@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules in src import each other as top-level packages (e.g. `from utils
+# import get_id`), as they do when running main.py from the src folder.
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "src")
+)
@@ -0,0 +1,260 @@
+from src import cache
+import json
+import os
+import pytest
+import sqlite3
+
+
+@pytest.fixture(autouse=True)
+def _close_databases():
+    cache.close_all()
+    yield
+    cache.close_all()
+
+
+RESPONSE = {
+    "Blocks": [
+        {
+            "BlockType": "LINE",
+            "Text": "BANCO PICHINCHA",
+            "Confidence": 99.5,
+            "Geometry": {
+                "BoundingBox": {
+                    "Width": 0.3,
+                    "Height": 0.05,
+                    "Left": 0.05,
+                    "Top": 0.1,
+                }
+            },
+        }
+    ]
+}
+
+
+def test_get_content_key_ignores_filename(tmp_path) -> None:
+    (tmp_path / "a.pdf").write_bytes(b"%PDF check")
+    (tmp_path / "b.pdf").write_bytes(b"%PDF check")
+    (tmp_path / "c.pdf").write_bytes(b"%PDF other check")
+    settings = {"resolution": 300}
+
+    key_a = cache.get_content_key(tmp_path / "a.pdf", settings)
+    key_b = cache.get_content_key(tmp_path / "b.pdf", settings)
+    key_c = cache.get_content_key(tmp_path / "c.pdf", settings)
+
+    assert key_a == key_b
+    assert key_a != key_c
+    assert key_a != cache.get_content_key(
+        tmp_path / "a.pdf", {"resolution": 150}
+    )
+
+
+def test_content_key_hit_under_another_filename(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+
+    cache.write_to_cache(RESPONSE, "first-id", cache_folder, key="abc")
+
+    assert cache.check_if_cached("rescan.pdf", cache_folder, key="abc")
+    assert cache.read_cache("rescan.pdf", cache_folder, key="abc") == RESPONSE
+    assert cache.get_cached_id("abc", cache_folder) == "first-id"
+    assert not cache.check_if_cached("rescan.pdf", cache_folder, key="xyz")
+
+
+def test_page_keys(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+    cache.write_to_cache(RESPONSE, "first-id", cache_folder, key="abc")
+
+    assert cache.get_page_key("abc", 0) == "abc"
+    assert cache.get_page_key("abc", 1) == "abc:1"
+    # other pages are only found by their key, not by the filename
+    assert not cache.check_if_cached(
+        None, cache_folder, key=cache.get_page_key("abc", 1)
+    )
+    assert cache.check_if_cached(None, cache_folder, key="abc")
+
+
+def test_index_maps_filenames_to_keys(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+    cache.write_to_cache(RESPONSE, "first-id", cache_folder, key="abc")
+
+    # the index is persisted and read back by a new process
+    cache.close_all()
+
+    assert cache.check_if_cached("first-id.pdf", cache_folder)
+    assert cache.read_cache("first-id.pdf", cache_folder) == RESPONSE
+    assert cache.get_cached_id("abc", cache_folder) == "first-id"
+
+
+def test_cache_entries_named_after_ids_are_read(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+    cache.write_to_cache(RESPONSE, "old-id", cache_folder)
+
+    assert cache.check_if_cached("old-id.pdf", cache_folder, key="abc")
+    assert cache.read_cache("old-id.pdf", cache_folder) == RESPONSE
+
+
+FULL_RESPONSE = {
+    "Blocks": [
+        {"BlockType": "PAGE", "Id": "0"},
+        {
+            "BlockType": "LINE",
+            "Text": "BANCO PICHINCHA",
+            "Confidence": 99.84,
+            "Geometry": {
+                "BoundingBox": {
+                    "Width": 0.31,
+                    "Height": 0.04,
+                    "Left": 0.05,
+                    "Top": 0.07,
+                },
+                "Polygon": [{"X": 0.05, "Y": 0.07}],
+            },
+            "Relationships": [{"Type": "CHILD", "Ids": ["2"]}],
+        },
+        {"BlockType": "WORD", "Text": "BANCO", "Confidence": 99.9},
+        {
+            "BlockType": "LINE",
+            "Text": "QUITO, 2024-02-20 ñ",
+            "Confidence": 97.5,
+            "Geometry": {
+                "BoundingBox": {
+                    "Width": 0.2,
+                    "Height": 0.05,
+                    "Left": 0.04,
+                    "Top": 0.45,
+                }
+            },
+        },
+    ]
+}
+
+
+def test_record_keeps_line_fields() -> None:
+    res = cache.decode_record(cache.encode_record(FULL_RESPONSE))
+
+    lines = [b for b in FULL_RESPONSE["Blocks"] if b["BlockType"] == "LINE"]
+    assert len(res["Blocks"]) == len(lines)
+    for block, line in zip(res["Blocks"], lines):
+        assert block["BlockType"] == "LINE"
+        assert block["Text"] == line["Text"]
+        assert block["Confidence"] == line["Confidence"]
+        assert (
+            block["Geometry"]["BoundingBox"]
+            == line["Geometry"]["BoundingBox"]
+        )
+
+
+def test_write_to_cache_keeps_full_response(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+
+    cache.write_to_cache(
+        FULL_RESPONSE, "first-id", cache_folder, key="abc", keep_full=True
+    )
+
+    assert len(cache.read_cache("x.pdf", cache_folder, key="abc")["Blocks"]) == 2
+    assert cache.read_full_response("abc", cache_folder) == FULL_RESPONSE
+
+
+def test_migrate_cache(tmp_path) -> None:
+    cache_folder = tmp_path / "cache"
+    cache_folder.mkdir()
+    (cache_folder / "old-id.json").write_text(json.dumps(FULL_RESPONSE))
+    (cache_folder / "broken.json").write_text("{")
+    (cache_folder / "abc.bin").write_bytes(cache.encode_record(RESPONSE))
+    (cache_folder / "index.jsonl").write_text(
+        json.dumps({"id": "first-id", "key": "abc"}) + "\n"
+    )
+
+    migrated, failed = cache.migrate_cache(str(cache_folder), keep_full=True)
+
+    assert (migrated, failed) == (2, 1)
+    files = os.listdir(cache_folder)
+    assert "broken.json" in files
+    assert not set(["old-id.json", "abc.bin", "index.jsonl"]) & set(files)
+    res = cache.read_cache("old-id.pdf", str(cache_folder))
+    assert [b["Text"] for b in res["Blocks"]] == [
+        "BANCO PICHINCHA",
+        "QUITO, 2024-02-20 ñ",
+    ]
+    assert cache.read_full_response("old-id", str(cache_folder)) == FULL_RESPONSE
+    assert cache.read_cache("first-id.pdf", str(cache_folder)) == RESPONSE
+
+
+def test_legacy_files_are_imported_on_first_use(tmp_path) -> None:
+    cache_folder = tmp_path / "cache"
+    cache_folder.mkdir()
+    (cache_folder / "old-id.json").write_text(json.dumps(RESPONSE))
+
+    assert cache.read_cache("old-id.pdf", str(cache_folder)) == RESPONSE
+    # the full response is kept until the cache is migrated
+    assert (cache_folder / "old-id.json").exists()
+    assert cache.read_full_response("old-id", str(cache_folder)) is None
+
+    # imported only once
+    cache.close_all()
+    database = cache.connect(str(cache_folder))
+    assert cache.import_legacy_files(database, remove=False) == (0, 0)
+
+    migrated, _ = cache.migrate_cache(str(cache_folder), keep_full=True)
+    assert migrated == 1
+    assert not (cache_folder / "old-id.json").exists()
+    assert cache.read_full_response("old-id", str(cache_folder)) == RESPONSE
+
+
+def test_legacy_files_are_only_looked_for_once(tmp_path, monkeypatch) -> None:
+    cache_folder = tmp_path / "cache"
+    cache.connect(str(cache_folder))
+    cache.close_all()
+    (cache_folder / "old-id.json").write_text(json.dumps(RESPONSE))
+
+    def has_legacy_files(cache_folder):
+        raise AssertionError("the cache folder is scanned again")
+
+    monkeypatch.setattr(cache, "has_legacy_files", has_legacy_files)
+    assert not cache.check_if_cached("old-id.pdf", str(cache_folder))
+
+    # migrate_cache still imports them
+    assert cache.migrate_cache(str(cache_folder)) == (1, 0)
+    assert cache.read_cache("old-id.pdf", str(cache_folder)) == RESPONSE
+
+
+def test_write_to_cache_evicts_least_recently_used(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+    size = len(cache.encode_record(RESPONSE))
+    for key in ["a", "b", "c"]:
+        cache.write_to_cache(RESPONSE, f"{key}-id", cache_folder, key=key)
+    cache.read_cache("a-id.pdf", cache_folder)  # "b" is now the oldest
+
+    cache.write_to_cache(
+        RESPONSE, "d-id", cache_folder, key="d", max_bytes=3 * size
+    )
+
+    assert not cache.check_if_cached("b-id.pdf", cache_folder)
+    for key in ["a", "c", "d"]:
+        assert cache.check_if_cached(f"{key}-id.pdf", cache_folder)
+    assert cache.connect(cache_folder).total_size == 3 * size
+
+
+def test_write_to_cache_evicts_old_entries(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+    cache.write_to_cache(RESPONSE, "a-id", cache_folder, key="a")
+    database = cache.connect(cache_folder)
+    with database.connection:
+        database.connection.execute("UPDATE entries SET accessed_at = 0")
+
+    cache.write_to_cache(RESPONSE, "b-id", cache_folder, key="b", max_age=60)
+
+    assert not cache.check_if_cached("a-id.pdf", cache_folder)
+    assert cache.check_if_cached("b-id.pdf", cache_folder)
+
+
+def test_cache_can_be_read_by_another_connection(tmp_path) -> None:
+    cache_folder = str(tmp_path / "cache")
+    cache.write_to_cache(RESPONSE, "a-id", cache_folder, key="a")
+
+    reader = sqlite3.connect(os.path.join(cache_folder, "cache.db"))
+    record = reader.execute(
+        "SELECT record FROM entries WHERE key = 'a'"
+    ).fetchone()[0]
+    reader.close()
+
+    assert cache.decode_record(record) == RESPONSE
@@ -0,0 +1,121 @@
+from src.data import (
+    TerritoryIndex,
+    is_in_territories,
+    load_territories,
+    normalize_place,
+)
+import os
+import pickle
+import pytest
+
+PLACES = ["quito", "santo domingo", "santo domingo de los tsachilas", "loja"]
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("  Santo   Domingo ", "santo domingo"),
+        ("CAÑAR", "canar"),
+        ("Baños-de Agua Santa", "banos de agua santa"),
+        ("", ""),
+        (None, ""),
+    ],
+)
+def test_normalize_place(text: str, expected: str) -> None:
+    assert normalize_place(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("city", "expected"),
+    [
+        ("QUITO", True),
+        ("Santo Domingo", True),
+        ("SANTO DOMINGO DE LOS TSACHILAS", True),
+        ("DOMINGO SANTO", False),  # words of a place in another order
+        ("SANTO", False),
+        ("QUITO LOJA", False),
+        ("", False),
+    ],
+)
+def test_is_in_territories(city: str, expected: bool) -> None:
+    assert is_in_territories(city, TerritoryIndex(PLACES)) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("QUITO D M", "quito"),
+        (
+            "SANTO DOMINGO DE LOS TSACHILAS 20 FEB",
+            "santo domingo de los tsachilas",
+        ),
+        ("STO DOMINGO", None),
+        ("LOJA SANTO DOMINGO", "santo domingo"),
+        ("LOJA QUITO", "loja"),
+        ("", None),
+    ],
+)
+def test_extract(text: str, expected: str) -> None:
+    assert TerritoryIndex(PLACES).extract(text) == expected
+
+
+def test_load_territories_uses_prebuilt_index(tmp_path) -> None:
+    file_path = tmp_path / "territories.txt"
+    index_path = str(tmp_path / "territories.pickle")
+    file_path.write_text("quito\nsanto domingo\n")
+
+    index = load_territories(str(file_path), index_path)
+    assert os.path.exists(index_path)
+    assert "SANTO DOMINGO" in index
+
+    # the prebuilt index is used while the file doesn't change
+    with open(index_path, "rb") as file:
+        prebuilt = file.read()
+    assert "QUITO" in load_territories(str(file_path), index_path)
+    with open(index_path, "rb") as file:
+        assert file.read() == prebuilt
+
+    file_path.write_text("loja\n")
+    index = load_territories(str(file_path), index_path)
+    assert "LOJA" in index
+    assert "QUITO" not in index
+
+
+def test_territories_file_covers_multi_word_places(tmp_path) -> None:
+    root = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+    index = load_territories(
+        os.path.join(root, "src", "data", "data", "territories.txt"),
+        str(tmp_path / "territories.pickle"),
+    )
+
+    assert "SANTO DOMINGO DE LOS TSACHILAS" in index
+    assert "PUERTO BAQUERIZO MORENO" in index
+    assert "DE" not in index
+
+
+def test_load_territories_rebuilds_incompatible_index(tmp_path) -> None:
+    file_path = tmp_path / "territories.txt"
+    index_path = tmp_path / "territories.pickle"
+    file_path.write_text("quito\n")
+    # pickled by a version with another module layout
+    index_path.write_bytes(
+        pickle.dumps({"file_hash": "x", "index": TerritoryIndex([])}).replace(
+            b"TerritoryIndex", b"MissingIndex__"
+        )
+    )
+
+    assert "QUITO" in load_territories(str(file_path), str(index_path))
+    assert "QUITO" in load_territories(str(file_path), str(index_path))
+
+
+def test_load_territories_warns_on_one_word_per_line(tmp_path, capsys) -> None:
+    file_path = tmp_path / "territories.txt"
+    file_path.write_text("quito\nsanto\ndomingo\n")
+
+    load_territories(str(file_path), str(tmp_path / "territories.pickle"))
+
+    assert "seems to have one word per line" in capsys.readouterr().out
+
+    file_path.write_text("quito\nsanto domingo\n")
+    load_territories(str(file_path), str(tmp_path / "territories.pickle"))
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,176 @@
+from src.extractor import (
+    BankMatcher,
+    compile_plans,
+    fold_ocr_text,
+    get_bank_code,
+    run_plan,
+)
+from src.constants import BANK_FIELDS, BANK_NAMES, BOXES, COLUMNS_MAP, FIELDS
+from src.data import TerritoryIndex
+from src.names import NameMatcher
+import pytest
+
+BANK_CODES = [
+    "produbanco",
+    "austro",
+    "banecuador",
+    "guayaquil",
+    "internacional",
+    "pichincha",
+]
+
+
+def _block(text, top=0.1, left=0.1):
+    return {
+        "Text": text,
+        "Geometry": {"BoundingBox": {"Top": top, "Left": left}},
+    }
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("Banco Pichincha", "banco pichincha"),
+        ("PICHLNCHA", "pichincha"),
+        ("Banco lnternacional", "banco intemacionai"),
+        ("BANCO DEL AUSTR0", "banco dei austro"),
+    ],
+)
+def test_fold_ocr_text(text: str, expected: str) -> None:
+    assert fold_ocr_text(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("BANCO PICHINCHA C.A.", "pichincha"),
+        ("Banco Pichlncha", "pichincha"),
+        ("BANCO INTERNACIONAL", "internacional"),
+        ("Banco del Austro", "austro"),
+        ("AUSTRO PRODUBANCO", "produbanco"),  # priority of BANK_CODES
+        ("BANCO GUAYAQUIL", "guayaquil"),
+        ("PAGUESE A LA ORDEN DE", None),
+    ],
+)
+def test_bank_matcher_find(text: str, expected: str) -> None:
+    assert BankMatcher(BANK_CODES).find(text) == expected
+
+
+def test_get_bank_code_checks_top_left_blocks_in_order() -> None:
+    blocks = [
+        _block("BANCO PICHINCHA", top=0.8),  # not in the top left corner
+        _block("PAGUESE A LA ORDEN DE"),
+        _block("Banco Guayaquil"),
+        _block("Produbanco"),
+    ]
+
+    assert get_bank_code(BANK_CODES, blocks) == "guayaquil"
+    assert get_bank_code(BANK_CODES, blocks[:2]) is None
+
+
+def test_get_bank_code_tolerates_one_edit() -> None:
+    blocks = [_block("BANCO PICHINCA"), _block("BANECUADOR B.P.", top=0.9)]
+
+    assert get_bank_code(BANK_CODES, blocks) == "pichincha"
+    assert get_bank_code(BANK_CODES, [_block("BANCO PICHIN")]) is None
+
+
+def _plans():
+    return compile_plans(BOXES, FIELDS, BANK_FIELDS, COLUMNS_MAP, BANK_NAMES)
+
+
+def test_compile_plans() -> None:
+    plans = _plans()
+
+    assert set(plans) == set(BOXES)
+    assert plans["pichincha"].boxes["ACCOUNT_NAME"][1] == 2
+    assert plans["austro"].boxes["ACCOUNT_NAME"][1] == 1
+    assert plans["austro"].bank_name == "BANCO DEL AUSTRO"
+    with pytest.raises(ValueError):
+        compile_plans(
+            BOXES,
+            {**FIELDS, "AMOUNT": {"parser": "unknown"}},
+            BANK_FIELDS,
+            COLUMNS_MAP,
+            BANK_NAMES,
+        )
+
+
+def test_run_plan() -> None:
+    details = {
+        "ACCOUNT_NAME": ("Empresa S.A.", 91.0, 0.5),
+        "ACCOUNT_NUMBER": ("Cta. 1234", 98.0, 0.5),
+        "AMOUNT": ("USD", 96.0, 0.5),
+        "CHECK_NUMBER": ("5678", 97.0, 0.5),
+        "CLIENT_NAME": ("Juán Pérez", 95.0, 0.5),
+        "PLACE_AND_DATE": ("Quito D.M., 2024/02/20", 93.0, 0.5),
+    }
+    row, confidence_row = {}, {}
+
+    llm_requests = run_plan(
+        _plans()["pichincha"],
+        details,
+        row,
+        confidence_row,
+        {"territories": TerritoryIndex(["quito"])},
+    )
+
+    assert row == {
+        "NOMBRE-CUENTA": "EMPRESA SA",
+        "NUMERO-CUENTA": "1234",
+        "VALOR": 0,
+        "CHEQUE": "5678",
+        "BENEFICIARIO": "JUAN PEREZ",
+        "FECHA": "2024-02-20",
+        "CIUDAD": "QUITO",
+    }
+    assert confidence_row == {
+        "NOMBRE-CUENTA": 91.0,
+        "NUMERO-CUENTA": -1,  # too short
+        "VALOR": -1,  # no amount
+        "CHEQUE": -1,  # as long as the account number
+        "BENEFICIARIO": 95.0,
+        "FECHA": 93.0,
+        "CIUDAD": 93.0,
+    }
+    assert llm_requests == [
+        ("NOMBRE-CUENTA", "ACCOUNT_NAME", "EMPRESA SA"),
+        ("BENEFICIARIO", "CLIENT_NAME", "JUAN PEREZ"),
+        ("FECHA", "DATE", "Quito D.M., 2024/02/20"),
+        ("CIUDAD", "CITY", "QUITO"),
+    ]
+
+
+def test_run_plan_corrects_known_names_without_llm() -> None:
+    details = {
+        "ACCOUNT_NAME": ("Empresa S.A.", 91.0, 0.5),
+        "ACCOUNT_NUMBER": ("1234567890", 98.0, 0.5),
+        "AMOUNT": ("USD", 96.0, 0.5),
+        "CHECK_NUMBER": ("5678", 97.0, 0.5),
+        "CLIENT_NAME": ("Juan Peres", 95.0, 0.5),
+        "PLACE_AND_DATE": ("Quito, 2024/02/20", 93.0, 0.5),
+    }
+    names = {
+        "CLIENT_NAME": NameMatcher(["Juan Pérez"]),
+        "ACCOUNT_NAME": NameMatcher(["ANA SALAZAR"]),
+    }
+    row, confidence_row = {}, {}
+
+    llm_requests = run_plan(
+        _plans()["pichincha"],
+        details,
+        row,
+        confidence_row,
+        {"territories": TerritoryIndex(["quito"]), "names": names},
+    )
+
+    # the name as written in the list of known names
+    assert row["BENEFICIARIO"] == "Juan Pérez"
+    assert names["CLIENT_NAME"].matched == 1
+    assert names["ACCOUNT_NAME"].matched == 0
+    assert row["NOMBRE-CUENTA"] == "EMPRESA SA"
+    assert [key for _, key, _ in llm_requests] == [
+        "ACCOUNT_NAME",
+        "DATE",
+        "CITY",
+    ]
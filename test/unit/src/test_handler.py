@@ -0,0 +1,91 @@
+from src.handler import RowAccumulator, get_confidence_colors, write_data
+from openpyxl import load_workbook
+import pandas as pd
+
+COLUMNS = ["FECHA", "CIUDAD", "VALOR", "ID"]
+
+
+def test_row_accumulator_to_frame() -> None:
+    rows = RowAccumulator(COLUMNS)
+
+    rows.append(
+        {"FECHA": "2024-02-20", "CIUDAD": "QUITO", "VALOR": 125.5, "ID": "id1"}
+    )
+    rows.append({"ID": "id2", "VALOR": 0, "CIUDAD": "CUENCA"})
+
+    assert len(rows) == 2
+    result = rows.to_frame()
+    assert list(result.columns) == COLUMNS
+    assert result["ID"].tolist() == ["id1", "id2"]
+    assert result["VALOR"].tolist() == [125.5, 0]
+    assert result["FECHA"].isna().tolist() == [False, True]
+    assert list(result.index) == [0, 1]
+
+
+def test_row_accumulator_without_rows() -> None:
+    rows = RowAccumulator(COLUMNS)
+
+    assert len(rows) == 0
+    assert list(rows.to_frame().columns) == COLUMNS
+    assert rows.to_frame().empty
+
+
+def test_get_confidence_colors() -> None:
+    confidences = pd.Series([99, 98, 96, 91, 90, 50, 0, -1, None])
+
+    assert get_confidence_colors(confidences).tolist() == [
+        "b0ffb1",
+        "ddffb0",
+        "ddffb0",
+        "fffab0",
+        "f0bca8",
+        "f0bca8",
+        "ffffff",
+        "e9d7fc",
+        "e9d7fc",
+    ]
+
+
+def test_write_data(tmp_path) -> None:
+    columns = ["FECHA", "BANCO", "CIUDAD", "NUMERO-CUENTA"]
+    columns += ["NOMBRE-CUENTA", "BENEFICIARIO", "CHEQUE", "VALOR", "ID"]
+    df = pd.DataFrame(
+        [
+            ["2024-02-20", "BANCO PICHINCHA", "QUITO", "22001", "EMPRESA SA"]
+            + ["JUAN PEREZ", "121", 125.5, "id0"],
+            ["2024-02-21", "PRODUBANCO", None, "22002", "EMPRESA SA"]
+            + ["ANA SALAZAR", "122", 0, "id1"],
+        ],
+        columns=columns,
+    )
+    confidence_df = df.copy()
+    confidence_df[columns[2:-1] + ["FECHA"]] = [
+        [99, 97, 92, 50, 0, -1, 99],
+        [-1, 99, 99, 99, 99, -1, 99],
+    ]
+    data_path = str(tmp_path / "data.xlsx")
+
+    write_data(
+        df, confidence_df, data_path, "checks-ocr/images", {"id1": ".jpg"}
+    )
+
+    ws = load_workbook(data_path)["data"]
+    assert [cell.value for cell in ws[1]] == columns
+    assert [cell.value for cell in ws[3]][:4] == [
+        "2024-02-21",
+        "PRODUBANCO",
+        None,
+        "22002",
+    ]
+    assert [cell.fill.start_color.rgb[2:] for cell in ws[2]][2:8] == [
+        "b0ffb1",
+        "ddffb0",
+        "fffab0",
+        "f0bca8",
+        "ffffff",
+        "e9d7fc",
+    ]
+    assert ws["B2"].fill.fill_type is None  # BANCO has no confidence
+    assert ws["I2"].hyperlink.target == "checks-ocr/images/id0.png"
+    assert ws["I3"].hyperlink.target == "checks-ocr/images/id1.jpg"
+    assert pd.read_excel(data_path)["VALOR"].tolist() == [125.5, 0]
@@ -0,0 +1,366 @@
+from src.llm import (
+    LLMCache,
+    RAG,
+    CachedEmbeddings,
+    NumpyIndex,
+    normalize_text,
+    hash_prompt,
+)
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.runnable import RunnableLambda
+from langchain_core.embeddings import Embeddings
+from langchain.docstore.document import Document
+import asyncio
+import numpy as np
+import json
+import os
+import pytest
+import sys
+
+
+def test_llm_cache_reads_its_writes(tmp_path) -> None:
+    llm_cache = LLMCache(str(tmp_path / "cache" / "results.json"))
+
+    llm_cache.write("a", "QUITO")
+    llm_cache.write("b", "2024-02-20")
+
+    assert llm_cache.read("a") == "QUITO"
+    assert llm_cache.read("b") == "2024-02-20"
+    assert llm_cache.read("c") is None
+
+
+def test_llm_cache_replays_journal(tmp_path) -> None:
+    cache_file_path = str(tmp_path / "cache" / "results.json")
+    llm_cache = LLMCache(cache_file_path)
+    llm_cache.write("a", "QUITO")
+
+    # the cache file is not rewritten on every write
+    assert not os.path.exists(cache_file_path)
+
+    # a crash in the middle of a write leaves a partial line
+    with open(llm_cache.journal_file_path, "a") as file:
+        file.write('{"key": "b", "val')
+
+    reloaded = LLMCache(cache_file_path)
+    assert reloaded.read("a") == "QUITO"
+    assert reloaded.read("b") is None
+
+    # later writes start on a new line and are not lost
+    reloaded.write("c", "LOJA")
+    reloaded.write("d", "CUENCA")
+    reloaded = LLMCache(cache_file_path)
+    assert reloaded.read("a") == "QUITO"
+    assert reloaded.read("c") == "LOJA"
+    assert reloaded.read("d") == "CUENCA"
+
+
+def test_llm_cache_skips_a_partial_line_in_the_journal(tmp_path) -> None:
+    (tmp_path / "cache").mkdir()
+    cache_file_path = str(tmp_path / "cache" / "results.json")
+    llm_cache = LLMCache(cache_file_path)
+    with open(llm_cache.journal_file_path, "w") as file:
+        file.write('{"key": "a", "value": "QUITO"}\n')
+        file.write('{"key": "b", "val\n')
+        file.write('{"key": "c", "value": "LOJA"}\n')
+
+    reloaded = LLMCache(cache_file_path)
+    assert reloaded.read("a") == "QUITO"
+    assert reloaded.read("b") is None
+    assert reloaded.read("c") == "LOJA"
+
+
+def test_llm_cache_compacts_journal(tmp_path) -> None:
+    cache_file_path = str(tmp_path / "cache" / "results.json")
+    llm_cache = LLMCache(cache_file_path, compact_every=3)
+
+    for i in range(4):
+        llm_cache.write(f"key-{i}", f"CITY {i}")
+
+    with open(cache_file_path) as file:
+        assert len(json.load(file)) == 3
+    with open(llm_cache.journal_file_path) as file:
+        assert len(file.readlines()) == 1
+
+    reloaded = LLMCache(cache_file_path)
+    for i in range(4):
+        assert reloaded.read(f"key-{i}") == f"CITY {i}"
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("  Juan   PÉREZ ", "juan perez"),
+        ("QUITO", "quito"),
+        ("", ""),
+        (None, ""),
+    ],
+)
+def test_normalize_text(text: str, expected: str) -> None:
+    assert normalize_text(text) == expected
+
+
+def test_hash_prompt_changes_with_messages() -> None:
+    prompt = ChatPromptTemplate.from_messages([("human", "Text: {text}")])
+    same = ChatPromptTemplate.from_messages([("human", "Text: {text}")])
+    other = ChatPromptTemplate.from_messages([("human", "Name: {text}")])
+
+    assert hash_prompt(prompt) == hash_prompt(same)
+    assert hash_prompt(prompt) != hash_prompt(other)
+
+
+def _rag(tmp_path, model_name="gpt-3.5-turbo-0125", vector_backend="chroma"):
+    # RAG without vector databases nor OpenAI clients
+    rag = RAG.__new__(RAG)
+    rag.model_name = model_name
+    rag.vector_backend = vector_backend
+    rag.prompts = {
+        "CITY": ChatPromptTemplate.from_messages([("human", "City: {text}")]),
+        "DATE": ChatPromptTemplate.from_messages([("human", "Date: {text}")]),
+    }
+    rag.DATA_PATHS = {"territories": str(tmp_path / "territories.txt")}
+    rag.CONTEXTS = {"CITY": "territories", "DATE": None}
+    rag.llm_cache = LLMCache(str(tmp_path / "cache" / "results.json"))
+    rag.cache_versions = {
+        key: rag.get_cache_version(key) for key in rag.prompts
+    }
+    rag.stats = {key: {"hits": 0, "misses": 0} for key in rag.prompts}
+    rag.calls = []
+
+    def get_result(key, text):
+        rag.calls.append((key, text))
+        return text.upper()
+
+    rag.get_result = get_result
+    return rag
+
+
+def test_query_shares_results_across_checks(tmp_path) -> None:
+    rag = _rag(tmp_path)
+
+    assert rag.query("CITY", "id-1", "Quíto") == "QUÍTO"
+    assert rag.query("CITY", "id-2", "QUITO ") == "QUÍTO"
+    assert rag.query("DATE", "id-2", "QUITO") == "QUITO"
+
+    assert rag.calls == [("CITY", "Quíto"), ("DATE", "QUITO")]
+    assert rag.stats["CITY"] == {"hits": 1, "misses": 1}
+    assert rag.stats["DATE"] == {"hits": 0, "misses": 1}
+
+
+def test_print_stats_counts_names_corrected_locally(tmp_path, capsys) -> None:
+    rag = _rag(tmp_path)
+    rag.query("CITY", "id-1", "quito")
+
+    rag.print_stats(local={"CITY": 2})
+
+    assert capsys.readouterr().out.splitlines() == [
+        "- LLM cache hit rate:",
+        "  CITY: 0/1 (0.0%), 2 local",
+        "  DATE: 0/0 (0.0%)",
+    ]
+
+
+def test_query_cache_depends_on_model_and_context(
+    tmp_path, monkeypatch
+) -> None:
+    (tmp_path / "territories.txt").write_text("quito\n")
+    rag = _rag(tmp_path)
+    rag.query("CITY", "id-1", "quito")
+
+    # another model
+    assert _rag(tmp_path, model_name="gpt-4").get_cache_key(
+        "CITY", "quito"
+    ) != rag.get_cache_key("CITY", "quito")
+
+    # another vector backend or number of context entries
+    assert _rag(tmp_path, vector_backend="numpy").get_cache_key(
+        "CITY", "quito"
+    ) != rag.get_cache_key("CITY", "quito")
+    monkeypatch.setattr(sys.modules[RAG.__module__], "CONTEXT_TOP_K", 10)
+    assert _rag(tmp_path).get_cache_key("CITY", "quito") != rag.get_cache_key(
+        "CITY", "quito"
+    )
+    # DATE has no context
+    assert _rag(tmp_path, vector_backend="numpy").get_cache_key(
+        "DATE", "2024"
+    ) == rag.get_cache_key("DATE", "2024")
+
+    # the context was updated
+    (tmp_path / "territories.txt").write_text("quito\nguayaquil\n")
+    updated = _rag(tmp_path)
+    updated.query("CITY", "id-1", "quito")
+    assert updated.calls == [("CITY", "quito")]
+
+
+def test_query_many_deduplicates_and_limits_concurrency(tmp_path) -> None:
+    rag = _rag(tmp_path)
+    in_flight = {"now": 0, "max": 0}
+
+    async def aget_result(key, text):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        rag.calls.append((key, text))
+        return text.upper()
+
+    rag.aget_result = aget_result
+    requests = [("CITY", f"id-{i}", f"city {i % 5}") for i in range(20)]
+    requests.append(("DATE", "id-0", "city 0"))
+
+    results = rag.query_many(requests, max_concurrency=2)
+
+    assert results == [text.upper() for _, _, text in requests]
+    assert len(rag.calls) == 6
+    assert in_flight["max"] == 2
+    assert rag.stats["CITY"] == {"hits": 15, "misses": 5}
+
+    # the results were cached
+    assert rag.query_many([("CITY", "id-9", "city 3")]) == ["CITY 3"]
+    assert len(rag.calls) == 6
+
+
+def test_chains_are_built_once(tmp_path) -> None:
+    rag = _rag(tmp_path)
+    del rag.get_result
+    prompts = []
+
+    def llm(prompt_value):
+        prompts.append(prompt_value.to_string())
+        return "None" if "Date" in prompts[-1] else "Quito"
+
+    def retriever(text):
+        return [
+            Document(page_content="quito"),
+            Document(page_content="ibarra"),
+        ]
+
+    rag.llm = RunnableLambda(llm)
+    rag.vector_db_territories_retriever = RunnableLambda(retriever)
+    rag.vector_db_client_names_retriever = RunnableLambda(retriever)
+    rag.vector_db_account_names_retriever = RunnableLambda(retriever)
+    rag.prompts["CITY"] = ChatPromptTemplate.from_messages(
+        [("human", "City: {text} Context: {context}")]
+    )
+    rag.chains = rag.setup_chains()
+
+    assert rag.get_chain("CITY") is rag.get_chain("CITY")
+    assert rag.get_result("CITY", "QUTO") == "QUITO"
+    assert rag.get_result("DATE", "2024/02/20") == ""
+    assert prompts == [
+        "Human: City: quto Context: quito\nibarra",
+        "Human: Date: 2024/02/20",
+    ]
+
+
+class CountingEmbeddings(Embeddings):
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+
+def test_vector_database_syncs_changed_lines(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    names_path = tmp_path / "client_names.txt"
+    names_path.write_text("ANA SALAZAR\nPEDRO GOMEZ\n\nANA SALAZAR\n")
+    rag = RAG.__new__(RAG)
+    rag.DATA_PATHS = {"client_names": str(names_path)}
+    rag.vector_backend = "chroma"
+    rag.embedding_function = CountingEmbeddings()
+
+    vector_db = rag.setup_vector_database("client_names")
+    assert sorted(rag.embedding_function.embedded) == [
+        "ANA SALAZAR",
+        "PEDRO GOMEZ",
+    ]
+
+    # Unchanged file: nothing to sync
+    rag.embedding_function.embedded.clear()
+    rag.setup_vector_database("client_names")
+    assert rag.embedding_function.embedded == []
+
+    names_path.write_text("ANA SALAZAR\nLUIS TORRES\n")
+    vector_db = rag.setup_vector_database("client_names")
+    assert rag.embedding_function.embedded == ["LUIS TORRES"]
+    assert sorted(vector_db.get()["documents"]) == [
+        "ANA SALAZAR",
+        "LUIS TORRES",
+    ]
+    assert rag.sync_vector_database(vector_db, "client_names") == (0, 0)
+
+    # Another embedding model: every line is embedded again
+    rag.embedding_function.embedded.clear()
+    rag.embedding_function.model = "other-embedding"
+    vector_db = rag.setup_vector_database("client_names")
+    assert sorted(rag.embedding_function.embedded) == [
+        "ANA SALAZAR",
+        "LUIS TORRES",
+    ]
+    assert len(vector_db.get()["ids"]) == 2
+
+
+def test_cached_embeddings_only_embed_new_texts(tmp_path) -> None:
+    cache_path = str(tmp_path / "embeddings.db")
+    counting = CountingEmbeddings()
+    embeddings = CachedEmbeddings(counting, cache_path, batch_size=2)
+
+    first = embeddings.embed_documents(["QUITO", "IBARRA", "QUITO", "LOJA"])
+    assert counting.embedded == ["QUITO", "IBARRA", "LOJA"]
+    assert first[0] == first[2] == counting.embed_query("QUITO")
+
+    # A new process reads the embeddings from disk
+    counting.embedded.clear()
+    embeddings = CachedEmbeddings(counting, cache_path)
+    assert embeddings.embed_documents(["LOJA", "CUENCA"])[0] == first[3]
+    assert counting.embedded == ["CUENCA"]
+
+    # Embeddings of another model are not reused
+    counting.model = "other-embedding"
+    embeddings.embed_documents(["LOJA"])
+    assert counting.embedded == ["CUENCA", "LOJA"]
+
+
+def test_numpy_index_returns_top_k_by_cosine(tmp_path) -> None:
+    embeddings = CountingEmbeddings()
+    texts = ["QUITO", "IBARRA", "LOJA", "CUENCA", "MANTA"]
+    NumpyIndex.from_texts(texts, embeddings).save(str(tmp_path))
+    index = NumpyIndex.load(str(tmp_path), embeddings)
+
+    vectors = NumpyIndex.normalize(embeddings.embed_documents(texts))
+    query = NumpyIndex.normalize(embeddings.embed_query("QUITA"))
+    expected = sorted(
+        texts, key=lambda text: -vectors[texts.index(text)] @ query
+    )
+
+    assert isinstance(index.vectors, np.memmap)
+    assert [text for text, _ in index.search("QUITA", k=3)] == expected[:3]
+    retriever = index.as_retriever(search_kwargs={"k": 2})
+    assert [doc.page_content for doc in retriever.invoke("QUITA")] == (
+        expected[:2]
+    )
+
+
+def test_numpy_index_rebuilds_when_file_changes(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    names_path = tmp_path / "territories.txt"
+    names_path.write_text("QUITO\nLOJA\n")
+    rag = RAG.__new__(RAG)
+    rag.DATA_PATHS = {"territories": str(names_path)}
+    rag.vector_backend = "numpy"
+    rag.embedding_function = CountingEmbeddings()
+
+    assert rag.setup_vector_database("territories").texts == ["QUITO", "LOJA"]
+    assert rag.setup_vector_database("territories").texts == ["QUITO", "LOJA"]
+    assert len(rag.embedding_function.embedded) == 2
+
+    names_path.write_text("QUITO\n")
+    assert rag.setup_vector_database("territories").texts == ["QUITO"]
+    empty = NumpyIndex.from_texts([], rag.embedding_function)
+    assert empty.search("QUITO") == []
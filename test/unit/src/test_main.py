@@ -0,0 +1,309 @@
+from src import main
+from openpyxl import load_workbook
+import fitz
+import os
+import pandas as pd
+import pytest
+import shutil
+
+
+def _response(text):
+    return {
+        "Blocks": [
+            {
+                "BlockType": "LINE",
+                "Text": text,
+                "Confidence": 99.0,
+                "Geometry": {
+                    "BoundingBox": {
+                        "Width": 0.3,
+                        "Height": 0.05,
+                        "Left": 0.05,
+                        "Top": 0.05,
+                    }
+                },
+            }
+        ]
+    }
+
+
+@pytest.fixture
+def checks_folder(tmp_path, monkeypatch):
+    # main.py runs from checks/checks-ocr/src
+    src_folder = tmp_path / "checks-ocr" / "src"
+    src_folder.mkdir(parents=True)
+    (tmp_path / "unprocessed").mkdir()
+    monkeypatch.chdir(src_folder)
+    main.cache.close_all()
+    yield tmp_path
+    main.cache.close_all()
+
+
+def test_ocr_stage_sends_each_page_once(checks_folder, monkeypatch) -> None:
+    doc = fitz.open()
+    for page in range(3):
+        doc.new_page().insert_text((50, 50), f"check {page}")
+    doc.save(str(checks_folder / "unprocessed" / "stack.pdf"))
+    shutil.copy(
+        checks_folder / "unprocessed" / "stack.pdf",
+        checks_folder / "unprocessed" / "copy.pdf",
+    )
+
+    requests = []
+
+    def process_images(t, images, max_workers=4):
+        for (item, id), _ in images:
+            requests.append(item)
+            yield (item, id), _response(f"page {item[1]}")
+
+    monkeypatch.setattr(main.textract, "setup_textract", lambda **_: None)
+    monkeypatch.setattr(main.textract, "process_images", process_images)
+    pages = main.utils.list_pdf_pages(
+        ["stack.pdf", "copy.pdf"], folder="../../unprocessed"
+    )
+
+    extensions = {}
+
+    responses = main.ocr_stage(
+        pages,
+        raster_workers=1,
+        save_extension=lambda id, extension: extensions.update(
+            {id: extension}
+        ),
+    )
+
+    assert requests == [("stack.pdf", 0), ("stack.pdf", 1), ("stack.pdf", 2)]
+    assert len(responses) == 6
+    for page in range(3):
+        id, res = responses[("stack.pdf", page)]
+        assert res["Blocks"][0]["Text"] == f"page {page}"
+        assert responses[("copy.pdf", page)] == (id, res)
+    assert len({id for id, _ in responses.values()}) == 3
+    assert extensions == {id: ".png" for id, _ in responses.values()}
+
+    # a second run reads every page from the cache
+    requests.clear()
+    assert main.ocr_stage(pages, raster_workers=1) == responses
+    assert requests == []
+
+
+def test_process_files_writes_copies_in_one_batch_once(
+    checks_folder, monkeypatch
+) -> None:
+    for filename in ["check.pdf", "copy.pdf"]:
+        (checks_folder / "unprocessed" / filename).write_bytes(b"%PDF")
+    response = _response("BANCO PICHINCHA")
+
+    def ocr_stage(pages, **_):
+        return {item: ("check-id", response) for item in pages}
+
+    monkeypatch.setattr(main, "ocr_stage", ocr_stage)
+    monkeypatch.setattr(
+        main.utils,
+        "list_pdf_pages",
+        lambda filenames, folder: [(f, 0) for f in filenames],
+    )
+    results_store = main.store.ResultsStore("../../results.db", main.COLUMNS)
+    plans = main.extractor.compile_plans(
+        main.BOXES,
+        main.FIELDS,
+        main.BANK_FIELDS,
+        main.COLUMNS_MAP,
+        main.BANK_NAMES,
+    )
+
+    count = main.process_files(
+        ["check.pdf", "copy.pdf"],
+        results_store,
+        plans,
+        {"territories": main.data.TerritoryIndex([])},
+    )
+
+    assert count == 1
+    df, _ = results_store.read()
+    assert list(df["ID"]) == ["check-id"]
+    assert not list((checks_folder / "unprocessed").iterdir())
+    assert [p.name for p in (checks_folder / "processed").iterdir()] == [
+        "check-id.pdf"
+    ]
+
+
+def test_ocr_stage_skips_a_page_that_cannot_be_rasterized(
+    checks_folder, monkeypatch, capsys
+) -> None:
+    doc = fitz.open()
+    for page in range(2):
+        doc.new_page().insert_text((50, 50), f"check {page}")
+    doc.save(str(checks_folder / "unprocessed" / "stack.pdf"))
+    (checks_folder / "unprocessed" / "broken.pdf").write_bytes(b"%PDF-1.7")
+
+    def process_images(t, images, max_workers=4):
+        for (item, id), _ in images:
+            yield (item, id), _response(f"page {item[1]}")
+
+    monkeypatch.setattr(main.textract, "setup_textract", lambda **_: None)
+    monkeypatch.setattr(main.textract, "process_images", process_images)
+    pages = [("broken.pdf", 0), ("stack.pdf", 0), ("stack.pdf", 1)]
+
+    responses = main.ocr_stage(pages, raster_workers=1)
+
+    assert sorted(responses) == [("stack.pdf", 0), ("stack.pdf", 1)]
+    assert "Error: Unable to rasterize 'broken.pdf'." in (
+        capsys.readouterr().out
+    )
+
+
+class FakeWatcher:
+    backend = "fake"
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.forgotten = []
+        self.closed = False
+
+    def wait(self, timeout=None):
+        if not self.batches:
+            raise KeyboardInterrupt
+        return self.batches.pop(0)
+
+    def forget(self, filenames):
+        self.forgotten.extend(filenames)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeStore:
+    def export_changed(self, file_path):
+        return False
+
+    def has_unexported_rows(self):
+        return False
+
+
+def test_watch_folder_survives_a_failed_batch(monkeypatch, capsys) -> None:
+    folder_watcher = FakeWatcher([["bad.pdf"], ["good.pdf"]])
+    monkeypatch.setattr(
+        main.watcher, "FolderWatcher", lambda *_, **__: folder_watcher
+    )
+    monkeypatch.setattr(main.signal, "signal", lambda *_: None)
+    processed = []
+
+    def process(pdf_filenames):
+        if pdf_filenames == ["bad.pdf"]:
+            raise RuntimeError("page could not be rendered")
+        processed.extend(pdf_filenames)
+        return len(pdf_filenames)
+
+    main.watch_folder(process, FakeStore())
+
+    assert processed == ["good.pdf"]
+    assert folder_watcher.forgotten == ["bad.pdf"]
+    assert folder_watcher.closed
+    out = capsys.readouterr().out
+    assert "Error: Unable to process ['bad.pdf']. page could not be" in out
+
+
+def test_watch_folder_retries_a_failed_batch(
+    checks_folder, monkeypatch, capsys
+) -> None:
+    class FolderWatcher(main.watcher.FolderWatcher):
+        def wait(self, timeout=None):
+            # stops instead of waiting forever for a file
+            ready = super().wait(timeout=1)
+            if not ready:
+                raise KeyboardInterrupt
+            return ready
+
+    monkeypatch.setattr(
+        main.watcher,
+        "FolderWatcher",
+        lambda folder_path, **_: FolderWatcher(
+            folder_path, settle_time=0, poll_interval=0.01, force_polling=True
+        ),
+    )
+    monkeypatch.setattr(main.signal, "signal", lambda *_: None)
+    monkeypatch.setattr(main, "sync_results", lambda *_: None)
+    (checks_folder / "unprocessed" / "a.pdf").write_bytes(b"%PDF")
+    batches = []
+
+    def process(pdf_filenames):
+        batches.append(pdf_filenames)
+        if len(batches) == 1:
+            raise RuntimeError("Textract is unavailable")
+        os.remove(os.path.join("../../unprocessed", pdf_filenames[0]))
+        raise KeyboardInterrupt
+
+    main.watch_folder(process, FakeStore())
+
+    # the unchanged file is processed again
+    assert batches == [["a.pdf"], ["a.pdf"]]
+    out = capsys.readouterr().out
+    assert "Error: Unable to process ['a.pdf']. Textract is unavailable" in out
+
+
+class UnexportedStore(FakeStore):
+    def has_unexported_rows(self):
+        return True
+
+
+def test_watch_folder_closes_when_the_last_export_fails(
+    monkeypatch, capsys
+) -> None:
+    folder_watcher = FakeWatcher([])
+    monkeypatch.setattr(
+        main.watcher, "FolderWatcher", lambda *_, **__: folder_watcher
+    )
+    monkeypatch.setattr(main.signal, "signal", lambda *_: None)
+    monkeypatch.setattr(main, "sync_results", lambda *_: None)
+
+    def export_results(results_store):
+        raise PermissionError("data.xlsx is open")
+
+    monkeypatch.setattr(main, "export_results", export_results)
+
+    main.watch_folder(lambda _: 0, UnexportedStore())
+
+    assert folder_watcher.closed
+    out = capsys.readouterr().out
+    assert "Error: Unable to export the results. data.xlsx is open" in out
+
+
+def test_export_results_lists_the_images_once(
+    checks_folder, monkeypatch
+) -> None:
+    (checks_folder / "checks-ocr" / "src" / "confidence").mkdir()
+    (checks_folder / "checks-ocr" / "images").mkdir()
+    (checks_folder / "checks-ocr" / "images" / "id1.jpg").write_bytes(b"")
+    results_store = main.store.ResultsStore("../../results.db", main.COLUMNS)
+    df = pd.DataFrame({"ID": ["id0", "id1", "id2"]})
+    results_store.append(df, df)
+    results_store.set_image_extensions([("id2", ".jpg")])
+
+    main.export_results(results_store)
+
+    # images saved before the store kept their extension
+    assert results_store.get_image_extensions() == {
+        "id0": ".png",
+        "id1": ".jpg",
+        "id2": ".jpg",
+    }
+
+    def get_image_extensions(images_folder):
+        raise AssertionError("the images folder is listed again")
+
+    monkeypatch.setattr(
+        main.handler, "get_image_extensions", get_image_extensions
+    )
+    main.export_results(results_store)
+
+    ws = load_workbook("../../data.xlsx")["data"]
+    id_column = main.COLUMNS.index("ID") + 1
+    assert [
+        ws.cell(row=row, column=id_column).hyperlink.target
+        for row in range(2, 5)
+    ] == [
+        "checks-ocr/images/id0.png",
+        "checks-ocr/images/id1.jpg",
+        "checks-ocr/images/id2.jpg",
+    ]
@@ -0,0 +1,80 @@
+from src.names import NameMatcher, edit_distance, normalize_name
+import pytest
+
+NAMES = [
+    "Juan Carlos Pérez López",
+    "JUAN CARLOS PEREZ LOPEZ",
+    "MARIA JOSE ANDRADE",
+    "MARIA JOSE ANDRADA",
+    "CONSTRUCTORA DEL PACIFICO S.A.",
+    "ANA SALAZAR",
+]
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("  Juan  Pérez-López ", "JUAN PEREZLOPEZ"),
+        ("Ñandú", "NANDU"),
+        ("", ""),
+        (None, ""),
+    ],
+)
+def test_normalize_name(text: str, expected: str) -> None:
+    assert normalize_name(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("a", "b", "expected"),
+    [
+        ("PEREZ", "PEREZ", 0),
+        ("PEREZ", "PERES", 1),
+        ("PEREZ", "PREZ", 1),
+        ("PEREZ", "PERK", 2),
+        ("PEREZ", "PEDRO", 3),
+    ],
+)
+def test_edit_distance(a: str, b: str, expected: int) -> None:
+    assert edit_distance(a, b, max_distance=4) == expected
+
+
+def test_edit_distance_stops_early() -> None:
+    assert edit_distance("PEREZ", "SALAZAR", max_distance=1) == 2
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        # the first way a name is written in the list is returned
+        ("JUAN CARLOS PEREZ LOPEZ", "Juan Carlos Pérez López"),
+        ("juan carlos pérez lópez", "Juan Carlos Pérez López"),
+        ("JUAN CARL0S PEREZ LOPES", "Juan Carlos Pérez López"),
+        ("CONSTRUCTORA DEL PACIFIC0 SA", "CONSTRUCTORA DEL PACIFICO S.A."),
+    ],
+)
+def test_match(text: str, expected: str) -> None:
+    name, score = NameMatcher(NAMES).match(text)
+
+    assert name == expected
+    assert 0.85 <= score <= 1
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "MARIA JOSE ANDRADX",  # as close to ANDRADE as to ANDRADA
+        "PEDRO GOMEZ",  # not a known name
+        "ANA SALAS",  # too many edits for a short name
+        "",
+    ],
+)
+def test_match_ambiguous_or_unknown(text: str) -> None:
+    name, _ = NameMatcher(NAMES).match(text)
+
+    assert name is None
+
+
+def test_from_missing_file(tmp_path) -> None:
+    matcher = NameMatcher.from_file(str(tmp_path / "client_names.txt"))
+
+    assert matcher.match("ANA SALAZAR") == (None, 0.0)
@@ -0,0 +1,172 @@
+from src.store import ResultsStore, to_sql_value
+import numpy as np
+import pandas as pd
+import pytest
+
+COLUMNS = ["FECHA", "CHEQUE", "VALOR", "ID"]
+
+
+def _frames(ids, confidence=99):
+    df = pd.DataFrame(
+        [["2024-02-20", f"12{i}", 125.5, id] for i, id in enumerate(ids)],
+        columns=COLUMNS,
+    )
+    confidence_df = pd.DataFrame(
+        [[confidence, confidence, confidence, id] for id in ids],
+        columns=COLUMNS,
+    )
+    return df, confidence_df
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (np.int64(3), 3),
+        (np.float64(1.5), 1.5),
+        (float("nan"), None),
+        (None, None),
+        (pd.NA, None),
+        ("QUITO", "QUITO"),
+    ],
+)
+def test_to_sql_value(value, expected) -> None:
+    assert to_sql_value(value) == expected
+
+
+def test_results_store_appends_and_reads(tmp_path) -> None:
+    results_store = ResultsStore(str(tmp_path / "results.db"), COLUMNS)
+    results_store.append(*_frames(["id0", "id1"]))
+    results_store.append(*_frames(["id2"], confidence=-1))
+
+    df, confidence_df = results_store.read()
+
+    assert len(results_store) == 3
+    assert results_store.contains("id2")
+    assert not results_store.contains("id3")
+    assert list(df.columns) == COLUMNS
+    assert df["ID"].tolist() == ["id0", "id1", "id2"]
+    assert df["VALOR"].tolist() == [125.5] * 3
+    assert confidence_df["ID"].tolist() == ["id0", "id1", "id2"]
+    assert confidence_df["CHEQUE"].tolist() == [99, 99, -1]
+
+
+def test_results_store_read_aligns_missing_confidences(tmp_path) -> None:
+    results_store = ResultsStore(str(tmp_path / "results.db"), COLUMNS)
+    df, confidence_df = _frames(["a", "b"])
+    results_store.append(df, confidence_df[confidence_df["ID"] == "b"])
+
+    df, confidence_df = results_store.read()
+
+    assert len(confidence_df) == len(df) == 2
+    assert confidence_df["ID"].tolist() == ["a", "b"]
+    assert confidence_df["CHEQUE"].isna().tolist() == [True, False]
+
+
+def test_results_store_import_workbook(tmp_path) -> None:
+    results_store = ResultsStore(str(tmp_path / "results.db"), COLUMNS)
+    data_path = tmp_path / "data.xlsx"
+    results_store.append(*_frames(["id0", "id1"]))
+    data_path.write_bytes(b"workbook")
+    results_store.set_exported(str(data_path))
+
+    data_path.write_bytes(b"edited workbook")
+    results_store.import_workbook(str(data_path), *_frames(["id1"]))
+
+    assert results_store.read()[0]["ID"].tolist() == ["id1"]
+    assert not results_store.contains("id0")
+    assert not results_store.export_changed(str(data_path))
+    assert not results_store.has_unexported_rows()
+
+
+def test_results_store_import_workbook_skips_invalid_ids(
+    tmp_path, capsys
+) -> None:
+    results_store = ResultsStore(str(tmp_path / "results.db"), COLUMNS)
+    data_path = tmp_path / "data.xlsx"
+    data_path.write_bytes(b"workbook")
+    df, confidence_df = _frames(["id0", None, "id1", "id0", " "])
+    df.loc[3, "CHEQUE"] = "999"
+
+    results_store.import_workbook(str(data_path), df, confidence_df)
+
+    df, confidence_df = results_store.read()
+    assert df["ID"].tolist() == ["id0", "id1"]
+    assert df["CHEQUE"].tolist() == ["120", "122"]
+    assert confidence_df["ID"].tolist() == ["id0", "id1"]
+    out = capsys.readouterr().out
+    assert "Error: 2 rows without ID in data.xlsx skipped." in out
+    assert "Warning: Duplicated IDs in data.xlsx" in out
+
+
+def test_results_store_keeps_unexported_rows(tmp_path) -> None:
+    results_store = ResultsStore(str(tmp_path / "results.db"), COLUMNS)
+    data_path = tmp_path / "data.xlsx"
+    results_store.append(*_frames(["id0"]))
+    data_path.write_bytes(b"workbook")
+    results_store.set_exported(str(data_path))
+
+    # written by a run interrupted before the export
+    results_store.append(*_frames(["id1", "id2"]))
+    assert results_store.has_unexported_rows()
+
+    data_path.write_bytes(b"edited workbook")
+    results_store.import_workbook(str(data_path), *_frames(["id0", "id2"]))
+
+    df, confidence_df = results_store.read()
+    assert df["ID"].tolist() == ["id0", "id2", "id1"]
+    assert confidence_df["ID"].tolist() == ["id0", "id2", "id1"]
+    assert results_store.has_unexported_rows()
+
+    results_store.set_exported(str(data_path))
+    assert not results_store.has_unexported_rows()
+
+
+def test_results_store_journal(tmp_path) -> None:
+    db_path = str(tmp_path / "results.db")
+    results_store = ResultsStore(db_path, COLUMNS)
+    results_store.set_stage([("a.pdf", "id0"), ("b.pdf", "id1")], "ocr")
+    results_store.set_stage([("a.pdf", "id0")], "extracted")
+    results_store.append(*_frames(["id1"]), filenames=["b.pdf"])
+    results_store.close()
+
+    # the journal survives an interrupted run
+    results_store = ResultsStore(db_path, COLUMNS)
+    assert results_store.get_journal() == {
+        "a.pdf": ("id0", "extracted"),
+        "b.pdf": ("id1", "written"),
+    }
+
+    results_store.clear_journal()
+    assert results_store.get_journal() == {}
+
+
+def test_results_store_export_changed(tmp_path) -> None:
+    results_store = ResultsStore(str(tmp_path / "results.db"), COLUMNS)
+    data_path = tmp_path / "data.xlsx"
+    assert results_store.export_changed(str(data_path))
+
+    data_path.write_bytes(b"workbook")
+    assert results_store.export_changed(str(data_path))
+    results_store.set_exported(str(data_path))
+    assert not results_store.export_changed(str(data_path))
+
+    # edited by the user
+    data_path.write_bytes(b"edited workbook")
+    assert results_store.export_changed(str(data_path))
+
+    data_path.unlink()
+    assert results_store.export_changed(str(data_path))
+
+
+def test_results_store_image_extensions(tmp_path) -> None:
+    db_path = str(tmp_path / "results.db")
+    results_store = ResultsStore(db_path, COLUMNS)
+    results_store.set_image_extensions([("id0", ".png"), ("id1", ".png")])
+    results_store.set_image_extensions([("id1", ".jpg")])
+    results_store.close()
+
+    results_store = ResultsStore(db_path, COLUMNS)
+    assert results_store.get_image_extensions() == {
+        "id0": ".png",
+        "id1": ".jpg",
+    }
@@ -0,0 +1,215 @@
+from src.textract import (
+    RateLimiter,
+    TextractWrapper,
+    process_images,
+    extract_detail,
+    extract_details,
+)
+from botocore.exceptions import ClientError
+import numpy as np
+import pytest
+import threading
+import time
+
+
+class FakeTextractClient:
+    """Local stand-in for the boto3 Textract client."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    def detect_document_text(self, Document):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        text = Document["Bytes"].decode()
+        return {"Blocks": [{"BlockType": "LINE", "Text": text}]}
+
+
+def _images(n):
+    return [(i, f"check {i}".encode()) for i in range(n)]
+
+
+def test_process_images_keeps_order() -> None:
+    client = FakeTextractClient()
+    wrapper = TextractWrapper(client, None, None)
+    images = _images(10)
+
+    results = list(process_images(wrapper, images, max_workers=4))
+
+    assert [key for key, _ in results] == list(range(10))
+    assert [res["Blocks"][0]["Text"] for _, res in results] == [
+        f"check {i}" for i in range(10)
+    ]
+    assert client.calls == 10
+
+
+def test_process_images_limits_in_flight_requests() -> None:
+    client = FakeTextractClient()
+    wrapper = TextractWrapper(client, None, None)
+    images = _images(12)
+
+    start = time.perf_counter()
+    list(process_images(wrapper, images, max_workers=3))
+    elapsed = time.perf_counter() - start
+
+    assert client.max_in_flight <= 3
+    assert client.max_in_flight > 1
+    # 12 requests of 50ms with 3 workers take ~200ms instead of ~600ms
+    assert elapsed < 12 * client.delay
+
+
+class ThrottledTextractClient:
+    """Fake Textract client that throttles the first requests."""
+
+    def __init__(self, failures, code="ThrottlingException"):
+        self.failures = failures
+        self.code = code
+        self.calls = 0
+
+    def detect_document_text(self, Document):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ClientError(
+                {"Error": {"Code": self.code, "Message": "Rate exceeded"}},
+                "DetectDocumentText",
+            )
+        return {"Blocks": []}
+
+
+def test_rate_limiter_spaces_requests() -> None:
+    limiter = RateLimiter(rate=50, capacity=1)
+
+    start = time.perf_counter()
+    for _ in range(6):
+        limiter.acquire()
+    elapsed = time.perf_counter() - start
+
+    # the first token is available immediately, the next 5 take 20ms each
+    assert elapsed >= 0.08
+
+
+def test_rate_limiter_adapts_to_throttling() -> None:
+    limiter = RateLimiter(rate=10)
+
+    limiter.throttled()
+    assert limiter.rate == 5
+    limiter.throttled()
+    assert limiter.rate == 2.5
+
+    for _ in range(20):
+        limiter.succeeded()
+    assert limiter.rate == 10
+
+
+def test_detect_file_text_retries_throttled_requests() -> None:
+    client = ThrottledTextractClient(failures=2)
+    limiter = RateLimiter(rate=1000)
+    wrapper = TextractWrapper(
+        client, None, None, rate_limiter=limiter, backoff_base=0.001
+    )
+
+    response = wrapper.detect_file_text(document_bytes=b"check")
+
+    assert response == {"Blocks": []}
+    assert client.calls == 3
+    assert limiter.rate < 1000
+
+
+def test_detect_file_text_gives_up_after_max_attempts() -> None:
+    client = ThrottledTextractClient(failures=10)
+    wrapper = TextractWrapper(
+        client, None, None, max_attempts=3, backoff_base=0.001
+    )
+
+    with pytest.raises(ClientError):
+        wrapper.detect_file_text(document_bytes=b"check")
+    assert client.calls == 3
+
+
+def test_detect_file_text_does_not_retry_other_errors() -> None:
+    client = ThrottledTextractClient(failures=1, code="InvalidParameterException")
+    wrapper = TextractWrapper(client, None, None, backoff_base=0.001)
+
+    with pytest.raises(ClientError):
+        wrapper.detect_file_text(document_bytes=b"check")
+    assert client.calls == 1
+
+
+def _dense_blocks(n, seed):
+    # Coordinates on a coarse grid, so that many IoU scores tie
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for i, (w, h, l, t) in enumerate(rng.integers(0, 10, (n, 4)) / 10):
+        blocks.append(
+            {
+                "Text": f"line {i}",
+                "Confidence": float(rng.integers(50, 100)),
+                "Geometry": {
+                    "BoundingBox": {
+                        "Width": w,
+                        "Height": h,
+                        "Left": l,
+                        "Top": t,
+                    }
+                },
+            }
+        )
+    return blocks
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_extract_details_matches_extract_detail(seed: int) -> None:
+    blocks = _dense_blocks(300, seed)
+    fields = {
+        "ACCOUNT_NAME": ((0.3, 0.1, 0.0, 0.1), 2),
+        "AMOUNT": ((0.2, 0.1, 0.7, 0.2), 1),
+        "CLIENT_NAME": ((0.5, 0.1, 0.1, 0.3), 3),
+        "EMPTY": ((0.0, 0.0, 0.0, 0.0), 2),
+    }
+
+    details = extract_details(fields, blocks)
+
+    for name, (box, max_boxes) in fields.items():
+        assert details[name] == extract_detail(box, blocks, max_boxes)
+
+
+def test_extract_details_breaks_ties_like_extract_detail() -> None:
+    # Only b2 overlaps the box, the other blocks tie at 0
+    blocks = [
+        {
+            "Text": f"b{i}",
+            "Confidence": confidence,
+            "Geometry": {
+                "BoundingBox": {
+                    "Width": 0.1,
+                    "Height": 0.1,
+                    "Left": left,
+                    "Top": top,
+                }
+            },
+        }
+        for i, (left, top, confidence) in enumerate(
+            [(0, 0, 90.0), (0.2, 0, 91.0), (0.5, 0.5, 95.0), (0.8, 0, 92.0)]
+        )
+    ]
+    box = (0.1, 0.1, 0.5, 0.5)
+
+    details = extract_details({"ACCOUNT_NAME": (box, 2)}, blocks)
+
+    assert extract_detail(box, blocks, 2) == ("b1 b2", 91.0, 0.0)
+    assert details["ACCOUNT_NAME"] == ("b1 b2", 91.0, 0.0)
+
+
+def test_extract_details_without_blocks() -> None:
+    assert extract_details({"AMOUNT": ((0.2, 0.1, 0.7, 0.2), 1)}, []) == {
+        "AMOUNT": (None, 0.0, 0.0)
+    }
@@ -1,11 +1,20 @@
 from src.utils import (
     calculate_iou,
+    calculate_iou_matrix,
     pdf_to_img,
     contains_number,
     generate_id,
     get_id,
+    img_to_bytes,
+    encode_image,
+    rasterize_pdfs,
+    get_page_count,
+    list_pdf_pages,
+    get_page_name,
 )
 from PIL import Image
+import io
+import numpy as np
 import fitz
 import os
 import pytest
@@ -41,9 +50,24 @@ def test_calculate_iou(
     assert pytest.approx(iou) == expected
 
 
-def _create_sample_pdf(pdf_path: str) -> None:
+def test_calculate_iou_matrix_matches_calculate_iou() -> None:
+    rng = np.random.default_rng(0)
+    boxes1 = rng.random((5, 4)).round(2) / 2
+    boxes2 = np.vstack([rng.random((20, 4)).round(2) / 2, np.zeros((1, 4))])
+
+    ious = calculate_iou_matrix(boxes1, boxes2)
+
+    assert ious.shape == (5, 21)
+    for i, box1 in enumerate(boxes1.tolist()):
+        for j, box2 in enumerate(boxes2.tolist()):
+            assert ious[i, j] == calculate_iou(box1, box2)
+
+
+def _create_sample_pdf(pdf_path: str, pages: int = 1) -> None:
     doc = fitz.open()
-    doc.insert_page(0)
+    for page in range(pages):
+        # pages of different widths, to tell them apart
+        doc.insert_page(page, width=595 + page, height=842)
     doc.save(str(pdf_path))
 
 
@@ -89,6 +113,128 @@ def test_pdf_to_img(
     shutil.rmtree(folder)
 
 
+@pytest.mark.parametrize("format", ["PNG", "JPEG"])
+def test_img_to_bytes(format: str) -> None:
+    img = Image.new("RGB", (40, 20), color="white")
+
+    image_bytes = img_to_bytes(img, format=format)
+
+    decoded = Image.open(io.BytesIO(image_bytes))
+    assert decoded.format == format
+    assert decoded.size == (40, 20)
+
+
+def _noisy_image(width: int, height: int) -> Image.Image:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+def test_encode_image_keeps_png_under_budget() -> None:
+    img = Image.new("RGB", (600, 300), color="white")
+
+    image_bytes, extension = encode_image(img, max_bytes=1000000)
+
+    assert extension == ".png"
+    assert Image.open(io.BytesIO(image_bytes)).mode == "L"
+
+
+@pytest.mark.parametrize("max_bytes", [400000, 100000])
+def test_encode_image_stays_under_budget(max_bytes: int) -> None:
+    img = _noisy_image(1200, 600)
+
+    image_bytes, extension = encode_image(img, max_bytes=max_bytes)
+
+    assert extension == ".jpg"
+    assert len(image_bytes) <= max_bytes
+    assert Image.open(io.BytesIO(image_bytes)).format == "JPEG"
+
+
+def test_encode_image_respects_min_resolution() -> None:
+    img = _noisy_image(1200, 600)
+
+    image_bytes, _ = encode_image(
+        img, resolution=300, max_bytes=1, min_resolution=300
+    )
+
+    # nothing fits, the smallest full resolution encoding is returned
+    assert Image.open(io.BytesIO(image_bytes)).size == (1200, 600)
+
+
+def test_encode_image_returns_the_smallest_encoding() -> None:
+    # a blank page is smaller as a PNG than as a JPEG
+    img = Image.new("RGB", (1200, 600), color="white")
+    png_size = len(encode_image(img)[0])
+
+    image_bytes, extension = encode_image(
+        img, resolution=300, max_bytes=1, min_resolution=300
+    )
+
+    assert extension == ".png"
+    assert len(image_bytes) == png_size
+
+
+def test_rasterize_pdfs(tmp_path) -> None:
+    _create_sample_pdf(tmp_path / "single.pdf")
+    _create_sample_pdf(tmp_path / "stack.pdf", pages=3)
+    pages = [("single.pdf", 0), ("stack.pdf", 0), ("stack.pdf", 1)]
+    pages.append(("stack.pdf", 2))
+
+    results = list(
+        rasterize_pdfs(pages, str(tmp_path), max_workers=2, resolution=72)
+    )
+
+    assert [item for item, _ in results] == pages
+    widths = [595, 595, 596, 597]
+    for (_, (image_bytes, extension)), width in zip(results, widths):
+        assert extension == ".png"
+        assert Image.open(io.BytesIO(image_bytes)).size == (width, 842)
+
+
+def test_rasterize_pdfs_skips_broken_pages(tmp_path, capsys) -> None:
+    _create_sample_pdf(tmp_path / "stack.pdf", pages=2)
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    pages = [("broken.pdf", 0), ("stack.pdf", 0), ("stack.pdf", 5)]
+    pages.append(("stack.pdf", 1))
+
+    results = list(
+        rasterize_pdfs(pages, str(tmp_path), max_workers=2, resolution=72)
+    )
+
+    assert [item for item, _ in results] == pages
+    assert [encoded is None for _, encoded in results] == [
+        True,
+        False,
+        True,
+        False,
+    ]
+    out = capsys.readouterr().out
+    assert "Error: Unable to rasterize 'broken.pdf'." in out
+    assert "Error: Unable to rasterize 'stack.pdf#6'." in out
+
+
+def test_list_pdf_pages(tmp_path, capsys) -> None:
+    _create_sample_pdf(tmp_path / "single.pdf")
+    _create_sample_pdf(tmp_path / "stack.pdf", pages=3)
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+
+    assert get_page_count("stack.pdf", str(tmp_path)) == 3
+    assert list_pdf_pages(
+        ["single.pdf", "broken.pdf", "stack.pdf"], str(tmp_path)
+    ) == [
+        ("single.pdf", 0),
+        ("stack.pdf", 0),
+        ("stack.pdf", 1),
+        ("stack.pdf", 2),
+    ]
+    assert "Error: Unable to open 'broken.pdf'." in capsys.readouterr().out
+
+
+def test_get_page_name() -> None:
+    assert get_page_name("scan.pdf", 0) == "scan.pdf"
+    assert get_page_name("scan.pdf", 1) == "scan.pdf#2"
+
+
 @pytest.mark.parametrize(
     ("s", "expected"),
     [
@@ -0,0 +1,57 @@
+from src.watcher import FolderWatcher
+
+
+def test_folder_watcher_waits_for_files_to_settle(tmp_path) -> None:
+    folder_watcher = FolderWatcher(
+        str(tmp_path), settle_time=60, force_polling=True
+    )
+    (tmp_path / "check.pdf").write_bytes(b"%PDF")
+
+    assert folder_watcher.backend == "polling"
+    assert folder_watcher.wait(timeout=0) == []
+
+
+def test_folder_watcher_returns_each_file_once(tmp_path) -> None:
+    folder_watcher = FolderWatcher(
+        str(tmp_path), settle_time=0, poll_interval=0.01, force_polling=True
+    )
+    (tmp_path / "b.pdf").write_bytes(b"%PDF")
+    (tmp_path / "a.PDF").write_bytes(b"%PDF")
+    (tmp_path / "notes.txt").write_bytes(b"notes")
+
+    assert folder_watcher.wait(timeout=1) == ["a.PDF", "b.pdf"]
+    assert folder_watcher.wait(timeout=0.05) == []
+
+    # replaced by a new scan
+    (tmp_path / "b.pdf").write_bytes(b"%PDF-1.7")
+    assert folder_watcher.wait(timeout=1) == ["b.pdf"]
+
+    # moved out and back
+    (tmp_path / "a.PDF").unlink()
+    assert folder_watcher.wait(timeout=0.05) == []
+    (tmp_path / "a.PDF").write_bytes(b"%PDF")
+    assert folder_watcher.wait(timeout=1) == ["a.PDF"]
+
+
+def test_folder_watcher_forget(tmp_path) -> None:
+    folder_watcher = FolderWatcher(
+        str(tmp_path), settle_time=0, poll_interval=0.01, force_polling=True
+    )
+    (tmp_path / "a.pdf").write_bytes(b"%PDF")
+
+    assert folder_watcher.wait(timeout=1) == ["a.pdf"]
+    assert folder_watcher.wait(timeout=0.05) == []
+
+    # returned again while unchanged
+    folder_watcher.forget(["a.pdf"])
+    assert folder_watcher.wait(timeout=1) == ["a.pdf"]
+
+
+def test_folder_watcher_notifications(tmp_path) -> None:
+    folder_watcher = FolderWatcher(
+        str(tmp_path), settle_time=0, poll_interval=0.5
+    )
+    (tmp_path / "check.pdf").write_bytes(b"%PDF")
+
+    assert folder_watcher.wait(timeout=5) == ["check.pdf"]
+    folder_watcher.close()